@@ -2,7 +2,8 @@ import streamlit as st
 from datetime import datetime
 from ui.setting import display_settings
 from utils.auth import login_user, register_user, generate_credentials, check_credentials
-from utils.user import get_user, list_repositories, list_histories, update_study_stats
+from utils.monitor import begin_rerun, end_rerun
+from utils.user import flush_study_stats, get_user, list_repositories, list_histories, update_study_stats
 from ui.repo import display_document_repositories
 from ui.bot import display_chats
 from ui.stat import display_statistics
@@ -28,6 +29,8 @@ if "show_register" not in st.session_state:
 if "registration_method" not in st.session_state:
     st.session_state.registration_method = "manual"
 
+begin_rerun(st.session_state.current_page if st.session_state.logged_in else "landing")
+
 def set_page(page_name):
     st.session_state.current_page = page_name
 
@@ -40,6 +43,8 @@ def toggle_register_form():
     st.session_state.show_login = False
 
 def logout():
+    if st.session_state.user:
+        flush_study_stats(st.session_state.user.user_id)
     st.session_state.logged_in = False
     st.session_state.user = None
     st.rerun()
@@ -250,7 +255,7 @@ def display_user_dashboard():
             for i, repo in enumerate(user_repo[:3]):
                 with st.container():
                     name = repo["name"] if repo["name"] else f"Repository #{i+1}"
-                    doc_count = len(repo["documents"]) if repo["documents"] else 0
+                    doc_count = repo["document_count"] or 0
                     st.write(f"**{name}** — {doc_count} document(s)")
         else:
             st.info("You haven't created any repositories yet.")
@@ -291,3 +296,4 @@ def display_user_dashboard():
         st.info("🚧 This feature will be implemented soon. Stay tuned!")
 
 main_content()
+end_rerun()
@@ -69,13 +69,14 @@ class DocumentRepository(BaseModel):
     categories: List[str] = Field(default_factory=list)
     documents: List[str] = Field(default_factory=list)
     banner: Optional[str] = None
-    accesses: List[Access] = Field(default_factory=list)
-    likes: List[Access] = Field(default_factory=list)
-    dislikes: List[Access] = Field(default_factory=list)
-    bookmarks: List[Access] = Field(default_factory=list)
-    shares: List[Access] = Field(default_factory=list)
     number_of_indexed: int = 0 
     related_repositories: List[str] = Field(default_factory=list)
+    access_count: int = 0
+    like_count: int = 0
+    dislike_count: int = 0
+    bookmark_count: int = 0
+    share_count: int = 0
+    engagement: Dict[str, Dict[str, str]] = Field(default_factory=dict)
     
     def get_created_at(self) -> datetime:
         return datetime.fromisoformat(self.created_at)
@@ -86,34 +87,58 @@ class DocumentRepository(BaseModel):
     def last_accessed(self, user_id: str, access_type: str) -> Optional[datetime]:
         if access_type not in ['accesses', 'likes', 'dislikes', 'bookmarks', 'shares']:
             return False
-        if access_type == 'accesses':
-            return max((access.get_access_time() for access in self.accesses if access.access_id == user_id), default=None)
-        elif access_type == 'likes':
-            for access in self.likes:
-                if access.access_id == user_id:
-                    return access.get_access_time()
-        elif access_type == 'dislikes':
-            for access in self.dislikes:
-                if access.access_id == user_id:
-                    return access.get_access_time()
-        elif access_type == 'bookmarks':
-            for access in self.bookmarks:
-                if access.access_id == user_id:
-                    return access.get_access_time()
-        elif access_type == 'shares':
-            return max((access.get_access_time() for access in self.shares if access.access_id == user_id), default=None)
-        return None
+        last_at = self.engagement.get(user_id, {}).get(access_type)
+        return datetime.fromisoformat(last_at) if last_at else None
     
     def get_document_stats(self) -> Dict[str, Any]:
         return {
             "document_count": len(self.documents),
-            "access_count": len(self.accesses),
-            "pertinence_count": len(self.likes) - len(self.dislikes),
+            "access_count": self.access_count,
+            "pertinence_count": self.like_count - self.dislike_count,
             "indexed_count": self.number_of_indexed,
-            "shared_count": len(self.shares),
-            "saved_count": len(self.bookmarks)
+            "shared_count": self.share_count,
+            "saved_count": self.bookmark_count
         }
 
+class RepositorySummary(BaseModel):
+    repo_id: str
+    name: str
+    description: str = ""
+    is_public: bool = Field(default=False)
+    owner_id: str
+    created_at: str
+    updated_at: str
+    categories: List[str] = Field(default_factory=list)
+    banner: Optional[str] = None
+    number_of_indexed: int = 0
+    document_count: int = 0
+    access_count: int = 0
+    like_count: int = 0
+    dislike_count: int = 0
+    bookmark_count: int = 0
+    share_count: int = 0
+    
+    def get_created_at(self) -> datetime:
+        return datetime.fromisoformat(self.created_at)
+    
+    def get_updated_at(self) -> datetime:
+        return datetime.fromisoformat(self.updated_at)
+    
+    def get_document_stats(self) -> Dict[str, Any]:
+        return {
+            "document_count": self.document_count,
+            "access_count": self.access_count,
+            "pertinence_count": self.like_count - self.dislike_count,
+            "indexed_count": self.number_of_indexed,
+            "shared_count": self.share_count,
+            "saved_count": self.bookmark_count
+        }
+
+class RepositoryPage(BaseModel):
+    items: List[RepositorySummary] = Field(default_factory=list)
+    next_cursor: Optional[Dict[str, Any]] = None
+    total_estimate: int = 0
+
 class ChatHistory(BaseModel):
     chat_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     owner_id: str
@@ -125,6 +150,8 @@ class ChatHistory(BaseModel):
     type: str
     is_deleted: bool = Field(default=False)
     mode: bool = Field(default=False)
+    summary: str = ""
+    summary_until: Optional[str] = None
     
     def get_created_at(self) -> datetime:
         return datetime.fromisoformat(self.created_at)
@@ -160,6 +187,13 @@ class Badge(BaseModel):
     badge_type: str
     condition: Callable
 
+class UserProfileLite(BaseModel):
+    user_id: str
+    username: str
+    profile_picture: Optional[str] = None
+    experience_points: int = 0
+    is_deleted: bool = Field(default=False)
+
 class User(BaseModel):
     user_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     username: str
@@ -168,11 +202,6 @@ class User(BaseModel):
     last_login: Optional[str] = None
     learning_preferences: LearningPreference = Field(default_factory=LearningPreference)
     repositories: List[str] = Field(default_factory=list)
-    document_accessed: List[Access] = Field(default_factory=list)
-    liked_documents: List[Access] = Field(default_factory=list)
-    disliked_documents: List[Access] = Field(default_factory=list)
-    bookmarked_documents: List[Access] = Field(default_factory=list)
-    shared_documents: List[Access] = Field(default_factory=list)
     chat_histories: List[str] = Field(default_factory=list)
     experience_points: int = 0
     badges: List[str] = Field(default_factory=list)
@@ -0,0 +1,27 @@
+-- Lightweight read model for repository cards and lists.
+-- Exposes every column of document_repositories except the engagement arrays,
+-- plus their precomputed lengths, so list views never ship the arrays.
+
+create or replace view repository_summaries
+with (security_invoker = true) as
+select
+    repo_id,
+    name,
+    description,
+    is_public,
+    is_deleted,
+    owner_id,
+    created_at,
+    updated_at,
+    categories,
+    documents,
+    banner,
+    number_of_indexed,
+    related_repositories,
+    coalesce(jsonb_array_length(documents), 0) as document_count,
+    coalesce(jsonb_array_length(accesses), 0) as access_count,
+    coalesce(jsonb_array_length(likes), 0) as like_count,
+    coalesce(jsonb_array_length(dislikes), 0) as dislike_count,
+    coalesce(jsonb_array_length(bookmarks), 0) as bookmark_count,
+    coalesce(jsonb_array_length(shares), 0) as share_count
+from document_repositories;
@@ -0,0 +1,194 @@
+-- Append-only engagement store replacing the accesses/likes/dislikes/bookmarks/shares
+-- JSON arrays on document_repositories and users.
+--   engagement_events   one row per view, like, dislike, bookmark or share
+--   engagement_state    current state per (repo, user, type), the "has this user liked X" index
+--   repository_counters per-repository totals maintained incrementally
+--   user_counters       per-user totals maintained incrementally
+
+create table if not exists engagement_events (
+    event_id bigint generated always as identity primary key,
+    repo_id text not null,
+    user_id text not null,
+    access_type text not null check (access_type in ('accesses', 'likes', 'dislikes', 'bookmarks', 'shares')),
+    created_at timestamptz not null default now()
+);
+create index if not exists engagement_events_repo_idx on engagement_events (repo_id, created_at desc);
+create index if not exists engagement_events_user_idx on engagement_events (user_id, created_at desc);
+
+create table if not exists engagement_state (
+    repo_id text not null,
+    user_id text not null,
+    access_type text not null,
+    active boolean not null default true,
+    event_count integer not null default 0,
+    last_at timestamptz not null default now(),
+    primary key (repo_id, user_id, access_type)
+);
+create index if not exists engagement_state_user_idx on engagement_state (user_id, access_type) where active;
+
+create table if not exists repository_counters (
+    repo_id text primary key,
+    access_count bigint not null default 0,
+    like_count bigint not null default 0,
+    dislike_count bigint not null default 0,
+    bookmark_count bigint not null default 0,
+    share_count bigint not null default 0
+);
+
+create table if not exists user_counters (
+    user_id text primary key,
+    access_count bigint not null default 0,
+    like_count bigint not null default 0,
+    dislike_count bigint not null default 0,
+    bookmark_count bigint not null default 0,
+    share_count bigint not null default 0
+);
+
+create or replace function bump_engagement_counters(p_repo_id text, p_user_id text, p_access_type text, p_delta integer)
+returns void
+language plpgsql as $$
+begin
+    insert into repository_counters (repo_id) values (p_repo_id) on conflict do nothing;
+    insert into user_counters (user_id) values (p_user_id) on conflict do nothing;
+    update repository_counters set
+        access_count = access_count + case when p_access_type = 'accesses' then p_delta else 0 end,
+        like_count = like_count + case when p_access_type = 'likes' then p_delta else 0 end,
+        dislike_count = dislike_count + case when p_access_type = 'dislikes' then p_delta else 0 end,
+        bookmark_count = bookmark_count + case when p_access_type = 'bookmarks' then p_delta else 0 end,
+        share_count = share_count + case when p_access_type = 'shares' then p_delta else 0 end
+    where repo_id = p_repo_id;
+    update user_counters set
+        access_count = access_count + case when p_access_type = 'accesses' then p_delta else 0 end,
+        like_count = like_count + case when p_access_type = 'likes' then p_delta else 0 end,
+        dislike_count = dislike_count + case when p_access_type = 'dislikes' then p_delta else 0 end,
+        bookmark_count = bookmark_count + case when p_access_type = 'bookmarks' then p_delta else 0 end,
+        share_count = share_count + case when p_access_type = 'shares' then p_delta else 0 end
+    where user_id = p_user_id;
+end;
+$$;
+
+-- Records one engagement event and returns the caller's resulting state for the
+-- repository as {access_type: last_at} over active rows, or null when refused.
+create or replace function record_engagement(p_repo_id text, p_user_id text, p_access_type text)
+returns jsonb
+language plpgsql as $$
+declare
+    v_owner text;
+    v_active boolean;
+    v_opposite text;
+begin
+    if p_access_type not in ('accesses', 'likes', 'dislikes', 'bookmarks', 'shares') then
+        return null;
+    end if;
+    select owner_id into v_owner from document_repositories where repo_id = p_repo_id;
+    if v_owner is null or v_owner = p_user_id then
+        return null;
+    end if;
+    insert into engagement_events (repo_id, user_id, access_type) values (p_repo_id, p_user_id, p_access_type);
+    if p_access_type in ('accesses', 'shares') then
+        insert into engagement_state (repo_id, user_id, access_type, active, event_count, last_at)
+        values (p_repo_id, p_user_id, p_access_type, true, 1, now())
+        on conflict (repo_id, user_id, access_type) do update
+            set active = true, event_count = engagement_state.event_count + 1, last_at = now();
+        perform bump_engagement_counters(p_repo_id, p_user_id, p_access_type, 1);
+    else
+        insert into engagement_state (repo_id, user_id, access_type, active, event_count, last_at)
+        values (p_repo_id, p_user_id, p_access_type, true, 1, now())
+        on conflict (repo_id, user_id, access_type) do update
+            set active = not engagement_state.active, event_count = engagement_state.event_count + 1, last_at = now()
+        returning active into v_active;
+        perform bump_engagement_counters(p_repo_id, p_user_id, p_access_type, case when v_active then 1 else -1 end);
+        v_opposite := case p_access_type when 'likes' then 'dislikes' when 'dislikes' then 'likes' end;
+        if v_active and v_opposite is not null then
+            update engagement_state set active = false
+            where repo_id = p_repo_id and user_id = p_user_id and access_type = v_opposite and active;
+            if found then
+                perform bump_engagement_counters(p_repo_id, p_user_id, v_opposite, -1);
+            end if;
+        end if;
+    end if;
+    return coalesce((
+        select jsonb_object_agg(access_type, last_at)
+        from engagement_state
+        where repo_id = p_repo_id and user_id = p_user_id and active
+    ), '{}'::jsonb);
+end;
+$$;
+
+-- The app no longer writes the legacy arrays; new rows get empty ones.
+alter table document_repositories
+    alter column accesses set default '[]'::jsonb,
+    alter column likes set default '[]'::jsonb,
+    alter column dislikes set default '[]'::jsonb,
+    alter column bookmarks set default '[]'::jsonb,
+    alter column shares set default '[]'::jsonb;
+alter table users
+    alter column document_accessed set default '[]'::jsonb,
+    alter column liked_documents set default '[]'::jsonb,
+    alter column disliked_documents set default '[]'::jsonb,
+    alter column bookmarked_documents set default '[]'::jsonb,
+    alter column shared_documents set default '[]'::jsonb;
+
+-- Backfill from the legacy arrays.
+insert into engagement_events (repo_id, user_id, access_type, created_at)
+select r.repo_id, e.value->>'access_id', t.access_type, (e.value->>'access_time')::timestamptz
+from document_repositories r
+cross join lateral (values
+    ('accesses', r.accesses), ('likes', r.likes), ('dislikes', r.dislikes),
+    ('bookmarks', r.bookmarks), ('shares', r.shares)
+) as t(access_type, items)
+cross join lateral jsonb_array_elements(coalesce(t.items, '[]'::jsonb)) as e(value)
+where not exists (select 1 from engagement_events);
+
+insert into engagement_state (repo_id, user_id, access_type, active, event_count, last_at)
+select repo_id, user_id, access_type, true, count(*), max(created_at)
+from engagement_events
+group by repo_id, user_id, access_type
+on conflict do nothing;
+
+insert into repository_counters (repo_id, access_count, like_count, dislike_count, bookmark_count, share_count)
+select repo_id,
+    count(*) filter (where access_type = 'accesses'),
+    count(distinct user_id) filter (where access_type = 'likes'),
+    count(distinct user_id) filter (where access_type = 'dislikes'),
+    count(distinct user_id) filter (where access_type = 'bookmarks'),
+    count(*) filter (where access_type = 'shares')
+from engagement_events
+group by repo_id
+on conflict do nothing;
+
+insert into user_counters (user_id, access_count, like_count, dislike_count, bookmark_count, share_count)
+select user_id,
+    count(*) filter (where access_type = 'accesses'),
+    count(distinct repo_id) filter (where access_type = 'likes'),
+    count(distinct repo_id) filter (where access_type = 'dislikes'),
+    count(distinct repo_id) filter (where access_type = 'bookmarks'),
+    count(*) filter (where access_type = 'shares')
+from engagement_events
+group by user_id
+on conflict do nothing;
+
+create or replace view repository_summaries
+with (security_invoker = true) as
+select
+    r.repo_id,
+    r.name,
+    r.description,
+    r.is_public,
+    r.is_deleted,
+    r.owner_id,
+    r.created_at,
+    r.updated_at,
+    r.categories,
+    r.documents,
+    r.banner,
+    r.number_of_indexed,
+    r.related_repositories,
+    coalesce(jsonb_array_length(r.documents), 0) as document_count,
+    coalesce(c.access_count, 0) as access_count,
+    coalesce(c.like_count, 0) as like_count,
+    coalesce(c.dislike_count, 0) as dislike_count,
+    coalesce(c.bookmark_count, 0) as bookmark_count,
+    coalesce(c.share_count, 0) as share_count
+from document_repositories r
+left join repository_counters c on c.repo_id = r.repo_id;
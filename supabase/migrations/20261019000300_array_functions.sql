@@ -0,0 +1,78 @@
+-- Atomic server-side append/remove on the JSON id arrays, replacing the
+-- "select the array, append in Python, write the whole array back" pattern.
+-- Only the (table, column) pairs listed in array_column_allowed can be touched.
+-- p_set optionally updates other columns of the same row in the same statement.
+-- The key is cast to the key column's type so the primary key index is used.
+
+create or replace function array_column_allowed(p_table text, p_column text)
+returns boolean
+language sql immutable as $$
+    select (p_table, p_column) in (
+        ('users', 'repositories'),
+        ('users', 'chat_histories'),
+        ('document_repositories', 'documents'),
+        ('chat_histories', 'messages')
+    );
+$$;
+
+create or replace function array_set_clause(p_set jsonb)
+returns text
+language sql immutable as $$
+    select coalesce(
+        (select string_agg(format(', %I = (jsonb_populate_record(t, $4)).%I', k, k), '')
+         from jsonb_object_keys(coalesce(p_set, '{}'::jsonb)) as k),
+        ''
+    );
+$$;
+
+create or replace function array_key_type(p_table text, p_key_column text)
+returns text
+language sql stable as $$
+    select format_type(a.atttypid, a.atttypmod)
+    from pg_attribute a
+    where a.attrelid = p_table::regclass and a.attname = p_key_column and a.attnum > 0 and not a.attisdropped;
+$$;
+
+create or replace function array_append_item(
+    p_table text, p_key_column text, p_key text, p_column text, p_item jsonb,
+    p_unique boolean default true, p_set jsonb default null
+)
+returns boolean
+language plpgsql as $$
+declare
+    v_count integer;
+begin
+    if not array_column_allowed(p_table, p_column) then
+        raise exception 'array_append_item: %.% is not an array column', p_table, p_column;
+    end if;
+    execute format(
+        'update %I as t set %I = case when $2 and coalesce(t.%I, ''[]''::jsonb) @> jsonb_build_array($1) '
+        'then t.%I else coalesce(t.%I, ''[]''::jsonb) || jsonb_build_array($1) end%s where t.%I = $3::%s',
+        p_table, p_column, p_column, p_column, p_column, array_set_clause(p_set), p_key_column, array_key_type(p_table, p_key_column)
+    ) using p_item, p_unique, p_key, p_set;
+    get diagnostics v_count = row_count;
+    return v_count > 0;
+end;
+$$;
+
+create or replace function array_remove_item(
+    p_table text, p_key_column text, p_key text, p_column text, p_item jsonb,
+    p_set jsonb default null
+)
+returns boolean
+language plpgsql as $$
+declare
+    v_count integer;
+begin
+    if not array_column_allowed(p_table, p_column) then
+        raise exception 'array_remove_item: %.% is not an array column', p_table, p_column;
+    end if;
+    execute format(
+        'update %I as t set %I = coalesce((select jsonb_agg(e) from jsonb_array_elements(t.%I) as e where e <> $1), ''[]''::jsonb)%s '
+        'where t.%I = $3::%s',
+        p_table, p_column, p_column, array_set_clause(p_set), p_key_column, array_key_type(p_table, p_key_column)
+    ) using p_item, null::boolean, p_key, p_set;
+    get diagnostics v_count = row_count;
+    return v_count > 0;
+end;
+$$;
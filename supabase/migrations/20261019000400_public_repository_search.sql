@@ -0,0 +1,96 @@
+-- Indexed catalogue of public repositories.
+-- Full-text vector over name, description and categories plus a trigram index
+-- on name for fuzzy matches, searched through a keyset-paginated function.
+
+create extension if not exists pg_trgm;
+
+alter table document_repositories
+    add column if not exists search_vector tsvector
+    generated always as (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B') ||
+        setweight(jsonb_to_tsvector('simple', coalesce(categories, '[]'::jsonb), '["string"]'), 'C')
+    ) stored;
+
+create index if not exists document_repositories_search_idx
+    on document_repositories using gin (search_vector)
+    where is_public and not is_deleted;
+
+create index if not exists document_repositories_name_trgm_idx
+    on document_repositories using gin (name gin_trgm_ops)
+    where is_public and not is_deleted;
+
+create index if not exists document_repositories_public_browse_idx
+    on document_repositories (created_at desc, repo_id desc)
+    where is_public and not is_deleted;
+
+-- p_cursor is the {"key", "repo_id"} pair of the last row of the previous page:
+-- the relevance rank when searching, created_at when browsing.
+create or replace function search_public_repositories(
+    p_user_id text,
+    p_query text default null,
+    p_cursor jsonb default null,
+    p_limit integer default 20,
+    p_count_cap integer default 1000
+) returns jsonb
+language plpgsql stable
+set search_path = public
+as $$
+declare
+    v_query text := nullif(btrim(coalesce(p_query, '')), '');
+    v_tsquery tsquery;
+    v_items jsonb;
+    v_total integer;
+begin
+    if v_query is null then
+        select coalesce(jsonb_agg(to_jsonb(page) - 'documents' - 'related_repositories' order by page.created_at desc, page.repo_id desc), '[]'::jsonb)
+        into v_items
+        from (
+            select s.*
+            from repository_summaries s
+            where s.is_public and not s.is_deleted and s.owner_id <> p_user_id
+              and (p_cursor is null
+                   or (s.created_at, s.repo_id) < ((p_cursor->>'key')::timestamptz, p_cursor->>'repo_id'))
+            order by s.created_at desc, s.repo_id desc
+            limit p_limit
+        ) page;
+
+        select count(*) into v_total
+        from (
+            select 1 from document_repositories r
+            where r.is_public and not r.is_deleted and r.owner_id <> p_user_id
+            limit p_count_cap
+        ) capped;
+    else
+        v_tsquery := websearch_to_tsquery('simple', v_query);
+
+        with matches as (
+            select s.*,
+                   (ts_rank_cd(r.search_vector, v_tsquery) + similarity(r.name, v_query))::float8 as rank
+            from document_repositories r
+            join repository_summaries s on s.repo_id = r.repo_id
+            where r.is_public and not r.is_deleted and r.owner_id <> p_user_id
+              and (r.search_vector @@ v_tsquery or r.name % v_query)
+        )
+        select coalesce(jsonb_agg(to_jsonb(page) - 'documents' - 'related_repositories' order by page.rank desc, page.repo_id desc), '[]'::jsonb)
+        into v_items
+        from (
+            select * from matches m
+            where p_cursor is null
+               or (m.rank, m.repo_id) < ((p_cursor->>'key')::float8, p_cursor->>'repo_id')
+            order by m.rank desc, m.repo_id desc
+            limit p_limit
+        ) page;
+
+        select count(*) into v_total
+        from (
+            select 1 from document_repositories r
+            where r.is_public and not r.is_deleted and r.owner_id <> p_user_id
+              and (r.search_vector @@ v_tsquery or r.name % v_query)
+            limit p_count_cap
+        ) capped;
+    end if;
+
+    return jsonb_build_object('items', v_items, 'total_estimate', v_total);
+end;
+$$;
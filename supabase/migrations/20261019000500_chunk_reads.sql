@@ -0,0 +1,3 @@
+-- Supports the keyset-paginated, per-document chunk reads in utils/chunks.py.
+
+create index if not exists chunks_document_chunk_idx on chunks (document_id, chunk_id);
@@ -0,0 +1,6 @@
+-- Optional packed embedding column: "<f16|f32>:<base64 little-endian floats>".
+-- Rows written in packed mode leave the JSON embedding null; existing rows are
+-- rewritten with: python -m utils.chunks --format f16
+
+alter table chunks add column if not exists embedding_packed text;
+alter table chunks alter column embedding drop not null;
@@ -0,0 +1,109 @@
+-- Server-side top-k retrieval over the chunks of a set of documents, so the app
+-- no longer has to load a whole repository to search it (see RemoteIndex in
+-- utils/index.py, enabled with [index] retrieval = "server").
+-- embedding_vector is kept in sync from the JSON or packed embedding by trigger.
+-- Scoring is an exact scan of the selected documents' chunks through
+-- chunks_document_chunk_idx: an ANN index would post-filter across every
+-- repository and lose recall for small repositories.
+-- Matches carry ids, text, page and inner-product score only; embeddings stay
+-- in the database. utils/chunks.py registers the same function for the
+-- embedded SQLite backend.
+
+create extension if not exists vector with schema extensions;
+
+alter table chunks add column if not exists embedding_vector extensions.vector(384);
+
+create or replace function unpack_embedding(p_packed text)
+returns extensions.vector
+language plpgsql immutable
+set search_path = public, extensions
+as $$
+declare
+    v_format text := split_part(p_packed, ':', 1);
+    v_bytes bytea := decode(split_part(p_packed, ':', 2), 'base64');
+    v_width integer := case v_format when 'f16' then 2 when 'f32' then 4 end;
+    v_exp_bits integer := case v_format when 'f16' then 5 else 8 end;
+    v_mant_bits integer := case v_format when 'f16' then 10 else 23 end;
+    v_bias integer := case v_format when 'f16' then 15 else 127 end;
+    v_values float4[] := '{}';
+    v_bits bigint;
+    v_exp integer;
+    v_mant bigint;
+    v_value float8;
+begin
+    if v_width is null then
+        raise exception 'unpack_embedding: unknown format %', v_format;
+    end if;
+    for i in 0 .. length(v_bytes) / v_width - 1 loop
+        v_bits := 0;
+        for b in reverse v_width - 1 .. 0 loop
+            v_bits := v_bits * 256 + get_byte(v_bytes, i * v_width + b);
+        end loop;
+        v_exp := ((v_bits >> v_mant_bits) & ((1 << v_exp_bits) - 1))::integer;
+        v_mant := v_bits & ((1::bigint << v_mant_bits) - 1);
+        if v_exp = 0 then
+            v_value := v_mant * power(2::float8, 1 - v_bias - v_mant_bits);
+        else
+            v_value := (1 + v_mant * power(2::float8, -v_mant_bits)) * power(2::float8, v_exp - v_bias);
+        end if;
+        if (v_bits >> (v_exp_bits + v_mant_bits)) & 1 = 1 then
+            v_value := -v_value;
+        end if;
+        v_values := v_values || v_value::float4;
+    end loop;
+    return v_values::vector;
+end;
+$$;
+
+create or replace function chunks_set_embedding_vector()
+returns trigger
+language plpgsql
+set search_path = public, extensions
+as $$
+begin
+    if new.embedding is not null then
+        new.embedding_vector := (to_jsonb(new.embedding)::text)::vector;
+    elsif new.embedding_packed is not null then
+        new.embedding_vector := unpack_embedding(new.embedding_packed);
+    end if;
+    return new;
+end;
+$$;
+
+drop trigger if exists chunks_embedding_vector on chunks;
+create trigger chunks_embedding_vector
+    before insert or update of embedding, embedding_packed on chunks
+    for each row execute function chunks_set_embedding_vector();
+
+update chunks set embedding = embedding where embedding_vector is null and embedding is not null;
+update chunks set embedding_packed = embedding_packed where embedding_vector is null and embedding_packed is not null;
+
+create or replace function match_chunks(
+    p_document_ids jsonb,
+    p_query_embedding jsonb,
+    p_match_count integer default 20,
+    p_page integer default null
+) returns jsonb
+language sql stable
+set search_path = public, extensions
+as $$
+    select coalesce(jsonb_agg(m.item order by m.distance), '[]'::jsonb)
+    from (
+        select
+            jsonb_build_object(
+                'chunk_id', c.chunk_id,
+                'document_id', c.document_id,
+                'page', c.page,
+                'position', c.position,
+                'text', c.text,
+                'score', -(c.embedding_vector <#> q.v)
+            ) as item,
+            c.embedding_vector <#> q.v as distance
+        from chunks c, (select (p_query_embedding::text)::vector as v) q
+        where c.document_id in (select jsonb_array_elements_text(p_document_ids))
+          and c.embedding_vector is not null
+          and (p_page is null or c.page = p_page)
+        order by c.embedding_vector <#> q.v
+        limit p_match_count
+    ) m;
+$$;
@@ -0,0 +1,5 @@
+-- Rolling summary of older turns, folded in incrementally by utils/llm.py.
+-- summary_until is the id of the last message included in the summary.
+
+alter table chat_histories add column if not exists summary text not null default '';
+alter table chat_histories add column if not exists summary_until text;
@@ -0,0 +1,25 @@
+-- Pre-generated, validated multiple-choice questions per repository and scope
+-- ("all" or "pages:<first>-<last>"), filled in the background by utils/questions.py,
+-- and the questions each user has already been served. The stem embedding lets quizzes
+-- on a topic pick matching questions.
+
+create table if not exists question_bank (
+    question_id text primary key,
+    repo_id text not null,
+    scope text not null default 'all',
+    fingerprint text not null,
+    question jsonb not null,
+    embedding jsonb,
+    created_at timestamptz not null default now(),
+    unique (repo_id, scope, fingerprint)
+);
+create index if not exists question_bank_scope_idx on question_bank (repo_id, scope, created_at);
+
+create table if not exists seen_questions (
+    user_id text not null,
+    question_id text not null references question_bank (question_id) on delete cascade,
+    repo_id text not null,
+    seen_at timestamptz not null default now(),
+    primary key (user_id, question_id)
+);
+create index if not exists seen_questions_repo_idx on seen_questions (user_id, repo_id);
@@ -0,0 +1,15 @@
+import os
+import sys
+import tempfile
+import pytest
+
+TEST_DIR = tempfile.mkdtemp(prefix="ndole-tests-")
+os.environ["NDOLE_BACKEND"] = "sqlite"
+os.environ["NDOLE_SQLITE_PATH"] = os.path.join(TEST_DIR, "ndole.db")
+os.environ["NDOLE_CACHE_DIR"] = os.path.join(TEST_DIR, "cache")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def db():
+    from utils.data import initialize_supabase
+    return initialize_supabase()
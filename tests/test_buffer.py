@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+from model import StudyStats
+from utils.buffer import StudyStatsBuffer, read_journal
+
+def stat(**fields) -> StudyStats:
+    return StudyStats(last_activity=datetime(2026, 1, 2, 23, 59).isoformat(), **fields)
+
+def test_processes_keep_their_own_journal(tmp_path):
+    applied = []
+    first = StudyStatsBuffer(lambda *args: applied.append(args) or True, str(tmp_path), interval=3600)
+    second = StudyStatsBuffer(lambda *args: applied.append(args) or True, str(tmp_path), interval=3600)
+    first.add("a", stat(messages_sent=1))
+    second.add("b", stat(messages_sent=2))
+    first.flush("a")
+    assert [user_id for user_id, _ in read_journal(second.journal_path)] == ["b"]
+    first.close()
+    second.close()
+    assert sorted(user_id for user_id, _, _ in applied) == ["a", "b"]
+
+def test_deltas_are_bucketed_by_activity_day(tmp_path):
+    applied = []
+    buffer = StudyStatsBuffer(lambda *args: applied.append(args) or True, str(tmp_path), interval=3600)
+    buffer.add("a", stat(messages_sent=1))
+    buffer.add("a", StudyStats(last_activity=(datetime(2026, 1, 2, 23, 59) + timedelta(minutes=2)).isoformat(), messages_sent=2))
+    buffer.flush("a")
+    assert [(delta.last_activity[:10], delta.messages_sent) for _, delta, _ in applied] == [("2026-01-02", 1), ("2026-01-03", 2)]
+    buffer.close()
+
+def test_orphaned_journal_is_adopted_without_applied_entries(tmp_path):
+    applied = []
+    crashed = StudyStatsBuffer(lambda *args: True, str(tmp_path), interval=3600)
+    crashed.add("a", stat(messages_sent=1))
+    crashed.flush("a")
+    crashed.add("a", stat(messages_sent=5))
+    crashed.owner_lock.close()
+    survivor = StudyStatsBuffer(lambda *args: applied.append(args) or True, str(tmp_path), interval=3600)
+    survivor.flush_all()
+    assert [delta.messages_sent for _, delta, _ in applied] == [5]
+    survivor.close()
+
+def test_failed_flush_is_retried_and_rejected_flush_is_dropped(tmp_path):
+    outcomes = [RuntimeError("offline"), False]
+    def apply(user_id, delta, is_login):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    buffer = StudyStatsBuffer(apply, str(tmp_path), interval=3600)
+    buffer.add("missing", stat(messages_sent=1))
+    assert not buffer.flush("missing")
+    assert buffer.pending
+    assert buffer.flush("missing")
+    assert not buffer.pending
+    buffer.close()
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from utils.chunks import ChunkSet, embedding_columns, fetch_chunk_rows, row_embedding
+from utils.data import call_function
+
+def insert_chunk(db, chunk_id, document_id, embedding):
+    db.table('chunks').insert({
+        'chunk_id': chunk_id,
+        'document_id': document_id,
+        'page': 1,
+        'position': int(chunk_id[-1]),
+        'text': chunk_id,
+        **embedding_columns(embedding)
+    }).execute()
+
+@pytest.mark.parametrize("fmt", ["f16", "f32"])
+def test_packed_rows_are_read_in_json_mode(db, monkeypatch, fmt):
+    document_id = f"packed-{fmt}"
+    monkeypatch.setenv("NDOLE_EMBEDDING_FORMAT", fmt)
+    insert_chunk(db, f"{document_id}-0", document_id, [0.25, -0.5, 1.0])
+    monkeypatch.setenv("NDOLE_EMBEDDING_FORMAT", "json")
+    insert_chunk(db, f"{document_id}-1", document_id, [1.0, 0.5, -0.25])
+    chunks = ChunkSet.from_rows(fetch_chunk_rows([document_id])[document_id])
+    assert chunks.embeddings.dtype == np.float32
+    assert chunks.embeddings.tolist() == [[0.25, -0.5, 1.0], [1.0, 0.5, -0.25]]
+
+def test_row_without_embedding_is_rejected():
+    with pytest.raises(ValueError):
+        row_embedding({'chunk_id': 'empty', 'embedding': None, 'embedding_packed': None})
+
+def chunk_set(offset, count):
+    rows = [{'page': offset + i, 'position': 0, 'text': f"t{offset + i}", 'embedding': [1.0, float(offset + i)]} for i in range(count)]
+    return ChunkSet.from_rows(rows)
+
+def test_concat_keeps_document_blocks():
+    first, second = chunk_set(0, 3), chunk_set(3, 2)
+    chunks = ChunkSet.concat([first, second])
+    assert chunks.blocks[0] is first.blocks[0] and chunks.blocks[1] is second.blocks[0]
+    assert chunks[4].embedding.tolist() == [1.0, 4.0]
+    assert [view.page for view in chunks.search(np.array([0.0, 1.0], dtype=np.float32), 2)] == [4, 3]
+    assert chunks.page_range(2, 3).embeddings.tolist() == [[1.0, 2.0], [1.0, 3.0]]
+
+def test_match_chunks_returns_ranked_matches_without_embeddings(db):
+    for chunk_id, embedding in [("match-0", [1.0, 0.0, 0.0]), ("match-1", [0.0, 1.0, 0.0]), ("match-2", [0.5, 0.5, 0.0])]:
+        insert_chunk(db, chunk_id, "match", embedding)
+    matches = call_function('match_chunks', {'p_document_ids': ["match"], 'p_query_embedding': [0.0, 1.0, 0.0], 'p_match_count': 2, 'p_page': None})
+    assert [match['chunk_id'] for match in matches] == ["match-1", "match-2"]
+    assert [match['score'] for match in matches] == [1.0, 0.5]
+    assert set(matches[0]) == {'chunk_id', 'document_id', 'page', 'position', 'text', 'score'}
+    assert call_function('match_chunks', {'p_document_ids': ["match"], 'p_query_embedding': [0.0, 1.0, 0.0], 'p_match_count': 2, 'p_page': 2}) == []
+    chunks = ChunkSet.from_matches(matches)
+    assert [view.text for view in chunks] == ["match-1", "match-2"]
@@ -0,0 +1,44 @@
+import os
+import pytest
+from utils.embedded import EmbeddedClient
+
+@pytest.fixture
+def client(tmp_path):
+    client = EmbeddedClient(str(tmp_path / "embedded.db"))
+    client.table('items').insert([
+        {'item_id': f"item-{i}", 'kind': 'even' if i % 2 == 0 else 'odd', 'rank': i, 'tags': ['all', f"tag-{i % 3}"]}
+        for i in range(6)
+    ]).execute()
+    return client
+
+def item_ids(response):
+    return [row['item_id'] for row in response.data]
+
+def test_filters(client):
+    assert item_ids(client.table('items').select('item_id').eq('kind', 'odd').order('rank').execute()) == ['item-1', 'item-3', 'item-5']
+    assert item_ids(client.table('items').select('item_id').in_('item_id', ['item-4', 'item-0', 'missing']).order('rank').execute()) == ['item-0', 'item-4']
+    assert item_ids(client.table('items').select('item_id').contains('tags', ['all', 'tag-1']).order('rank').execute()) == ['item-1', 'item-4']
+    assert item_ids(client.table('items').select('item_id').gte('rank', 2).lt('rank', 4).neq('item_id', 'item-3').execute()) == ['item-2']
+
+def test_order_range_and_projection(client):
+    response = client.table('items').select('item_id, rank').order('rank', desc=True).range(1, 3).execute()
+    assert response.data == [{'item_id': 'item-4', 'rank': 4}, {'item_id': 'item-3', 'rank': 3}, {'item_id': 'item-2', 'rank': 2}]
+    assert item_ids(client.table('items').select('item_id').order('rank').limit(2).execute()) == ['item-0', 'item-1']
+
+def test_writes(client):
+    assert item_ids(client.table('items').update({'kind': 'top'}).gt('rank', 3).execute()) == ['item-4', 'item-5']
+    assert item_ids(client.table('items').select('item_id').eq('kind', 'top').execute()) == ['item-4', 'item-5']
+    client.table('items').upsert({'item_id': 'item-0', 'rank': 10}, on_conflict='item_id').execute()
+    client.table('items').upsert({'item_id': 'item-1', 'rank': 11}, on_conflict='item_id', ignore_duplicates=True).execute()
+    ranks = {row['item_id']: row['rank'] for row in client.table('items').select('item_id, rank').in_('item_id', ['item-0', 'item-1']).execute().data}
+    assert ranks == {'item-0': 10, 'item-1': 1}
+    assert item_ids(client.table('items').delete().eq('kind', 'odd').execute()) == ['item-1', 'item-3']
+    assert len(client.table('items').select('item_id').execute().data) == 4
+
+def test_signed_urls_are_local_paths(client):
+    bucket = client.storage.from_('documents')
+    bucket.upload('owner/doc.pdf', b"%PDF")
+    url = bucket.create_signed_url('owner/doc.pdf', 60)['signedURL']
+    assert os.path.isfile(url)
+    signed = bucket.create_signed_urls(['owner/doc.pdf', 'owner/missing.pdf'], 60)
+    assert signed[0]['signedURL'] == url and signed[1]['error']
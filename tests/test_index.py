@@ -0,0 +1,44 @@
+import threading
+import time
+import numpy as np
+from utils.chunks import ChunkSet
+from utils.index import IndexRegistry, RemoteIndex, RepositoryIndex
+import utils.index
+
+def fake_index(document_ids):
+    rows = [{'chunk_id': f"{doc}-0", 'document_id': doc, 'page': 1, 'position': 0, 'text': doc, 'embedding': [1.0, 0.0]} for doc in document_ids]
+    return RepositoryIndex(document_ids=document_ids, chunks=ChunkSet.from_rows(rows))
+
+def test_discarded_entry_survives_until_released(monkeypatch):
+    monkeypatch.setattr(utils.index, "build_repository_index", fake_index)
+    registry = IndexRegistry(memory_budget=1 << 20, idle_seconds=900)
+    old = registry.acquire(["a", "b"])
+    registry.discard_document("a")
+    assert registry.stats()['retired'] == 1
+    new = registry.acquire(["a", "b"])
+    assert new.index is not old.index
+    old.release()
+    assert registry.stats()['retired'] == 0
+    assert registry.entries[("a", "b")].refs == 1
+    new.release()
+    assert registry.entries[("a", "b")].refs == 0
+
+def test_idle_entries_are_evicted_without_traffic(monkeypatch):
+    monkeypatch.setattr(utils.index, "build_repository_index", fake_index)
+    registry = IndexRegistry(memory_budget=1 << 20, idle_seconds=0.01)
+    registry.acquire(["a"]).release()
+    threading.Thread(target=registry.sweep_forever, args=(0.01,), daemon=True).start()
+    deadline = time.monotonic() + 2
+    while registry.entries and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not registry.entries
+
+def test_remote_index_searches_through_match_chunks(db):
+    db.table('chunks').insert([
+        {'chunk_id': f"remote-{i}", 'document_id': "remote", 'page': 1, 'position': i, 'text': f"remote-{i}", 'embedding': [1.0, float(i)]}
+        for i in range(3)
+    ]).execute()
+    registry = IndexRegistry(memory_budget=1 << 20, idle_seconds=900)
+    chunks = RemoteIndex(registry, ("remote",)).search(np.array([0.0, 1.0], dtype=np.float32), 2)
+    assert [view.text for view in chunks] == ["remote-2", "remote-1"]
+    assert registry.stats()['remote_searches'] == 1 and not registry.entries
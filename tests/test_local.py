@@ -0,0 +1,45 @@
+import utils.local
+from utils.data import append_to_array, call_function, remove_from_array
+
+def repositories_of(db, user_id):
+    return db.table('users').select('repositories').eq('user_id', user_id).execute().data[0]['repositories']
+
+def test_array_append_is_unique_unless_asked(db):
+    db.table('users').insert({'user_id': 'array-user', 'repositories': ['a'], 'updated_at': None}).execute()
+    assert append_to_array('users', 'user_id', 'array-user', 'repositories', 'a')
+    assert repositories_of(db, 'array-user') == ['a']
+    assert append_to_array('users', 'user_id', 'array-user', 'repositories', 'b', extra={'updated_at': 'now'})
+    assert repositories_of(db, 'array-user') == ['a', 'b']
+    assert db.table('users').select('updated_at').eq('user_id', 'array-user').execute().data[0]['updated_at'] == 'now'
+    assert append_to_array('users', 'user_id', 'array-user', 'repositories', 'a', unique=False)
+    assert repositories_of(db, 'array-user') == ['a', 'b', 'a']
+    assert remove_from_array('users', 'user_id', 'array-user', 'repositories', 'a')
+    assert repositories_of(db, 'array-user') == ['b']
+    assert not append_to_array('users', 'user_id', 'missing-user', 'repositories', 'a')
+
+def search_all(user_id, query, limit):
+    seen, cursor = [], None
+    while True:
+        page = call_function('search_public_repositories', {'p_user_id': user_id, 'p_query': query, 'p_cursor': cursor, 'p_limit': limit, 'p_count_cap': 1000})
+        seen.extend(item['repo_id'] for item in page['items'])
+        if len(page['items']) < limit:
+            return seen, page['total_estimate']
+        last = page['items'][-1]
+        cursor = {'key': last['rank'] if query else last['created_at'], 'repo_id': last['repo_id']}
+
+def test_public_search_pages_with_keyset_cursors(db, monkeypatch):
+    monkeypatch.setitem(utils.local._search_index, 'connection', None)
+    db.table('document_repositories').insert([
+        {'repo_id': f"public-{i}", 'owner_id': 'owner', 'name': f"Algebra {i}" if i % 2 else f"History {i}", 'description': '', 'categories': [],
+         'is_public': True, 'is_deleted': False, 'documents': [], 'created_at': f"2026-01-0{i // 3 + 1}"}
+        for i in range(7)
+    ] + [
+        {'repo_id': 'public-own', 'owner_id': 'searcher', 'name': 'Algebra own', 'description': '', 'categories': [], 'is_public': True, 'is_deleted': False, 'created_at': '2026-01-09'},
+        {'repo_id': 'public-private', 'owner_id': 'owner', 'name': 'Algebra private', 'is_public': False, 'is_deleted': False, 'created_at': '2026-01-09'},
+    ]).execute()
+    newest, total = search_all('searcher', None, 3)
+    assert total == 7
+    assert newest == ['public-6', 'public-5', 'public-4', 'public-3', 'public-2', 'public-1', 'public-0']
+    matches, total = search_all('searcher', 'alg', 2)
+    assert total == 3
+    assert sorted(matches) == ['public-1', 'public-3', 'public-5'] and len(set(matches)) == 3
@@ -0,0 +1,15 @@
+from model import Message
+from utils.sessions import recall_conversation, refresh_conversation_message, remember_conversation
+
+def test_saved_quiz_score_reaches_the_snapshot():
+    messages = [Message(message_id=f"quiz-{i}", chat_id="quiz-chat", content=f"m{i}", is_assistant=i % 2 == 1) for i in range(2)]
+    remember_conversation("quiz-chat", None, ["quiz-0", "quiz-1"], messages)
+    messages[1].score = {'correct': 2, 'total': 3, 'answers': {'0': 'A'}}
+    refresh_conversation_message("quiz-chat", messages[1])
+    restored = recall_conversation("quiz-chat", ["quiz-0", "quiz-1"]).restore_messages()
+    assert restored[1].score == {'correct': 2, 'total': 3, 'answers': {'0': 'A'}}
+    assert restored[0].score == {}
+
+def test_refresh_without_snapshot_is_a_no_op():
+    refresh_conversation_message("unknown-chat", Message(message_id="x", chat_id="unknown-chat", content="x", is_assistant=True))
+    assert recall_conversation("unknown-chat", ["x"]) is None
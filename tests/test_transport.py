@@ -0,0 +1,81 @@
+import httpx
+import pytest
+from utils.data import create_supabase_client
+from utils.transport import DEFAULT_TRANSPORT, CircuitOpenError, ResilientTransport, get_transport
+
+def test_every_supabase_client_shares_the_transport():
+    client = create_supabase_client("https://example.supabase.co", "anon-key")
+    http_clients = [client.postgrest.session, client.storage._client, client.functions._client, client.auth._http_client]
+    assert all(http_client is http_clients[0] for http_client in http_clients)
+    assert http_clients[0]._transport is get_transport()
+
+def resilient_client(handler, **settings):
+    settings = {**DEFAULT_TRANSPORT, 'backoff_base': 0.001, 'backoff_max': 0.01, **settings}
+    transport = ResilientTransport(settings, transport=httpx.MockTransport(handler))
+    return httpx.Client(transport=transport), transport
+
+def flaky(failures):
+    calls = []
+    def handler(request):
+        calls.append(request.method)
+        if len(calls) <= len(failures):
+            failure = failures[len(calls) - 1]
+            if isinstance(failure, Exception):
+                raise failure
+            return httpx.Response(failure)
+        return httpx.Response(200, json={'ok': True})
+    return handler, calls
+
+def test_reads_are_retried_on_5xx_and_connect_errors():
+    handler, calls = flaky([503, httpx.ConnectError("refused"), 502])
+    client, transport = resilient_client(handler)
+    assert client.get("https://db.example/rest").status_code == 200
+    assert len(calls) == 4
+    assert transport.stats()['retries'] == 3
+
+def test_writes_are_not_retried():
+    handler, calls = flaky([503])
+    client, _ = resilient_client(handler)
+    assert client.post("https://db.example/rest", json={}).status_code == 503
+    handler, calls = flaky([httpx.ConnectError("refused")])
+    client, _ = resilient_client(handler)
+    with pytest.raises(httpx.ConnectError):
+        client.post("https://db.example/rest", json={})
+    assert calls == ['POST']
+
+def test_backoff_is_jittered_capped_and_honours_retry_after():
+    transport = ResilientTransport(dict(DEFAULT_TRANSPORT, backoff_base=0.2, backoff_max=3.0), transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+    assert all(0 <= transport.backoff(attempt) <= min(3.0, 0.2 * 2 ** attempt) for attempt in range(6) for _ in range(20))
+    assert transport.backoff(0, httpx.Response(429, headers={'retry-after': '2'})) == 2.0
+    assert transport.backoff(0, httpx.Response(429, headers={'retry-after': '60'})) == 3.0
+
+def test_retries_stop_at_the_deadline():
+    handler, calls = flaky([503] * 10)
+    client, transport = resilient_client(handler, retries=10, deadline=0.05, backoff_base=0.04, backoff_max=0.04)
+    assert client.get("https://db.example/rest").status_code == 503
+    assert len(calls) < 10
+    assert transport.stats()['deadline_exceeded'] == 1
+
+def test_attempt_timeouts_are_capped_to_the_deadline():
+    seen = []
+    def handler(request):
+        seen.append(request.extensions['timeout'])
+        return httpx.Response(200)
+    client, _ = resilient_client(handler, deadline=2.0)
+    client.get("https://db.example/rest", timeout=httpx.Timeout(20.0))
+    assert all(0 < value <= 2.0 for value in seen[0].values())
+
+def test_breaker_opens_and_resets_after_a_successful_probe():
+    handler, calls = flaky([500, 500])
+    client, transport = resilient_client(handler, breaker_threshold=2, breaker_cooldown=60.0)
+    assert client.post("https://db.example/rest").status_code == 500
+    assert client.post("https://db.example/rest").status_code == 500
+    with pytest.raises(CircuitOpenError):
+        client.post("https://db.example/rest")
+    assert transport.stats()['breakers'] == {'db.example': 'open'}
+    breaker = transport.breaker('db.example')
+    breaker.opened_at -= 60.0
+    assert transport.stats()['breakers'] == {'db.example': 'half_open'}
+    assert client.post("https://db.example/rest").status_code == 200
+    assert transport.stats()['breakers'] == {'db.example': 'closed'}
+    assert len(calls) == 3
@@ -0,0 +1,61 @@
+import os
+import time
+from utils.vacuum import vacuum
+
+def upload(db, bucket, path, age_hours=0):
+    db.storage.from_(bucket).upload(path, b"data")
+    full_path = db.storage.from_(bucket).local_path(path)
+    stamp = time.time() - age_hours * 3600
+    os.utime(full_path, (stamp, stamp))
+
+def stored(db, bucket, path):
+    return os.path.exists(db.storage.from_(bucket).local_path(path))
+
+def row(db, table, key_column, key):
+    return db.table(table).select('*').eq(key_column, key).execute().data[0]
+
+def test_vacuum_purges_dead_rows_and_orphaned_objects(db):
+    db.table('users').insert({'user_id': 'vac-user', 'repositories': ['vac-live', 'vac-dead', 'vac-missing']}).execute()
+    db.table('document_repositories').insert([
+        {'repo_id': 'vac-live', 'owner_id': 'vac-user', 'is_deleted': False, 'documents': ['vac-doc', 'vac-gone', 'vac-deleted'], 'banner': 'banners/vac-user/vac-live/new.png'},
+        {'repo_id': 'vac-dead', 'owner_id': 'vac-user', 'is_deleted': True, 'documents': ['vac-orphan'], 'banner': 'banners/vac-user/vac-dead/banner.png'},
+    ]).execute()
+    db.table('documents').insert([
+        {'doc_id': 'vac-doc', 'owner_id': 'vac-user', 'is_deleted': False, 'original_repo': 'vac-live', 'file_path': 'documents/vac-user/vac-doc.pdf', 'cover': 'covers/vac-user/vac-doc/new.png'},
+        {'doc_id': 'vac-deleted', 'owner_id': 'vac-user', 'is_deleted': True, 'original_repo': 'vac-live', 'file_path': 'documents/vac-user/vac-deleted.pdf', 'cover': None},
+        {'doc_id': 'vac-orphan', 'owner_id': 'vac-user', 'is_deleted': False, 'original_repo': 'vac-dead', 'file_path': 'documents/vac-user/vac-orphan.pdf', 'cover': None},
+    ]).execute()
+    db.table('chunks').insert([
+        {'chunk_id': 'vac-doc-0', 'document_id': 'vac-doc'},
+        {'chunk_id': 'vac-deleted-0', 'document_id': 'vac-deleted'},
+        {'chunk_id': 'vac-orphan-0', 'document_id': 'vac-orphan'},
+        {'chunk_id': 'vac-gone-0', 'document_id': 'vac-gone'},
+    ]).execute()
+    upload(db, 'documents', 'vac-user/vac-doc.pdf', age_hours=48)
+    upload(db, 'documents', 'vac-user/vac-deleted.pdf')
+    upload(db, 'documents', 'vac-user/vac-orphan.pdf')
+    upload(db, 'documents', 'vac-user/vac-failed.pdf', age_hours=48)
+    upload(db, 'documents', 'vac-user/vac-uploading.pdf')
+    upload(db, 'covers', 'vac-user/vac-doc/new.png', age_hours=48)
+    upload(db, 'covers', 'vac-user/vac-doc/old.png', age_hours=48)
+    upload(db, 'banners', 'vac-user/vac-live/new.png', age_hours=48)
+    upload(db, 'banners', 'vac-user/vac-live/old.png', age_hours=48)
+    upload(db, 'banners', 'vac-user/vac-dead/banner.png')
+
+    dry_report = vacuum(batch_size=2, dry_run=True)
+    assert stored(db, 'covers', 'vac-user/vac-doc/old.png')
+    assert vacuum(batch_size=2) == dry_report
+
+    assert row(db, 'users', 'user_id', 'vac-user')['repositories'] == ['vac-live']
+    assert row(db, 'document_repositories', 'repo_id', 'vac-live')['documents'] == ['vac-doc']
+    assert row(db, 'document_repositories', 'repo_id', 'vac-dead')['banner'] is None
+    assert row(db, 'documents', 'doc_id', 'vac-orphan')['is_deleted']
+    remaining = {chunk['chunk_id'] for chunk in db.table('chunks').select('chunk_id').in_('chunk_id', ['vac-doc-0', 'vac-deleted-0', 'vac-orphan-0', 'vac-gone-0']).execute().data}
+    assert remaining == {'vac-doc-0'}
+    assert stored(db, 'documents', 'vac-user/vac-doc.pdf')
+    assert stored(db, 'documents', 'vac-user/vac-uploading.pdf')
+    assert stored(db, 'covers', 'vac-user/vac-doc/new.png')
+    assert stored(db, 'banners', 'vac-user/vac-live/new.png')
+    for bucket, path in [('documents', 'vac-user/vac-deleted.pdf'), ('documents', 'vac-user/vac-orphan.pdf'), ('documents', 'vac-user/vac-failed.pdf'),
+                         ('covers', 'vac-user/vac-doc/old.png'), ('banners', 'vac-user/vac-live/old.png'), ('banners', 'vac-user/vac-dead/banner.png')]:
+        assert not stored(db, bucket, path)
@@ -1,8 +1,11 @@
 import streamlit as st
-from utils.chat import create_chat_history, get_user_histories, update_chat_history, get_chat_messages, update_message, get_documents_embedding
-from utils.llm import qa_chat, course_chat, exercise_chat, extract_qcm_data, extract_context
+from utils.chat import create_chat_history, get_user_histories, update_chat_history, get_chat_messages, update_message
+from utils.llm import qa_chat, course_chat, exercise_chat, extract_qcm_data, extract_context, resume_chat_session
 from utils.doc import get_document_repository
+from utils.index import open_repository_index
+from utils.questions import bank_exercise_chat
 from utils.sql import process_llm_response
+from utils.sessions import forget_conversation, recall_conversation, refresh_conversation_message, remember_conversation
 from utils.user import update_study_stats
 from model import StudyStats
 
@@ -66,10 +69,16 @@ def display_chats():
                             if st.button("▶️", key=f"select_{chat_history.chat_id}"):
                                 st.session_state.chat = chat_history
                                 st.session_state.repo = get_document_repository(chat_history.repo_source)
-                                st.session_state.chunks = get_documents_embedding(st.session_state.repo.documents)
+                                st.session_state.chunks = open_repository_index(st.session_state.repo.documents)
                                 message_ids = chat_history.messages
-                                st.session_state.messages = get_chat_messages(message_ids)
-                                st.session_state.chat_session = None
+                                conversation = recall_conversation(chat_history.chat_id, message_ids)
+                                if conversation:
+                                    st.session_state.messages = conversation.restore_messages()
+                                    st.session_state.chat_session = resume_chat_session(conversation.restore_history())
+                                else:
+                                    st.session_state.messages = get_chat_messages(message_ids)
+                                    st.session_state.chat_session = None
+                                    remember_conversation(chat_history.chat_id, None, message_ids, st.session_state.messages)
                                 st.rerun()
                         with col_edit:
                             if st.button("✏️", key=f"edit_{chat_history.chat_id}"):
@@ -78,6 +87,7 @@ def display_chats():
                         with col_delete:
                             if st.button("🗑️", key=f"delete_{chat_history.chat_id}"):
                                 update_chat_history(chat_history.chat_id, is_deleted=True)
+                                forget_conversation(chat_history.chat_id)
                                 st.rerun()
         else:
             st.info("💡 No existing conversations. Create one to get started!")
@@ -125,6 +135,9 @@ def display_chats():
     else:
         st.info("Select an existing conversation or create a new one to get started.")
         
+def stream_to(placeholder):
+    return lambda text: placeholder.markdown(text + " ▌")
+
 def display_qa_interface():
     user_message = st.chat_input("Posez votre question...")
     if user_message:
@@ -138,7 +151,8 @@ def display_qa_interface():
                 user_message, 
                 st.session_state.chunks,
                 st.session_state.messages,
-                st.session_state.chat_session
+                st.session_state.chat_session,
+                stream_to(message_placeholder)
             )
             if success:
                 st.session_state.messages.extend(msgs)
@@ -159,10 +173,15 @@ def display_course_interface():
             col1, col2 = st.columns(2)
             with col1:
                 use_specific_page = st.checkbox("Use a specific page")
+                use_page_range = st.checkbox("Cover a whole page range (detailed course)")
             with col2:
                 page_number = None
                 if use_specific_page:
                     page_number = st.number_input("Page number", min_value=1, value=1)
+                first_page, last_page = None, None
+                if use_page_range:
+                    first_page = st.number_input("From page", min_value=1, value=1)
+                    last_page = st.number_input("To page", min_value=1, value=10)
             if st.form_submit_button("Generate the course"):
                 if topic:
                     topic = process_llm_response(topic)
@@ -177,7 +196,9 @@ def display_course_interface():
                             st.session_state.chunks,
                             st.session_state.messages,
                             page_number if use_specific_page else None,
-                            st.session_state.chat_session
+                            st.session_state.chat_session,
+                            stream_to(placeholder),
+                            (first_page, last_page) if use_page_range else None
                         )
                         if success:
                             st.session_state.messages.extend(msgs)
@@ -210,7 +231,8 @@ def display_course_interface():
                     user_message, 
                     st.session_state.chunks,
                     st.session_state.messages,
-                    st.session_state.chat_session
+                    st.session_state.chat_session,
+                    stream_to(placeholder)
                 )
                 if success:
                     st.session_state.messages.extend(msgs)
@@ -236,23 +258,45 @@ def display_exercise_interface():
     if not st.session_state.chat.mode:
         with st.form("exercise_form"):
             topic = st.text_input("Exercises topic", placeholder="E.g.: Variables in Python, Quadratic equations...")
-            num_exercises = st.slider("Number of exercises", min_value=1, max_value=5, value=3)
+            num_exercises = st.slider("Number of exercises", min_value=1, max_value=20, value=3)
+            col1, col2 = st.columns(2)
+            with col1:
+                use_bank = st.checkbox("⚡ Instant quiz from the repository question bank")
+                use_page_range = st.checkbox("Limit to a page range")
+            with col2:
+                first_page, last_page = None, None
+                if use_page_range:
+                    first_page = st.number_input("From page", min_value=1, value=1)
+                    last_page = st.number_input("To page", min_value=1, value=10)
             if st.form_submit_button("Generate exercises"):
-                if topic:
-                    topic = process_llm_response(topic)
+                if topic or use_bank:
+                    topic = process_llm_response(topic) if topic else None
+                    page_range = (first_page, last_page) if use_page_range else None
                     with st.chat_message("user"):
-                        st.markdown(f"Generating {num_exercises} exercises on: **{topic}**")
+                        st.markdown(f"Generating {num_exercises} exercises on: **{topic or 'the whole repository'}**")
                     with st.chat_message("assistant"):
                         placeholder = st.empty()
                         placeholder.markdown("⏳ Generating exercises...")
-                        st.session_state.chat_session, response, success, msgs = exercise_chat(
+                        result = bank_exercise_chat(
                             st.session_state.chat,
-                            topic,
-                            st.session_state.chunks,
+                            st.session_state.user.user_id,
+                            st.session_state.repo.documents,
                             st.session_state.messages,
                             num_exercises,
-                            st.session_state.chat_session
-                        )
+                            topic,
+                            page_range
+                        ) if use_bank else None
+                        if result is None:
+                            result = exercise_chat(
+                                st.session_state.chat,
+                                topic or "the whole repository",
+                                st.session_state.chunks.page_range(*page_range) if page_range else st.session_state.chunks,
+                                st.session_state.messages,
+                                num_exercises,
+                                st.session_state.chat_session,
+                                stream_to(placeholder)
+                            )
+                        st.session_state.chat_session, response, success, msgs = result
                         if success:
                             st.session_state.messages.extend(msgs)
                             for msg in msgs:
@@ -288,7 +332,8 @@ def display_exercise_interface():
                     user_message, 
                     st.session_state.chunks,
                     st.session_state.messages,
-                    st.session_state.chat_session
+                    st.session_state.chat_session,
+                    stream_to(placeholder)
                 )
                 if success:
                     st.session_state.messages.extend(msgs)
@@ -342,6 +387,7 @@ def qcm_message(questions: list, j: int):
             )
             if success:
                 st.session_state.messages[j].score = score
+                refresh_conversation_message(st.session_state.messages[j].chat_id, st.session_state.messages[j])
                 xp_up = update_study_stats(st.session_state.user.user_id, StudyStats(xp_gained=5 + 2 * correct_count, 
                                                                              quizzes_completed=1, 
                                                                              questions_answered=total,
@@ -1,11 +1,12 @@
 import os
 import tempfile
-from typing import List
+from typing import List, Union
 import streamlit as st
-from model import Access, DocumentRepository, StudyStats
-from utils.chat import get_documents_embedding
-from utils.doc import create_document_repository, get_document_download_url, get_list_of_documents, get_list_of_repositories, get_public_repositories, load_document_cover, load_repository_banner, update_document, update_document_cover, update_document_repository, update_repository_access, update_repository_banner, upload_document, get_owner_name, get_original_repo
-from utils.user import get_user, update_user_access, update_study_stats
+from model import Access, DocumentRepository, RepositorySummary, StudyStats
+from utils.doc import add_document_to_repository, create_document_repository, get_document_download_url, get_document_repository, get_list_of_documents, get_list_of_repositories, get_public_repositories, load_document_cover, get_repository_engagement, load_repository_banner, record_repository_access, update_document, update_document_cover, update_document_repository, update_repository_access, update_repository_banner, upload_document, get_owner_name, get_original_repo, prefetch_document_cards, PUBLIC_COUNT_CAP, prefetch_repository_cards, remove_document_from_repository
+from utils.index import open_repository_index
+from utils.questions import schedule_top_up
+from utils.user import update_study_stats
 
 def select_repositories(user_repos: List[DocumentRepository], user_id: str):
     if 'user' not in st.session_state or not hasattr(st.session_state.user, 'user_id'):
@@ -24,15 +25,28 @@ def select_repositories(user_repos: List[DocumentRepository], user_id: str):
             st.info("🚫 You don't have any repositories yet. Create one in the next tab!")
     with tab2:
         st.subheader("Browse Public Repositories")
-        st.markdown("Use the page selector to browse through public repositories.")
-        col1, col2 = st.columns(2)
-        with col1:
-            query = st.text_input("🔍 Search", max_chars=50, key='public_repo_search')
-        with col2:
-            page = st.number_input("🔢 Page", min_value=1, value=1, step=1, key='public_repo_page')
-        public_repos = get_public_repositories(page=page, user_id=user_id, query=query)
-        if public_repos:
-            display_repositories(public_repos, user_id)
+        st.markdown("Search by name, description or category, then page through the results.")
+        query = st.text_input("🔍 Search", max_chars=50, key='public_repo_search')
+        if st.session_state.get('public_repo_query') != query:
+            st.session_state.public_repo_query = query
+            st.session_state.public_repo_cursors = [None]
+        cursors = st.session_state.public_repo_cursors
+        public_page = get_public_repositories(user_id=user_id, query=query, cursor=cursors[-1])
+        if public_page.items:
+            total = f"{public_page.total_estimate}+" if public_page.total_estimate >= PUBLIC_COUNT_CAP else str(public_page.total_estimate)
+            st.caption(f"Page {len(cursors)} · {total} repositories")
+            display_repositories(public_page.items, user_id)
+            col1, col2 = st.columns(2)
+            with col1:
+                if len(cursors) > 1 and st.button("⬅️ Previous", key='public_repo_previous', use_container_width=True):
+                    cursors.pop()
+                    st.rerun()
+            with col2:
+                if public_page.next_cursor and st.button("Next ➡️", key='public_repo_next', use_container_width=True):
+                    cursors.append(public_page.next_cursor)
+                    st.rerun()
+        elif query:
+            st.info("📭 No public repositories match your search.")
         else:
             st.info("📭 No public repositories available yet.")
     with tab3:
@@ -52,21 +66,22 @@ def select_repositories(user_repos: List[DocumentRepository], user_id: str):
                 else:
                     try:
                         categories = [cat.strip() for cat in categories_input.split(",") if cat.strip()]
-                        create_document_repository(repo_name, repo_desc, user_id, categories, is_public)
+                        repo_id = create_document_repository(repo_name, repo_desc, user_id, categories, is_public)
                         xp_up = update_study_stats(user_id, StudyStats(xp_gained=25, repositories_created=1))
                         if xp_up:
                             st.session_state.user.experience_points += 25   
-                        st.session_state.user = get_user(user_id)
+                        st.session_state.user.repositories.append(repo_id)
                         st.success(f"Repository '{repo_name}' created successfully!")
                         st.rerun()
                     except Exception as e:
                         st.error(f"Failed to create repository: {str(e)}")
 
-def display_repositories(repositories: List[DocumentRepository], user_id: str):
+def display_repositories(repositories: List[Union[DocumentRepository, RepositorySummary]], user_id: str):
+    prefetch_repository_cards(repositories, user_id)
     for current_repo in repositories:
         display_repository_card(current_repo, user_id, is_owner=(current_repo.owner_id == user_id))
 
-def display_repository_card(repository: DocumentRepository, user_id: str, is_owner: bool = False):
+def display_repository_card(repository: Union[DocumentRepository, RepositorySummary], user_id: str, is_owner: bool = False):
     with st.container(border=True):
         banner_url = load_repository_banner(repository.banner) if repository.banner else None
         with st.expander("🖼️ Banner"):
@@ -181,31 +196,28 @@ def display_repository_card(repository: DocumentRepository, user_id: str, is_own
                         st.rerun()
         else:
             action_cols = st.columns(4)
-            is_liked = any(access.access_id == user_id for access in repository.likes)
-            is_disliked = any(access.access_id == user_id for access in repository.dislikes)
-            is_bookmarked = any(access.access_id == user_id for access in repository.bookmarks)
+            engagement = get_repository_engagement(repository.repo_id, user_id)
+            is_liked = 'likes' in engagement
+            is_disliked = 'dislikes' in engagement
+            is_bookmarked = 'bookmarks' in engagement
             with action_cols[0]:
                 like_label = "👍 Liked" if is_liked else "👍 Like"
                 if st.button(like_label, key=f"like_{repository.repo_id}"):
                     update_repository_access(repository.repo_id, Access(access_id=user_id), "likes")
-                    update_user_access(user_id, Access(access_id=repository.repo_id), "likes")
                     st.rerun()
             with action_cols[1]:
                 dislike_label = "👎 Disliked" if is_disliked else "👎 Dislike"
                 if st.button(dislike_label, key=f"dislike_{repository.repo_id}"):
                     update_repository_access(repository.repo_id, Access(access_id=user_id), "dislikes")
-                    update_user_access(user_id, Access(access_id=repository.repo_id), "dislikes")
                     st.rerun()
             with action_cols[2]:
                 bookmark_label = "🔖 Bookmarked" if is_bookmarked else "🔖 Bookmark"
                 if st.button(bookmark_label, key=f"bookmark_{repository.repo_id}"):
                     update_repository_access(repository.repo_id, Access(access_id=user_id), "bookmarks")
-                    update_user_access(user_id, Access(access_id=repository.repo_id), "bookmarks")
                     st.rerun()
             with action_cols[3]:
                 if st.button("📤 Share", key=f"share_{repository.repo_id}"):
                     update_repository_access(repository.repo_id, Access(access_id=user_id), "shares")
-                    update_user_access(user_id, Access(access_id=repository.repo_id), "shares")
                     st.rerun()
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -219,12 +231,15 @@ def display_repository_card(repository: DocumentRepository, user_id: str, is_own
             st.write("**Created On:**")
             st.write(created_date.strftime("%b %d, %Y %H:%M"))
     
-def view_repository(repository: DocumentRepository, user_id: str):
+def view_repository(repository: Union[DocumentRepository, RepositorySummary], user_id: str):
+    if isinstance(repository, RepositorySummary):
+        repository = get_document_repository(repository.repo_id)
+        if not repository:
+            return
     st.session_state.repo = repository
-    st.session_state.chunks = get_documents_embedding(st.session_state.repo.documents)
-    access = Access(access_id=user_id)
-    update_repository_access(repository.repo_id, access, "accesses")
-    update_user_access(user_id, Access(access_id=repository.repo_id), "accesses")
+    st.session_state.chunks = open_repository_index(st.session_state.repo.documents)
+    state = record_repository_access(repository.repo_id, Access(access_id=user_id), "accesses")
+    st.session_state.repo.engagement[user_id] = dict(state if state is not None else get_repository_engagement(repository.repo_id, user_id))
     xp_up = update_study_stats(user_id, StudyStats(xp_gained=5, repositories_accessed=1))
     if xp_up:
         st.session_state.user.experience_points += 5
@@ -313,7 +328,8 @@ def check_repositories(user_id: str, user_repos: List[DocumentRepository]):
                                     st.session_state.user.experience_points += 10
                                 st.success("Document uploaded successfully!")
                                 st.session_state.repo.documents.append(doc_id)
-                                st.session_state.chunks = get_documents_embedding(st.session_state.repo.documents)
+                                st.session_state.chunks = open_repository_index(st.session_state.repo.documents)
+                                schedule_top_up(repo.repo_id, list(st.session_state.repo.documents))
                                 st.markdown("### Add a Cover (Optional)")
                                 cover_file = st.file_uploader(
                                     "Select a cover image",
@@ -357,6 +373,7 @@ def check_repositories(user_id: str, user_repos: List[DocumentRepository]):
         if not documents:
             st.info(f"No documents found{' in this category' if category_filter != 'All' else ''}.")
         else:
+            prefetch_document_cards(documents)
             num_cols = 3
             for i in range(0, len(documents), num_cols):
                 cols = st.columns(num_cols)
@@ -399,7 +416,10 @@ def check_repositories(user_id: str, user_repos: List[DocumentRepository]):
                                         xp_up = update_study_stats(user_id, StudyStats(xp_gained=5, documents_read=1))
                                         if xp_up:
                                             st.session_state.user.experience_points += 5
-                                        if download_url:
+                                        if download_url and os.path.isfile(download_url):
+                                            with open(download_url, 'rb') as f:
+                                                st.download_button("✅ Proceed", f.read(), file_name=f"{doc.title}.pdf", mime="application/pdf", key=f"proceed_{doc.doc_id}")
+                                        elif download_url:
                                             st.link_button("✅ Proceed", download_url)
                                         else:
                                             st.error("Unable to get download link")
@@ -478,10 +498,7 @@ def check_repositories(user_id: str, user_repos: List[DocumentRepository]):
                     if update_document(doc_id=doc.doc_id, is_deleted=True):
                         if doc.doc_id in repo.documents:
                             repo.documents.remove(doc.doc_id)
-                            update_document_repository(
-                                repo_id=repo.repo_id,
-                                documents=repo.documents
-                            )
+                            remove_document_from_repository(repo.repo_id, doc.doc_id)
                         st.success("Document deleted successfully!")
                         del st.session_state.editing_doc
                         st.rerun()
@@ -514,11 +531,8 @@ def check_repositories(user_id: str, user_repos: List[DocumentRepository]):
                             if doc.doc_id in target_repo.documents:
                                 st.warning("This document is already in the selected repository.")
                             else:
-                                target_repo.documents.append(doc.doc_id)
-                                if update_document_repository(
-                                    repo_id=target_repo.repo_id,
-                                    documents=target_repo.documents
-                                ):
+                                if add_document_to_repository(target_repo.repo_id, doc.doc_id):
+                                    target_repo.documents.append(doc.doc_id)
                                     st.success(f"Document successfully added to \"{target_repo.name}\"!")
                                     access = Access(access_id=user_id)
                                     update_repository_access(
@@ -526,11 +540,6 @@ def check_repositories(user_id: str, user_repos: List[DocumentRepository]):
                                         access=access,
                                         access_type="shares"
                                     )
-                                    update_user_access(
-                                        user_id=user_id,
-                                        access=Access(access_id=repo.repo_id),
-                                        access_type="shares"
-                                    )
                                     del st.session_state.adding_doc
                                     st.rerun()
                                 else:
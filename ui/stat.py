@@ -3,12 +3,13 @@ import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
-from utils.user import get_user
+from utils.user import flush_study_stats, get_user
 
 def display_statistics():
     if 'user' not in st.session_state or st.session_state.user is None:
         st.error("🔒 You must be logged in to access this page.")
         return
+    flush_study_stats(st.session_state.user.user_id)
     user = get_user(st.session_state.user.user_id)
     if user:
         st.session_state.user = user
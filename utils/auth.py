@@ -5,6 +5,7 @@ from datetime import datetime
 from typing import Optional, Tuple, Dict
 from model import User, LearningPreference
 from utils.data import initialize_supabase
+from utils.user import USER_COLUMNS, invalidate_user
 
 db = initialize_supabase()
 
@@ -105,22 +106,18 @@ def login_user(username: str, password: str) -> Tuple[bool, str, Optional[User]]
                 return False, "Incorrect username or password.", None
             user_id = auth_response.user.id
             current_time = datetime.now().isoformat()
-            user_response = db.table('users').select('*').eq('user_id', user_id).limit(1).execute()
+            user_response = db.table('users').select(USER_COLUMNS).eq('user_id', user_id).limit(1).execute()
             if len(user_response.data) == 0:
                 return False, "User profile not found.", None
             user_data = user_response.data[0]
             db.table('users').update({'last_login': current_time}).eq('user_id', user_id).execute()
+            invalidate_user(user_id)
             user = User(
                 user_id=user_id,
                 username=username,
                 created_at=user_data.get('created_at'),
                 last_login=current_time,
                 learning_preferences=LearningPreference(**user_data.get('learning_preferences')) if user_data.get('learning_preferences') else LearningPreference(),
-                document_accessed=user_data.get('document_accessed',[]),
-                liked_documents=user_data.get('liked_documents', []),
-                disliked_documents=user_data.get('disliked_documents', []),
-                bookmarked_documents=user_data.get('bookmarked_documents', []),
-                shared_documents=user_data.get('shared_documents', []),
                 experience_points=user_data.get('experience_points', 0),
                 profile_picture=user_data.get('profile_picture', ""),
                 telegram_id=user_data.get('telegram_id'),
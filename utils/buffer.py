@@ -0,0 +1,206 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Tuple
+from model import StudyStats
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+FLUSH_INTERVAL = 60
+FLUSH_THRESHOLD = 20
+ADDITIVE_FIELDS = [
+    "total_study_time", "documents_read", "repositories_created", "repositories_accessed",
+    "documents_uploaded", "couses_created", "messages_sent", "chat_created", "quizzes_created",
+    "quizzes_completed", "questions_answered", "questions_asked", "correct_answers",
+    "challenges_completed", "xp_gained"
+]
+
+def merge_study_stats(current: StudyStats, delta: StudyStats) -> StudyStats:
+    merged = current.copy(deep=True)
+    for field in ADDITIVE_FIELDS:
+        setattr(merged, field, getattr(current, field) + getattr(delta, field))
+    merged.last_activity = max(current.last_activity, delta.last_activity)
+    merged.subject_performance.update(delta.subject_performance)
+    return merged
+
+def activity_day(stat: StudyStats) -> str:
+    return stat.get_last_activity().date().isoformat()
+
+def lock_file(path: str):
+    f = open(path, "a+b")
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+def remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def read_journal(path: str) -> List[Tuple[str, StudyStats]]:
+    entries, applied = {}, set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                if "applied" in entry:
+                    applied.update(entry["applied"])
+                else:
+                    entries[entry["seq"]] = (entry["user_id"], StudyStats(**entry["stat"]))
+            except (ValueError, KeyError, TypeError):
+                continue
+    return [entry for seq, entry in entries.items() if seq not in applied]
+
+class StudyStatsBuffer:
+    """Write-behind study statistics, merged per user and activity day and journaled to a file owned by this process.
+
+    Every journal sits next to a lock file held by its process; journals whose lock is free were left by
+    a process that exited and are adopted at startup.
+    """
+
+    def __init__(self, apply: Callable[[str, StudyStats, bool], bool], journal_dir: str,
+                 interval: float = FLUSH_INTERVAL, threshold: int = FLUSH_THRESHOLD):
+        self.apply = apply
+        self.journal_dir = journal_dir
+        self.interval = interval
+        self.threshold = threshold
+        self.pending: Dict[Tuple[str, str], StudyStats] = {}
+        self.counts: Dict[Tuple[str, str], int] = {}
+        self.seqs: Dict[Tuple[str, str], List[int]] = {}
+        self.next_seq = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        os.makedirs(journal_dir, exist_ok=True)
+        name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.journal_path = os.path.join(journal_dir, f"{name}.journal")
+        self.lock_path = os.path.join(journal_dir, f"{name}.lock")
+        self.owner_lock = lock_file(self.lock_path)
+        self.journal = open(self.journal_path, "a", encoding="utf-8")
+        self._adopt()
+        threading.Thread(target=self._run, daemon=True, name="study-stats-flush").start()
+        atexit.register(self.close)
+
+    def add(self, user_id: str, stat: StudyStats) -> bool:
+        with self.lock:
+            key = self._record(user_id, stat)
+            should_flush = self.counts[key] >= self.threshold
+        if should_flush:
+            self.flush(user_id)
+        return True
+
+    def flush(self, user_id: str) -> bool:
+        with self.flush_lock:
+            with self.lock:
+                batches = [(key, self.pending.pop(key), self.counts.pop(key), self.seqs.pop(key)) for key in sorted(self.pending) if key[0] == user_id]
+            success = True
+            for key, delta, count, seqs in batches:
+                if success:
+                    try:
+                        if not self.apply(user_id, delta.copy(deep=True), False):
+                            print(f"Study stats rejected for {user_id} : dropping {count} updates")
+                    except Exception as e:
+                        print(f"Study stats flush error : {e}")
+                        success = False
+                with self.lock:
+                    if success:
+                        self._write({"applied": seqs}, sync=True)
+                    else:
+                        self._merge(key, delta, seqs, count)
+            with self.lock:
+                self._compact()
+            return success
+
+    def flush_all(self) -> None:
+        with self.lock:
+            user_ids = sorted({user_id for user_id, _ in self.pending})
+        for user_id in user_ids:
+            self.flush(user_id)
+
+    def close(self) -> None:
+        self.flush_all()
+        with self.lock:
+            self.closed = True
+            self.journal.close()
+            if not self.pending:
+                remove_file(self.journal_path)
+            if self.owner_lock:
+                self.owner_lock.close()
+            remove_file(self.lock_path)
+
+    def _record(self, user_id: str, stat: StudyStats) -> Tuple[str, str]:
+        seq = self.next_seq
+        self.next_seq += 1
+        self._write({"seq": seq, "user_id": user_id, "stat": stat.dict()})
+        key = (user_id, activity_day(stat))
+        self._merge(key, stat, [seq])
+        return key
+
+    def _merge(self, key: Tuple[str, str], stat: StudyStats, seqs: List[int], count: int = 1) -> None:
+        current = self.pending.get(key)
+        self.pending[key] = merge_study_stats(current, stat) if current else stat.copy(deep=True)
+        self.counts[key] = self.counts.get(key, 0) + count
+        self.seqs[key] = self.seqs.get(key, []) + seqs
+
+    def _write(self, entry: Dict, sync: bool = False) -> None:
+        if self.closed:
+            return
+        self.journal.write(json.dumps(entry) + "\n")
+        self.journal.flush()
+        if sync:
+            os.fsync(self.journal.fileno())
+
+    def _compact(self) -> None:
+        if self.closed:
+            return
+        self.journal.close()
+        temp_path = self.journal_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for key, stat in self.pending.items():
+                self.seqs[key] = [self.next_seq]
+                f.write(json.dumps({"seq": self.next_seq, "user_id": key[0], "stat": stat.dict()}) + "\n")
+                self.next_seq += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.journal_path)
+        self.journal = open(self.journal_path, "a", encoding="utf-8")
+
+    def _adopt(self) -> None:
+        for journal_path in sorted(glob.glob(os.path.join(self.journal_dir, "*.journal"))):
+            if journal_path == self.journal_path:
+                continue
+            lock_path = journal_path[:-len(".journal")] + ".lock"
+            lock = lock_file(lock_path)
+            if lock is None:
+                continue
+            try:
+                if os.path.exists(journal_path):
+                    with self.lock:
+                        for user_id, stat in read_journal(journal_path):
+                            self._record(user_id, stat)
+                        os.fsync(self.journal.fileno())
+                    os.remove(journal_path)
+            finally:
+                lock.close()
+                remove_file(lock_path)
+
+    def _run(self) -> None:
+        while not self.closed:
+            time.sleep(self.interval)
+            self.flush_all()
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from utils.monitor import register_stats
+
+MISSING = object()
+
+class TTLCache:
+    def __init__(self, name: str, ttl: Optional[float], maxsize: int):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or (entry[0] is not None and entry[0] < time.monotonic()):
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def contains(self, key: Hashable) -> bool:
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and (entry[0] is None or entry[0] >= time.monotonic())
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = MISSING) -> None:
+        ttl = self.ttl if ttl is MISSING else ttl
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl if ttl is not None else None, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+_caches: Dict[str, TTLCache] = {}
+_caches_lock = threading.Lock()
+
+def get_cache(name: str, ttl: Optional[float] = 300, maxsize: int = 1024) -> TTLCache:
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = TTLCache(name, ttl, maxsize)
+        return _caches[name]
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {cache.name: cache.stats() for cache in caches}
+
+register_stats("caches", cache_stats)
+
+def cached(name: str, ttl: Optional[float] = 300, maxsize: int = 1024, copy: bool = False) -> Callable:
+    """Memoizes by positional arguments; None results are not cached, so a missing row is looked up again."""
+    cache = get_cache(name, ttl, maxsize)
+    def prime(value: Any, *args) -> None:
+        if value is not None:
+            cache.set(args, value)
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args):
+            value = cache.get(args)
+            if value is MISSING:
+                value = func(*args)
+                prime(value, *args)
+            return value.copy(deep=True) if copy and value is not None else value
+        wrapper.cache = cache
+        wrapper.invalidate = lambda *args: cache.invalidate(args)
+        wrapper.prime = prime
+        wrapper.is_cached = lambda *args: cache.contains(args)
+        return wrapper
+    return decorator
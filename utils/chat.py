@@ -1,23 +1,14 @@
 from typing import Any, Dict, List, Optional
 import uuid
-from utils.data import initialize_supabase
-from model import Chunk, Message, ChatHistory
+from utils.chunks import ChunkSet, assemble_chunks
+from utils.data import append_to_array, initialize_supabase
+from utils.user import invalidate_user
+from model import Message, ChatHistory
 
 db = initialize_supabase()
 
-def get_documents_embedding(document_ids: List[str]) -> List[Chunk]:
-    chunk = []
-    for document_id in document_ids:
-        response = db.table("chunks").select("*").eq("document_id", document_id).execute()
-        if response.data:
-            for item in response.data:
-                chunk.append(Chunk(
-                    text=item["text"],
-                    embedding=item["embedding"],
-                    page=item["page"],
-                    position=item["position"]
-                ))
-    return chunk
+def get_documents_embedding(document_ids: List[str]) -> ChunkSet:
+    return assemble_chunks(document_ids)
 
 def create_chat_history(user_id: str, repo_id: str, type: str, title: str) -> str:
     chat_id = str(uuid.uuid4())
@@ -30,10 +21,8 @@ def create_chat_history(user_id: str, repo_id: str, type: str, title: str) -> st
     )
     chat_data = chat.dict()
     response = db.table("chat_histories").insert(chat_data).execute()
-    res_user = db.table('users').select('chat_histories').eq('user_id', user_id).limit(1).execute()
-    current_docs = res_user.data[0]['chat_histories']
-    updated_docs = current_docs + [chat_id]
-    db.table('users').update({'chat_histories': updated_docs}).eq('user_id', user_id).execute()
+    append_to_array('users', 'user_id', user_id, 'chat_histories', chat_id)
+    invalidate_user(user_id)
     if len(response.data) > 0:
         return chat_id
     else:
@@ -54,7 +43,9 @@ def get_chat_history(chat_id: str) -> Optional[ChatHistory]:
         title=chat_data["title"],
         repo_source=chat_data["repo_source"],
         type=chat_data["type"],
-        mode=chat_data["mode"]
+        mode=chat_data["mode"],
+        summary=chat_data.get("summary") or "",
+        summary_until=chat_data.get("summary_until")
     ) if chat_data else None
     
 def get_user_histories(chat_ids: List[str]) -> List[ChatHistory]:
@@ -79,6 +70,10 @@ def update_chat_history(chat_id: str, title: str = None, is_deleted: bool = None
     response = db.table('chat_histories').update(update_data).eq('chat_id', chat_id).execute()
     return len(response.data) > 0
 
+def update_chat_summary(chat_id: str, summary: str, summary_until: str) -> bool:
+    response = db.table('chat_histories').update({'summary': summary, 'summary_until': summary_until}).eq('chat_id', chat_id).execute()
+    return len(response.data) > 0
+
 def create_message(chat_id: str, content: str, is_assistant: bool) -> str:
     message_id = str(uuid.uuid4())
     message = Message(
@@ -89,10 +84,7 @@ def create_message(chat_id: str, content: str, is_assistant: bool) -> str:
     )
     message_data = message.dict()
     response = db.table("messages").insert(message_data).execute()
-    res_chat = db.table('chat_histories').select('messages').eq('chat_id', chat_id).limit(1).execute()
-    current_docs = res_chat.data[0]['messages']
-    updated_docs = current_docs + [message_id]
-    db.table('chat_histories').update({'messages': updated_docs, 'last_message': message_data}).eq('chat_id', chat_id).execute()
+    append_to_array('chat_histories', 'chat_id', chat_id, 'messages', message_id, extra={'last_message': message_data})
     if len(response.data) > 0:
         return message_id
     else:
@@ -0,0 +1,386 @@
+import argparse
+import base64
+import heapq
+import json
+import os
+import re
+import tempfile
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+import numpy as np
+import streamlit as st
+from model import Chunk
+from utils.cache import MISSING, get_cache
+from utils.data import CACHE_DIR, initialize_supabase
+from utils.local import register_local_function
+
+db = initialize_supabase()
+
+CHUNK_COLUMNS = 'chunk_id, document_id, page, position, text, embedding, embedding_packed'
+CHUNK_PAGE_SIZE = 1000
+CHUNK_DOCUMENT_BATCH = 20
+CHUNK_CACHE_SIZE = 512
+EMBEDDING_DTYPE = np.float32
+EMBEDDING_VERSION = 'all-MiniLM-L6-v2'
+VECTOR_CACHE_DIR = os.path.join(CACHE_DIR, 'vectors', EMBEDDING_VERSION)
+WIRE_FORMATS = {'f16': '<f2', 'f32': '<f4'}
+PACK_BATCH_SIZE = 500
+
+class ChunkView:
+    __slots__ = ('chunks', 'row')
+
+    def __init__(self, chunks: "ChunkSet", row: int):
+        self.chunks = chunks
+        self.row = row
+
+    @property
+    def text(self) -> str:
+        return self.chunks.chunk_text(self.row)
+
+    @property
+    def embedding(self) -> np.ndarray:
+        return self.chunks.embedding(self.row)
+
+    @property
+    def page(self) -> int:
+        return int(self.chunks.pages[self.row])
+
+    @property
+    def position(self) -> int:
+        return int(self.chunks.positions[self.row])
+
+class ChunkSet(Sequence):
+    """Read-only columnar chunks: one text buffer with offsets, int32 pages and positions, float32 embedding blocks.
+
+    Embeddings are kept as the per-document matrices they were loaded as, so memory-mapped blocks are searched
+    in place instead of being copied into one matrix.
+    """
+
+    def __init__(self, text: str, offsets: np.ndarray, pages: np.ndarray, positions: np.ndarray, embeddings: Union[np.ndarray, Sequence[np.ndarray]]):
+        self.text = text
+        self.offsets = frozen(offsets)
+        self.pages = frozen(pages)
+        self.positions = frozen(positions)
+        self.blocks = (frozen(embeddings),) if isinstance(embeddings, np.ndarray) else tuple(frozen(block) for block in embeddings)
+        self.block_starts = text_offsets([len(block) for block in self.blocks])
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict], ordered: bool = False) -> "ChunkSet":
+        if not ordered:
+            rows = sorted(rows, key=lambda row: (row['page'], row['position']))
+        embeddings = np.array([row_embedding(row) for row in rows], dtype=EMBEDDING_DTYPE)
+        return cls(
+            text=''.join(row['text'] for row in rows),
+            offsets=text_offsets([len(row['text']) for row in rows]),
+            pages=np.array([row['page'] for row in rows], dtype=np.int32),
+            positions=np.array([row['position'] for row in rows], dtype=np.int32),
+            embeddings=embeddings.reshape(len(rows), -1) if rows else empty_embeddings()
+        )
+
+    @classmethod
+    def from_matches(cls, rows: List[Dict]) -> "ChunkSet":
+        """Ranked search results without embeddings, as returned by match_chunks; they can be read but not searched again."""
+        return cls(
+            text=''.join(row['text'] for row in rows),
+            offsets=text_offsets([len(row['text']) for row in rows]),
+            pages=np.array([row['page'] for row in rows], dtype=np.int32),
+            positions=np.array([row['position'] for row in rows], dtype=np.int32),
+            embeddings=np.zeros((len(rows), 0), dtype=EMBEDDING_DTYPE)
+        )
+
+    @classmethod
+    def concat(cls, sets: List["ChunkSet"]) -> "ChunkSet":
+        sets = [chunks for chunks in sets if len(chunks)]
+        if len(sets) == 1:
+            return sets[0]
+        if not sets:
+            return cls('', text_offsets([]), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), empty_embeddings())
+        return cls(
+            text=''.join(chunks.text for chunks in sets),
+            offsets=text_offsets(np.concatenate([np.diff(chunks.offsets) for chunks in sets])),
+            pages=np.concatenate([chunks.pages for chunks in sets]),
+            positions=np.concatenate([chunks.positions for chunks in sets]),
+            embeddings=[block for chunks in sets for block in chunks.blocks]
+        )
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def __getitem__(self, item: Union[int, slice]) -> Union[ChunkView, "ChunkSet"]:
+        if isinstance(item, slice):
+            return self.take(np.arange(len(self))[item])
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError(item)
+        return ChunkView(self, item)
+
+    def __iter__(self) -> Iterator[ChunkView]:
+        return (ChunkView(self, row) for row in range(len(self)))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.text) + self.offsets.nbytes + self.pages.nbytes + self.positions.nbytes + sum(block.nbytes for block in self.blocks)
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """Embedding matrix; copies when the set spans several blocks."""
+        return self.blocks[0] if len(self.blocks) == 1 else np.vstack(self.blocks)
+
+    def embedding(self, row: int) -> np.ndarray:
+        block = int(np.searchsorted(self.block_starts, row, side='right')) - 1
+        return self.blocks[block][row - self.block_starts[block]]
+
+    def chunk_text(self, row: int) -> str:
+        return self.text[self.offsets[row]:self.offsets[row + 1]]
+
+    def take_embeddings(self, rows: np.ndarray) -> np.ndarray:
+        if not len(rows):
+            return empty_embeddings()
+        if len(self.blocks) == 1:
+            return self.blocks[0][rows]
+        embeddings = np.empty((len(rows), self.blocks[0].shape[1]), dtype=EMBEDDING_DTYPE)
+        owners = np.searchsorted(self.block_starts, rows, side='right') - 1
+        for block in np.unique(owners):
+            selected = owners == block
+            embeddings[selected] = self.blocks[block][rows[selected] - self.block_starts[block]]
+        return embeddings
+
+    def take(self, rows: np.ndarray) -> "ChunkSet":
+        rows = np.asarray(rows, dtype=np.int64)
+        return ChunkSet(
+            text=''.join(self.chunk_text(row) for row in rows),
+            offsets=text_offsets(self.offsets[rows + 1] - self.offsets[rows]),
+            pages=self.pages[rows],
+            positions=self.positions[rows],
+            embeddings=self.take_embeddings(rows)
+        )
+
+    def where_page(self, page: int) -> "ChunkSet":
+        return self.take(np.flatnonzero(self.pages == page))
+
+    def page_range(self, first: int, last: int) -> "ChunkSet":
+        return self.take(np.flatnonzero((self.pages >= first) & (self.pages <= last)))
+
+    def search(self, query_embedding: np.ndarray, count: int) -> "ChunkSet":
+        if len(self) == 0:
+            return self
+        similarities = np.concatenate([block @ query_embedding for block in self.blocks])
+        count = min(count, len(self))
+        best_indices = np.argpartition(similarities, -count)[-count:]
+        return self.take(best_indices[np.argsort(similarities[best_indices])[::-1]])
+
+def frozen(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
+
+def empty_embeddings() -> np.ndarray:
+    return np.zeros((0, 0), dtype=EMBEDDING_DTYPE)
+
+def text_offsets(lengths) -> np.ndarray:
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+def parse_embedding(value) -> List[float]:
+    return json.loads(value) if isinstance(value, str) else value
+
+def wire_format() -> str:
+    value = os.environ.get("NDOLE_EMBEDDING_FORMAT")
+    if not value:
+        try:
+            value = st.secrets.get("embeddings", {}).get("wire_format", "json")
+        except FileNotFoundError:
+            value = "json"
+    return value
+
+def encode_embedding(embedding, fmt: str) -> str:
+    return f"{fmt}:" + base64.b64encode(np.asarray(embedding, dtype=WIRE_FORMATS[fmt]).tobytes()).decode('ascii')
+
+def decode_embedding(packed: str) -> np.ndarray:
+    fmt, data = packed.split(':', 1)
+    return np.frombuffer(base64.b64decode(data), dtype=WIRE_FORMATS[fmt]).astype(EMBEDDING_DTYPE)
+
+def row_embedding(row: Dict) -> np.ndarray:
+    if row.get('embedding_packed'):
+        return decode_embedding(row['embedding_packed'])
+    if row.get('embedding') is None:
+        raise ValueError(f"Chunk {row.get('chunk_id')} has no embedding")
+    return np.asarray(parse_embedding(row['embedding']), dtype=EMBEDDING_DTYPE)
+
+def embedding_columns(embedding: List[float]) -> Dict:
+    fmt = wire_format()
+    if fmt in WIRE_FORMATS:
+        return {'embedding': None, 'embedding_packed': encode_embedding(embedding, fmt)}
+    return {'embedding': embedding}
+
+def fetch_chunk_rows(document_ids: List[str]) -> Dict[str, List[Dict]]:
+    rows = {document_id: [] for document_id in document_ids}
+    last_chunk_id = None
+    while True:
+        query = db.table('chunks').select(CHUNK_COLUMNS).in_('document_id', document_ids)
+        if last_chunk_id is not None:
+            query = query.gt('chunk_id', last_chunk_id)
+        response = query.order('chunk_id').limit(CHUNK_PAGE_SIZE).execute()
+        for row in response.data:
+            rows[row['document_id']].append(row)
+        if len(response.data) < CHUNK_PAGE_SIZE:
+            return rows
+        last_chunk_id = response.data[-1]['chunk_id']
+
+def vector_paths(document_id: str) -> Dict[str, str]:
+    name = re.sub(r'[^A-Za-z0-9_-]', '_', document_id)
+    return {'embeddings': os.path.join(VECTOR_CACHE_DIR, f"{name}.npy"), 'meta': os.path.join(VECTOR_CACHE_DIR, f"{name}.json")}
+
+def write_atomic(path: str, write) -> None:
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            write(f)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def save_to_disk(document_id: str, chunks: ChunkSet) -> None:
+    if not len(chunks):
+        return
+    paths = vector_paths(document_id)
+    meta = {
+        'count': len(chunks),
+        'dim': chunks.embeddings.shape[1],
+        'lengths': np.diff(chunks.offsets).tolist(),
+        'pages': chunks.pages.tolist(),
+        'positions': chunks.positions.tolist(),
+        'text': chunks.text
+    }
+    try:
+        os.makedirs(VECTOR_CACHE_DIR, exist_ok=True)
+        write_atomic(paths['embeddings'], lambda f: np.save(f, np.ascontiguousarray(chunks.embeddings)))
+        write_atomic(paths['meta'], lambda f: f.write(json.dumps(meta).encode('utf-8')))
+    except OSError as e:
+        print(f"Vector cache write error : {e}")
+
+def load_from_disk(document_id: str) -> Optional[ChunkSet]:
+    paths = vector_paths(document_id)
+    if not os.path.exists(paths['meta']):
+        return None
+    try:
+        with open(paths['meta'], encoding='utf-8') as f:
+            meta = json.load(f)
+        embeddings = np.load(paths['embeddings'], mmap_mode='r')
+    except (OSError, ValueError) as e:
+        print(f"Vector cache read error : {e}")
+        return None
+    if embeddings.shape != (meta['count'], meta['dim']) or embeddings.dtype != EMBEDDING_DTYPE:
+        return None
+    return ChunkSet(
+        text=meta['text'],
+        offsets=text_offsets(meta['lengths']),
+        pages=np.array(meta['pages'], dtype=np.int32),
+        positions=np.array(meta['positions'], dtype=np.int32),
+        embeddings=embeddings
+    )
+
+def chunk_cache():
+    return get_cache("document_chunks", ttl=None, maxsize=CHUNK_CACHE_SIZE)
+
+def load_document_chunks(document_ids: List[str]) -> Dict[str, ChunkSet]:
+    cache = chunk_cache()
+    loaded = {}
+    for document_id in dict.fromkeys(document_ids):
+        chunks = cache.get(document_id)
+        if chunks is not MISSING:
+            loaded[document_id] = chunks
+    missing = []
+    for document_id in dict.fromkeys(document_ids):
+        if document_id in loaded:
+            continue
+        chunks = load_from_disk(document_id)
+        if chunks is None:
+            missing.append(document_id)
+        else:
+            loaded[document_id] = chunks
+            cache.set(document_id, chunks)
+    for start in range(0, len(missing), CHUNK_DOCUMENT_BATCH):
+        for document_id, rows in fetch_chunk_rows(missing[start:start + CHUNK_DOCUMENT_BATCH]).items():
+            loaded[document_id] = ChunkSet.from_rows(rows)
+            cache.set(document_id, loaded[document_id])
+            save_to_disk(document_id, loaded[document_id])
+    return loaded
+
+def prime_document_chunks(document_id: str, chunks: List[Chunk]) -> None:
+    rows = [{'page': chunk.page, 'position': chunk.position, 'text': chunk.text, 'embedding': chunk.embedding} for chunk in chunks]
+    document_chunks = ChunkSet.from_rows(rows)
+    chunk_cache().set(document_id, document_chunks)
+    save_to_disk(document_id, document_chunks)
+
+def forget_document_chunks(document_id: str) -> None:
+    chunk_cache().invalidate(document_id)
+    for path in vector_paths(document_id).values():
+        if os.path.exists(path):
+            os.remove(path)
+
+def live_document_ids(document_ids: List[str]) -> List[str]:
+    live = set()
+    for start in range(0, len(document_ids), CHUNK_DOCUMENT_BATCH):
+        response = db.table('documents').select('doc_id').in_('doc_id', document_ids[start:start + CHUNK_DOCUMENT_BATCH]).eq('is_deleted', False).execute()
+        live.update(row['doc_id'] for row in response.data)
+    return [document_id for document_id in document_ids if document_id in live]
+
+def assemble_chunks(document_ids: List[str]) -> ChunkSet:
+    document_ids = live_document_ids(document_ids)
+    loaded = load_document_chunks(document_ids)
+    return ChunkSet.concat([loaded[document_id] for document_id in document_ids])
+
+def match_chunks(client, params: Dict) -> List[Dict]:
+    """Embedded-backend stand-in for the match_chunks database function: exact inner-product top-k, scanned page by page."""
+    query_embedding = np.asarray(params['p_query_embedding'], dtype=EMBEDDING_DTYPE)
+    count = params.get('p_match_count', 20)
+    best = []
+    last_chunk_id = ''
+    while True:
+        query = client.table('chunks').select(CHUNK_COLUMNS).in_('document_id', params['p_document_ids']).gt('chunk_id', last_chunk_id)
+        if params.get('p_page') is not None:
+            query = query.eq('page', params['p_page'])
+        response = query.order('chunk_id').limit(CHUNK_PAGE_SIZE).execute()
+        for row in response.data:
+            if row.get('embedding') is not None or row.get('embedding_packed'):
+                score = float(row_embedding(row) @ query_embedding)
+                item = (score, row['chunk_id'], {key: row[key] for key in ('chunk_id', 'document_id', 'page', 'position', 'text')})
+                if len(best) < count:
+                    heapq.heappush(best, item)
+                else:
+                    heapq.heappushpop(best, item)
+        if len(response.data) < CHUNK_PAGE_SIZE:
+            break
+        last_chunk_id = response.data[-1]['chunk_id']
+    return [dict(match, score=score) for score, _, match in sorted(best, key=lambda item: item[0], reverse=True)]
+
+register_local_function('match_chunks', match_chunks)
+
+def pack_stored_embeddings(fmt: str, batch_size: int = PACK_BATCH_SIZE, dry_run: bool = False) -> Dict[str, int]:
+    report = {'scanned': 0, 'packed': 0, 'bytes_before': 0, 'bytes_after': 0}
+    last_chunk_id = ''
+    while True:
+        response = db.table('chunks').select('chunk_id, embedding, embedding_packed').gt('chunk_id', last_chunk_id).order('chunk_id').limit(batch_size).execute()
+        for row in response.data:
+            report['scanned'] += 1
+            if row['embedding_packed'] or row['embedding'] is None:
+                continue
+            packed = encode_embedding(parse_embedding(row['embedding']), fmt)
+            report['packed'] += 1
+            report['bytes_before'] += len(json.dumps(row['embedding']))
+            report['bytes_after'] += len(packed)
+            if not dry_run:
+                db.table('chunks').update({'embedding_packed': packed, 'embedding': None}).eq('chunk_id', row['chunk_id']).execute()
+        if len(response.data) < batch_size:
+            return report
+        last_chunk_id = response.data[-1]['chunk_id']
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rewrite JSON chunk embeddings into the packed wire format.")
+    parser.add_argument("--format", choices=sorted(WIRE_FORMATS), default="f16")
+    parser.add_argument("--batch-size", type=int, default=PACK_BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    print(pack_stored_embeddings(args.format, args.batch_size, args.dry_run))
@@ -1,9 +1,67 @@
+import os
 import streamlit as st
-from supabase import create_client, Client
+from typing import Any, Dict, Optional, Protocol
+from postgrest.exceptions import APIError
+from supabase import Client, ClientOptions, create_client
+from utils.embedded import EmbeddedClient
+from utils.monitor import monitor_client
+from utils.transport import create_http_client
+
+MISSING_FUNCTION_CODE = "PGRST202"
+CACHE_DIR = os.environ.get("NDOLE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "ndole"))
+
+class Backend(Protocol):
+    """Client surface shared by the Supabase and embedded backends: table(), rpc(), storage and auth."""
+    storage: Any
+    auth: Any
+
+    def table(self, name: str) -> Any: ...
+
+    def rpc(self, name: str, params: Dict[str, Any]) -> Any: ...
 
 @st.cache_resource
-def initialize_supabase() -> Client:
+def initialize_supabase() -> Backend:
+    backend = os.environ.get("NDOLE_BACKEND") or st.secrets.get("storage", {}).get("backend", "supabase")
+    if backend == "sqlite":
+        path = os.environ.get("NDOLE_SQLITE_PATH") or st.secrets.get("storage", {}).get("path", os.path.join(CACHE_DIR, "ndole.db"))
+        return monitor_client(EmbeddedClient(path))
     url = st.secrets["supabase"]["url"]
     key = st.secrets["supabase"]["api_key"]
-    supabase_client = create_client(url, key)
-    return supabase_client
+    return monitor_client(create_supabase_client(url, key))
+
+def create_supabase_client(url: str, key: str) -> Client:
+    """Supabase client whose PostgREST, storage, functions and auth clients all share one pooled transport.
+
+    ClientOptions.httpx_client needs supabase 2.16 or later; older releases do not accept it.
+    """
+    return create_client(url, key, options=ClientOptions(httpx_client=create_http_client()))
+
+def call_function(name: str, params: Dict[str, Any]) -> Any:
+    db = initialize_supabase()
+    try:
+        return db.rpc(name, params).execute().data
+    except APIError as e:
+        if e.code == MISSING_FUNCTION_CODE:
+            print(f"Database function {name} is missing, apply the supabase migrations : {e}")
+        raise
+
+def append_to_array(table: str, key_column: str, key: str, column: str, item: Any, unique: bool = True, extra: Optional[Dict[str, Any]] = None) -> bool:
+    return bool(call_function('array_append_item', {
+        'p_table': table,
+        'p_key_column': key_column,
+        'p_key': key,
+        'p_column': column,
+        'p_item': item,
+        'p_unique': unique,
+        'p_set': extra
+    }))
+
+def remove_from_array(table: str, key_column: str, key: str, column: str, item: Any, extra: Optional[Dict[str, Any]] = None) -> bool:
+    return bool(call_function('array_remove_item', {
+        'p_table': table,
+        'p_key_column': key_column,
+        'p_key': key,
+        'p_column': column,
+        'p_item': item,
+        'p_set': extra
+    }))
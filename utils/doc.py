@@ -2,14 +2,35 @@ import os
 import uuid
 from datetime import datetime
 import tempfile
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Union
 import pymupdf as pdf
-from model import Document, DocumentRepository, Access
+from model import Document, DocumentRepository, RepositoryPage, RepositorySummary, Access, UserProfileLite
 from utils.embedding import generate_embeddings
-from utils.data import initialize_supabase
+from utils.cache import MISSING, cached, get_cache
+from utils.chunks import embedding_columns, prime_document_chunks
+from utils.data import append_to_array, call_function, initialize_supabase, remove_from_array
+from utils.index import invalidate_document, invalidate_repository_index
+from utils.monitor import bind
+from utils.user import USER_PROFILE_COLUMNS, get_user_profile, invalidate_user
 
 db = initialize_supabase()
 
+ACCESS_TYPES = ['accesses', 'likes', 'dislikes', 'bookmarks', 'shares']
+REPOSITORY_DERIVED_FIELDS = {'access_count', 'like_count', 'dislike_count', 'bookmark_count', 'share_count', 'engagement'}
+REPOSITORY_COLUMNS = 'repo_id, name, description, is_public, is_deleted, owner_id, created_at, updated_at, categories, documents, banner, number_of_indexed, related_repositories, access_count, like_count, dislike_count, bookmark_count, share_count'
+CHUNK_INSERT_BATCH = 200
+SIGNED_URL_EXPIRY = 24 * 3600
+DOWNLOAD_URL_EXPIRY = 3600
+SIGNED_URL_REFRESH_MARGIN = 3600
+IN_FILTER_BATCH = 100
+PREFETCH_WORKERS = 8
+PUBLIC_PAGE_SIZE = 20
+PUBLIC_COUNT_CAP = 1000
+REPOSITORY_SUMMARY_COLUMNS = 'repo_id, name, description, is_public, owner_id, created_at, updated_at, categories, banner, number_of_indexed, document_count, access_count, like_count, dislike_count, bookmark_count, share_count'
+
+prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+
 def create_document_repository(name: str, description: str, owner_id: str, categories: List[str], is_public: bool) -> str:
     repo_id = str(uuid.uuid4())
     repo = DocumentRepository(
@@ -20,22 +41,23 @@ def create_document_repository(name: str, description: str, owner_id: str, categ
         categories=categories,
         is_public=is_public
     )
-    repo_data = repo.dict()
+    repo_data = repo.dict(exclude=REPOSITORY_DERIVED_FIELDS)
     response = db.table('document_repositories').insert(repo_data).execute()
-    res_user = db.table('users').select('repositories').eq('user_id', owner_id).limit(1).execute()
-    current_docs = res_user.data[0]['repositories']
-    updated_docs = current_docs + [repo_id]
-    db.table('users').update({'repositories': updated_docs}).eq('user_id', owner_id).execute()
+    append_to_array('users', 'user_id', owner_id, 'repositories', repo_id)
+    invalidate_user(owner_id)
     if len(response.data) > 0:
         return repo_id
     else:
         raise Exception("Failed to create the document repository")
 
+@cached("document_repository", ttl=60, maxsize=512, copy=True)
 def get_document_repository(repo_id: str) -> Optional[DocumentRepository]:
-    response = db.table('document_repositories').select('*').eq('repo_id', repo_id).eq('is_deleted', False).limit(1).execute()
+    response = db.table('repository_summaries').select(REPOSITORY_COLUMNS).eq('repo_id', repo_id).eq('is_deleted', False).limit(1).execute()
     if not response.data or len(response.data) == 0:
         return None
-    repo_data = response.data[0]
+    return repository_from_row(response.data[0])
+
+def repository_from_row(repo_data: Dict) -> DocumentRepository:
     return DocumentRepository(
         repo_id=repo_data['repo_id'],
         name=repo_data['name'],
@@ -48,59 +70,69 @@ def get_document_repository(repo_id: str) -> Optional[DocumentRepository]:
         documents=repo_data["documents"],
         is_deleted=repo_data["is_deleted"],
         banner=repo_data["banner"],
-        accesses=repo_data['accesses'],
-        likes=repo_data['likes'],
-        dislikes=repo_data['dislikes'],
-        bookmarks=repo_data['bookmarks'],
-        shares=repo_data['shares'],
         number_of_indexed=repo_data['number_of_indexed'],
-        related_repositories=repo_data['related_repositories']
+        related_repositories=repo_data['related_repositories'],
+        access_count=repo_data['access_count'],
+        like_count=repo_data['like_count'],
+        dislike_count=repo_data['dislike_count'],
+        bookmark_count=repo_data['bookmark_count'],
+        share_count=repo_data['share_count']
     )
 
+@cached("repository_engagement", ttl=120, maxsize=8192)
+def get_repository_engagement(repo_id: str, user_id: str) -> Dict[str, str]:
+    response = db.table('engagement_state').select('access_type, last_at').eq('repo_id', repo_id).eq('user_id', user_id).eq('active', True).execute()
+    return {row['access_type']: row['last_at'] for row in response.data}
+
+def invalidate_repository(repo_id: str) -> None:
+    get_document_repository.invalidate(repo_id)
+    get_original_repo.invalidate(repo_id)
+
 def get_list_of_repositories(repo_ids: List[str]) -> List[DocumentRepository]:
+    missing = [repo_id for repo_id in repo_ids if not get_document_repository.is_cached(repo_id)]
+    not_found = set(missing)
+    for start in range(0, len(missing), IN_FILTER_BATCH):
+        batch = missing[start:start + IN_FILTER_BATCH]
+        response = db.table('repository_summaries').select(REPOSITORY_COLUMNS).in_('repo_id', batch).eq('is_deleted', False).execute()
+        for repo_data in response.data:
+            get_document_repository.prime(repository_from_row(repo_data), repo_data['repo_id'])
+            not_found.discard(repo_data['repo_id'])
     repositories = []
     for repo_id in repo_ids:
+        if repo_id in not_found:
+            continue
         repository = get_document_repository(repo_id)
         if repository:
             repositories.append(repository)
     return repositories
 
-def get_public_repositories(page: int, user_id: str, query: str = None) -> List[DocumentRepository]:
-    if query:
-        response = db.table('document_repositories').select('*').eq('is_public', True).eq('is_deleted', False).neq('owner_id', user_id).gte('name', query).range(20*(page-1), 20*page).execute()
-    else:
-        response = db.table('document_repositories').select('*').eq('is_public', True).eq('is_deleted', False).neq('owner_id', user_id).range(20*(page-1), 20*page).execute()  
-    repositories = []
-    for repo_data in response.data:
-        repository = DocumentRepository(
-            repo_id=repo_data['repo_id'],
-            name=repo_data['name'],
-            description=repo_data['description'],
-            owner_id=repo_data['owner_id'],
-            is_public=repo_data['is_public'],
-            categories=repo_data['categories'],
-            created_at=repo_data['created_at'],
-            updated_at=repo_data['updated_at'],
-            documents=repo_data["documents"],
-            is_deleted=repo_data["is_deleted"],
-            banner=repo_data["banner"],
-            accesses=repo_data['accesses'],
-            likes=repo_data['likes'],
-            dislikes=repo_data['dislikes'],
-            bookmarks=repo_data['bookmarks'],
-            shares=repo_data['shares'],
-            number_of_indexed=repo_data['number_of_indexed'],
-            related_repositories=repo_data['related_repositories']
-        )
-        repositories.append(repository)
-    return repositories
+def get_public_repositories(user_id: str, query: str = None, cursor: Optional[Dict] = None) -> RepositoryPage:
+    query = query.strip() if query else None
+    result = call_function('search_public_repositories', {
+        'p_user_id': user_id,
+        'p_query': query or None,
+        'p_cursor': cursor,
+        'p_limit': PUBLIC_PAGE_SIZE + 1,
+        'p_count_cap': PUBLIC_COUNT_CAP
+    })
+    rows = result['items']
+    next_cursor = None
+    if len(rows) > PUBLIC_PAGE_SIZE:
+        rows = rows[:PUBLIC_PAGE_SIZE]
+        next_cursor = {'key': rows[-1]['rank'] if query else rows[-1]['created_at'], 'repo_id': rows[-1]['repo_id']}
+    return RepositoryPage(
+        items=[RepositorySummary(**repo_data) for repo_data in rows],
+        next_cursor=next_cursor,
+        total_estimate=result['total_estimate']
+    )
 
 def update_document_repository(repo_id: str, name: str = None, description: str = None, 
                               is_public: bool = None, categories: List[str] = None, is_deleted: bool = None,
                               documents: List[str] = None, is_indexed: bool = None) -> bool:
-    response = db.table('document_repositories').select('*').eq('repo_id', repo_id).limit(1).execute()
+    response = db.table('document_repositories').select('number_of_indexed, documents').eq('repo_id', repo_id).limit(1).execute()
     if not response.data or len(response.data) == 0:
         return False
+    current_documents = response.data[0]['documents'] or []
     update_data = {'updated_at': datetime.now().isoformat()}
     if name:
         update_data['name'] = name
@@ -116,62 +148,30 @@ def update_document_repository(repo_id: str, name: str = None, description: str
         update_data['documents'] = documents
     if is_indexed is not None:
         if is_indexed:
-            update_data["number_of_indexed"] += 1
+            update_data["number_of_indexed"] = response.data[0]['number_of_indexed'] + 1
         else:
-            update_data['number_of_indexed'] -=1
+            update_data['number_of_indexed'] = response.data[0]['number_of_indexed'] - 1
     response = db.table('document_repositories').update(update_data).eq('repo_id', repo_id).execute()
+    invalidate_repository(repo_id)
+    if is_deleted or documents:
+        invalidate_repository_index(current_documents)
     return len(response.data) > 0
 
+def record_repository_access(repo_id: str, access: Access, access_type: str) -> Optional[Dict[str, str]]:
+    if access_type not in ACCESS_TYPES:
+        return None
+    try:
+        state = call_function('record_engagement', {'p_repo_id': repo_id, 'p_user_id': access.access_id, 'p_access_type': access_type})
+    except Exception as e:
+        print(f"Error recording {access_type} for repository {repo_id} : {e}")
+        return None
+    if state is not None:
+        invalidate_repository(repo_id)
+        get_repository_engagement.prime(state, repo_id, access.access_id)
+    return state
+
 def update_repository_access(repo_id: str, access: Access, access_type: str) -> bool:
-    response = db.table('document_repositories').select('*').eq('repo_id', repo_id).limit(1).execute()
-    if not response.data or len(response.data) == 0 or access_type not in ['accesses', 'likes', 'dislikes', 'bookmarks', 'shares']:
-        return False
-    if response.data[0]['owner_id'] == access.access_id:
-        return False
-    repo_data = response.data[0]
-    update_data = {
-        'accesses': repo_data['accesses'], 
-        'likes': repo_data['likes'], 
-        'dislikes': repo_data['dislikes'], 
-        'bookmarks': repo_data['bookmarks'], 
-        'shares': repo_data['shares']
-    }
-    if access_type == 'accesses':
-        update_data['accesses'].append(access.dict())
-    elif access_type == 'likes':
-        is_like = False
-        for dislike in update_data['dislikes']:
-            if dislike["access_id"] == access.access_id:
-                update_data['dislikes'].remove(dislike)
-        for like in update_data['likes']:
-            if like["access_id"] == access.access_id:
-                is_like = True
-                update_data['likes'].remove(like)
-        if not is_like:
-            update_data['likes'].append(access.dict())
-    elif access_type == 'dislikes':
-        is_dislike = False
-        for like in update_data['likes']:
-            if like["access_id"] == access.access_id:
-                update_data['likes'].remove(like)
-        for dislike in update_data['dislikes']:
-            if dislike["access_id"] == access.access_id:
-                is_dislike = True
-                update_data['dislikes'].remove(dislike)
-        if not is_dislike:
-            update_data['dislikes'].append(access.dict())
-    elif access_type == 'bookmarks':
-        is_bookmark = False
-        for bookmark in update_data['bookmarks']:
-            if bookmark["access_id"] == access.access_id:
-                is_bookmark = True
-                update_data['bookmarks'].remove(bookmark)
-        if not is_bookmark:
-            update_data['bookmarks'].append(access.dict())
-    elif access_type == 'shares':
-        update_data['shares'].append(access.dict())
-    update_response = db.table('document_repositories').update(update_data).eq('repo_id', repo_id).execute()
-    return len(update_response.data) > 0
+    return record_repository_access(repo_id, access, access_type) is not None
 
 def update_repository_banner(owner_id: str, repo_id: str, file_path:str) -> bool:
     with open(file_path, 'rb') as f:
@@ -194,15 +194,11 @@ def update_repository_banner(owner_id: str, repo_id: str, file_path:str) -> bool
         file_options=file_options
     )
     update_response = db.table('document_repositories').update({'banner': storage_path}).eq('repo_id', repo_id).execute()
+    invalidate_repository(repo_id)
     return len(update_response.data) > 0
 
 def load_repository_banner(banner: str) -> Optional[str]:
-    banner = banner.lstrip('banners/')
-    url = db.storage.from_('banners').create_signed_url(
-        path=banner,
-        expires_in=3600
-    )
-    return url['signedURL']
+    return sign_storage_paths('banners', [banner]).get(banner)
 
 def upload_document(file_data: bytes, filename: str, repo_id: str, owner_id: str, title: str = None, description: str = "", category: str = None) -> Optional[str]:
     if not filename.lower().endswith('.pdf'):
@@ -251,22 +247,30 @@ def upload_document(file_data: bytes, filename: str, repo_id: str, owner_id: str
     )
     doc_data = doc.dict()
     db.table('documents').insert(doc_data).execute()
-    res_repo = db.table('document_repositories').select('documents').eq('repo_id', repo_id).limit(1).execute()
-    current_docs = res_repo.data[0]['documents']
-    updated_docs = current_docs + [doc_id]
-    db.table('document_repositories').update({'documents': updated_docs}).eq('repo_id', repo_id).execute()
-    for i, chunk in enumerate(chunks):
-        chunk_id = f"doc_{doc_id}_chunk_{i}"
-        db.table('chunks').insert({
-            'chunk_id': chunk_id,
-            'document_id': doc_id,
-            'position': chunk.position,
-            'page': chunk.page,
-            'text': chunk.text,
-            'embedding': chunk.embedding
-        }).execute()
+    add_document_to_repository(repo_id, doc_id)
+    chunk_rows = [{
+        'chunk_id': f"doc_{doc_id}_chunk_{i}",
+        'document_id': doc_id,
+        'position': chunk.position,
+        'page': chunk.page,
+        'text': chunk.text,
+        **embedding_columns(chunk.embedding)
+    } for i, chunk in enumerate(chunks)]
+    for start in range(0, len(chunk_rows), CHUNK_INSERT_BATCH):
+        db.table('chunks').insert(chunk_rows[start:start + CHUNK_INSERT_BATCH]).execute()
+    prime_document_chunks(doc_id, chunks)
     return doc_id
 
+def add_document_to_repository(repo_id: str, doc_id: str) -> bool:
+    success = append_to_array('document_repositories', 'repo_id', repo_id, 'documents', doc_id, extra={'updated_at': datetime.now().isoformat()})
+    invalidate_repository(repo_id)
+    return success
+
+def remove_document_from_repository(repo_id: str, doc_id: str) -> bool:
+    success = remove_from_array('document_repositories', 'repo_id', repo_id, 'documents', doc_id, extra={'updated_at': datetime.now().isoformat()})
+    invalidate_repository(repo_id)
+    return success
+
 def update_document(doc_id: str, title: str = None, description: str = None, 
                    category: str = None, related_documents: List[str] = None, is_deleted: bool = None) -> bool:
     response = db.table('documents').select('*').eq('doc_id', doc_id).limit(1).execute()
@@ -284,13 +288,17 @@ def update_document(doc_id: str, title: str = None, description: str = None,
     if is_deleted is not None:
         update_data['is_deleted'] = is_deleted
     update_response = db.table('documents').update(update_data).eq('doc_id', doc_id).execute()
+    if is_deleted:
+        invalidate_document(doc_id)
     return len(update_response.data) > 0
 
 def get_document(doc_id: str) -> Optional[Document]:
     response = db.table('documents').select('*').eq('doc_id', doc_id).eq('is_deleted', False).limit(1).execute()
     if not response.data or len(response.data) == 0:
         return None
-    doc_data = response.data[0]
+    return document_from_row(response.data[0])
+
+def document_from_row(doc_data: Dict) -> Document:
     return Document(
         doc_id=doc_data['doc_id'],
         title=doc_data['title'],
@@ -310,12 +318,11 @@ def get_document(doc_id: str) -> Optional[Document]:
     )
 
 def get_list_of_documents(doc_ids: List[str]) -> List[Document]:
-    documents = []
-    for doc_id in doc_ids:
-        document = get_document(doc_id)
-        if document:
-            documents.append(document)
-    return documents
+    documents = {}
+    for start in range(0, len(doc_ids), IN_FILTER_BATCH):
+        response = db.table('documents').select('*').in_('doc_id', doc_ids[start:start + IN_FILTER_BATCH]).eq('is_deleted', False).execute()
+        documents.update({doc_data['doc_id']: document_from_row(doc_data) for doc_data in response.data})
+    return [documents[doc_id] for doc_id in doc_ids if doc_id in documents]
 
 def update_document_cover(owner_id: str, doc_id: str, file_path:str) -> bool:
     with open(file_path, 'rb') as f:
@@ -338,26 +345,91 @@ def update_document_cover(owner_id: str, doc_id: str, file_path:str) -> bool:
     return len(update_response.data) > 0
 
 def load_document_cover(cover: str) -> Optional[str]:
-    cover = cover.lstrip('covers/')
-    url = db.storage.from_('covers').create_signed_url(
-        path=cover,
-        expires_in=3600
-    )
-    return url["signedURL"]
+    return sign_storage_paths('covers', [cover]).get(cover)
 
 def get_document_download_url(file_path: str) -> Optional[str]:
-    file_path = file_path.lstrip('documents/')
-    url = db.storage.from_('documents').create_signed_url(
-        path=file_path,
-        expires_in=3600
-    )
-    return url["signedURL"]
+    url = db.storage.from_('documents').create_signed_url(file_path.removeprefix('documents/'), DOWNLOAD_URL_EXPIRY)
+    return url.get('signedURL') or url.get('signedUrl')
+
+def sign_storage_paths(bucket: str, paths: List[str]) -> Dict[str, str]:
+    """Long-lived signed URLs for cover and banner images, cached process-wide; private documents are signed per request."""
+    signed_urls = get_cache("signed_url", ttl=SIGNED_URL_EXPIRY - SIGNED_URL_REFRESH_MARGIN, maxsize=8192)
+    keys = {path: path.removeprefix(f"{bucket}/") for path in paths if path}
+    urls = {}
+    missing = set()
+    for path, key in keys.items():
+        url = signed_urls.get((bucket, key))
+        if url is MISSING:
+            missing.add(key)
+        else:
+            urls[path] = url
+    if missing:
+        signed = {}
+        response = db.storage.from_(bucket).create_signed_urls(list(missing), SIGNED_URL_EXPIRY)
+        for item in response:
+            url = item.get('signedURL') or item.get('signedUrl')
+            if url and not item.get('error'):
+                signed[item['path']] = url
+                signed_urls.set((bucket, item['path']), url)
+        urls.update({path: signed[key] for path, key in keys.items() if key in signed})
+    return urls
 
 def get_owner_name(user_id: str) -> Optional[str]:
-    response = db.table('users').select('username').eq('user_id', user_id).limit(1).execute()
-    return response.data[0]['username'] if response.data else None
+    profile = get_user_profile(user_id)
+    return profile.username if profile else None
 
+@cached("original_repo", ttl=300, maxsize=4096)
 def get_original_repo(repo_id: str) -> Optional[str]:
     response = db.table('document_repositories').select('name').eq('repo_id', repo_id).eq('is_deleted', False).limit(1).execute()
     return response.data[0]['name'] if response.data else None
     
+
+def prefetch_user_profiles(user_ids: List[str]) -> None:
+    missing = list({user_id for user_id in user_ids if user_id and not get_user_profile.is_cached(user_id)})
+    for start in range(0, len(missing), IN_FILTER_BATCH):
+        batch = missing[start:start + IN_FILTER_BATCH]
+        response = db.table('users').select(USER_PROFILE_COLUMNS).in_('user_id', batch).execute()
+        profiles = {user_data['user_id']: UserProfileLite(**user_data) for user_data in response.data}
+        for user_id in batch:
+            get_user_profile.prime(profiles.get(user_id), user_id)
+
+def prefetch_original_repos(repo_ids: List[str]) -> None:
+    missing = list({repo_id for repo_id in repo_ids if repo_id and not get_original_repo.is_cached(repo_id)})
+    for start in range(0, len(missing), IN_FILTER_BATCH):
+        batch = missing[start:start + IN_FILTER_BATCH]
+        response = db.table('document_repositories').select('repo_id, name').in_('repo_id', batch).eq('is_deleted', False).execute()
+        names = {repo_data['repo_id']: repo_data['name'] for repo_data in response.data}
+        for repo_id in batch:
+            get_original_repo.prime(names.get(repo_id), repo_id)
+
+def prefetch_repository_engagement(repo_ids: List[str], user_id: str) -> None:
+    missing = [repo_id for repo_id in repo_ids if not get_repository_engagement.is_cached(repo_id, user_id)]
+    for start in range(0, len(missing), IN_FILTER_BATCH):
+        batch = missing[start:start + IN_FILTER_BATCH]
+        response = db.table('engagement_state').select('repo_id, access_type, last_at').in_('repo_id', batch).eq('user_id', user_id).eq('active', True).execute()
+        engagement = {repo_id: {} for repo_id in batch}
+        for row in response.data:
+            engagement[row['repo_id']][row['access_type']] = row['last_at']
+        for repo_id in batch:
+            get_repository_engagement.prime(engagement[repo_id], repo_id, user_id)
+
+def run_prefetch(*tasks) -> None:
+    futures = [prefetch_executor.submit(bind(task[0]), *task[1:]) for task in tasks]
+    wait(futures)
+    for future in futures:
+        if future.exception():
+            print(f"Prefetch error : {future.exception()}")
+
+def prefetch_repository_cards(repositories: List[Union[DocumentRepository, RepositorySummary]], user_id: str) -> None:
+    run_prefetch(
+        (prefetch_user_profiles, [repository.owner_id for repository in repositories]),
+        (sign_storage_paths, 'banners', [repository.banner for repository in repositories if repository.banner]),
+        (prefetch_repository_engagement, [repository.repo_id for repository in repositories if repository.owner_id != user_id], user_id)
+    )
+
+def prefetch_document_cards(documents: List[Document]) -> None:
+    run_prefetch(
+        (prefetch_user_profiles, [doc.owner_id for doc in documents]),
+        (prefetch_original_repos, [doc.original_repo for doc in documents]),
+        (sign_storage_paths, 'covers', [doc.cover for doc in documents if doc.cover])
+    )
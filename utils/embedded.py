@@ -0,0 +1,360 @@
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+from utils.local import call_local_function, has_local_function
+
+INDEXED_COLUMNS = {
+    'users': ['user_id', 'username'],
+    'document_repositories': ['repo_id'],
+    'documents': ['doc_id'],
+    'chunks': ['document_id'],
+    'chat_histories': ['chat_id'],
+    'messages': ['message_id'],
+    'engagement_events': ['repo_id'],
+    'engagement_state': ['repo_id', 'user_id'],
+    'repository_counters': ['repo_id'],
+    'user_counters': ['user_id'],
+    'question_bank': ['repo_id'],
+    'seen_questions': ['user_id'],
+    'auth_users': ['email'],
+}
+COUNTER_FIELDS = ['access_count', 'like_count', 'dislike_count', 'bookmark_count', 'share_count']
+PASSWORD_ITERATIONS = 200_000
+
+@dataclass
+class EmbeddedResponse:
+    data: List[Dict[str, Any]]
+    count: Optional[int] = None
+
+def column(name: str) -> str:
+    return f"json_extract(data, '$.{name}')"
+
+def encode(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+class EmbeddedQuery:
+    def __init__(self, client: "EmbeddedClient", table: str):
+        self.client = client
+        self.table = table
+        self.columns: Optional[List[str]] = None
+        self.filters: List[Tuple[str, List[Any]]] = []
+        self.ordering: List[str] = []
+        self.row_limit: Optional[int] = None
+        self.row_offset = 0
+        self.action = 'select'
+        self.payload: Any = None
+        self.conflict_columns: List[str] = []
+        self.ignore_duplicates = False
+
+    def select(self, columns: str = '*', count: Optional[str] = None) -> "EmbeddedQuery":
+        names = [name.strip() for name in columns.split(',')]
+        self.columns = None if '*' in names else names
+        return self
+
+    def insert(self, rows: Union[Dict[str, Any], List[Dict[str, Any]]]) -> "EmbeddedQuery":
+        self.action = 'insert'
+        self.payload = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows: Union[Dict[str, Any], List[Dict[str, Any]]], on_conflict: str = '', ignore_duplicates: bool = False) -> "EmbeddedQuery":
+        self.action = 'upsert'
+        self.payload = rows if isinstance(rows, list) else [rows]
+        self.conflict_columns = [name.strip() for name in on_conflict.split(',') if name.strip()]
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values: Dict[str, Any]) -> "EmbeddedQuery":
+        self.action = 'update'
+        self.payload = values
+        return self
+
+    def delete(self) -> "EmbeddedQuery":
+        self.action = 'delete'
+        return self
+
+    def where(self, clause: str, *args: Any) -> "EmbeddedQuery":
+        self.filters.append((clause, [encode(arg) for arg in args]))
+        return self
+
+    def eq(self, name: str, value: Any) -> "EmbeddedQuery":
+        if value is None:
+            return self.where(f"{column(name)} is null")
+        return self.where(f"{column(name)} = ?", value)
+
+    def neq(self, name: str, value: Any) -> "EmbeddedQuery":
+        if value is None:
+            return self.where(f"{column(name)} is not null")
+        return self.where(f"{column(name)} is not ?", value)
+
+    def gt(self, name: str, value: Any) -> "EmbeddedQuery":
+        return self.where(f"{column(name)} > ?", value)
+
+    def gte(self, name: str, value: Any) -> "EmbeddedQuery":
+        return self.where(f"{column(name)} >= ?", value)
+
+    def lt(self, name: str, value: Any) -> "EmbeddedQuery":
+        return self.where(f"{column(name)} < ?", value)
+
+    def lte(self, name: str, value: Any) -> "EmbeddedQuery":
+        return self.where(f"{column(name)} <= ?", value)
+
+    def in_(self, name: str, values: List[Any]) -> "EmbeddedQuery":
+        if not values:
+            return self.where("0")
+        return self.where(f"{column(name)} in ({', '.join('?' * len(values))})", *values)
+
+    def contains(self, name: str, values: List[Any]) -> "EmbeddedQuery":
+        for value in values:
+            self.where(f"exists (select 1 from json_each(data, '$.{name}') where value = ?)", value)
+        return self
+
+    def order(self, name: str, desc: bool = False) -> "EmbeddedQuery":
+        self.ordering.append(f"{column(name)} {'desc' if desc else 'asc'}")
+        return self
+
+    def limit(self, count: int) -> "EmbeddedQuery":
+        self.row_limit = count
+        return self
+
+    def range(self, start: int, end: int) -> "EmbeddedQuery":
+        self.row_offset = start
+        self.row_limit = end - start + 1
+        return self
+
+    def where_sql(self) -> Tuple[str, List[Any]]:
+        if not self.filters:
+            return "", []
+        return " where " + " and ".join(clause for clause, _ in self.filters), [arg for _, args in self.filters for arg in args]
+
+    def project(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        if self.columns is None:
+            return row
+        return {name: row.get(name) for name in self.columns}
+
+    def execute(self) -> EmbeddedResponse:
+        with self.client.transaction():
+            if self.action == 'insert':
+                return EmbeddedResponse(data=self.client.insert_rows(self.table, self.payload))
+            if self.action == 'upsert':
+                return EmbeddedResponse(data=self.client.upsert_rows(self.table, self.payload, self.conflict_columns, self.ignore_duplicates))
+            where, args = self.where_sql()
+            if self.action == 'select':
+                sql = f'select data from "{self.client.relation(self.table)}"{where}'
+                if self.ordering:
+                    sql += " order by " + ", ".join(self.ordering)
+                if self.row_limit is not None or self.row_offset:
+                    sql += " limit ? offset ?"
+                    args = args + [self.row_limit if self.row_limit is not None else -1, self.row_offset]
+                rows = self.client.connection.execute(sql, args).fetchall()
+                return EmbeddedResponse(data=[self.project(json.loads(data)) for (data,) in rows])
+            rows = self.client.connection.execute(f'select id, data from "{self.client.relation(self.table)}"{where}', args).fetchall()
+            if self.action == 'delete':
+                self.client.connection.executemany(f'delete from "{self.table}" where id = ?', [(row_id,) for row_id, _ in rows])
+                return EmbeddedResponse(data=[json.loads(data) for _, data in rows])
+            updated = []
+            for row_id, data in rows:
+                row = json.loads(data)
+                row.update(self.payload)
+                self.client.connection.execute(f'update "{self.table}" set data = ? where id = ?', (json.dumps(row, default=str), row_id))
+                updated.append(row)
+            return EmbeddedResponse(data=updated)
+
+class EmbeddedFunction:
+    def __init__(self, client: "EmbeddedClient", name: str, params: Dict[str, Any]):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def execute(self) -> EmbeddedResponse:
+        if not has_local_function(self.name):
+            raise NotImplementedError(f"Function {self.name} is not available in the embedded backend")
+        return EmbeddedResponse(data=call_local_function(self.client, self.name, self.params))
+
+class EmbeddedBucket:
+    """Bucket folder on local disk. Signed URLs are the files' local paths: st.image reads them directly and
+    document downloads are streamed with st.download_button, but they cannot be opened as browser links."""
+
+    def __init__(self, root: str, bucket: str):
+        self.root = os.path.join(root, bucket)
+
+    def local_path(self, path: str) -> str:
+        full_path = os.path.abspath(os.path.join(self.root, path))
+        if not full_path.startswith(os.path.abspath(self.root) + os.sep):
+            raise ValueError(f"Invalid storage path: {path}")
+        return full_path
+
+    def upload(self, path: str, file: Union[bytes, str], file_options: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        full_path = self.local_path(path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if isinstance(file, str):
+            with open(file, 'rb') as f:
+                file = f.read()
+        with open(full_path, 'wb') as f:
+            f.write(file)
+        return {'path': path}
+
+    def download(self, path: str) -> bytes:
+        with open(self.local_path(path), 'rb') as f:
+            return f.read()
+
+    def remove(self, paths: List[str]) -> List[Dict[str, str]]:
+        removed = []
+        for path in paths:
+            full_path = self.local_path(path)
+            if os.path.exists(full_path):
+                os.remove(full_path)
+                removed.append({'name': path})
+        return removed
+
+    def list(self, path: Optional[str] = None, options: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        folder = self.local_path(path) if path else self.root
+        if not os.path.isdir(folder):
+            return []
+        entries = []
+        for name in sorted(os.listdir(folder)):
+            full_path = os.path.join(folder, name)
+            is_file = os.path.isfile(full_path)
+            modified = datetime.fromtimestamp(os.path.getmtime(full_path), timezone.utc).isoformat()
+            entries.append({'name': name, 'id': os.path.relpath(full_path, self.root) if is_file else None, 'created_at': modified, 'updated_at': modified, 'metadata': {'size': os.path.getsize(full_path)} if is_file else None})
+        options = options or {}
+        offset = options.get('offset', 0)
+        return entries[offset:offset + options.get('limit', 100)]
+
+    def create_signed_url(self, path: str, expires_in: int) -> Dict[str, str]:
+        return {'signedURL': self.local_path(path)}
+
+    def create_signed_urls(self, paths: List[str], expires_in: int) -> List[Dict[str, Any]]:
+        signed = []
+        for path in paths:
+            full_path = self.local_path(path)
+            if os.path.exists(full_path):
+                signed.append({'path': path, 'signedURL': full_path, 'error': None})
+            else:
+                signed.append({'path': path, 'signedURL': None, 'error': 'Object not found'})
+        return signed
+
+class EmbeddedStorage:
+    def __init__(self, root: str):
+        self.root = root
+
+    def from_(self, bucket: str) -> EmbeddedBucket:
+        return EmbeddedBucket(self.root, bucket)
+
+class EmbeddedAuth:
+    def __init__(self, client: "EmbeddedClient"):
+        self.client = client
+
+    def hash_password(self, password: str, salt: str) -> str:
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(salt), PASSWORD_ITERATIONS).hex()
+
+    def sign_up(self, credentials: Dict[str, str]) -> SimpleNamespace:
+        with self.client.transaction():
+            if self.client.table('auth_users').select('id').eq('email', credentials['email']).limit(1).execute().data:
+                raise ValueError("Email already registered")
+            salt = secrets.token_hex(16)
+            user_id = str(uuid.uuid4())
+            self.client.table('auth_users').insert({
+                'id': user_id,
+                'email': credentials['email'],
+                'salt': salt,
+                'password_hash': self.hash_password(credentials['password'], salt)
+            }).execute()
+        return SimpleNamespace(user=SimpleNamespace(id=user_id, email=credentials['email']), session=None)
+
+    def sign_in_with_password(self, credentials: Dict[str, str]) -> SimpleNamespace:
+        response = self.client.table('auth_users').select('*').eq('email', credentials['email']).limit(1).execute()
+        account = response.data[0] if response.data else None
+        if account is None or not secrets.compare_digest(account['password_hash'], self.hash_password(credentials['password'], account['salt'])):
+            raise ValueError("Invalid login credentials")
+        return SimpleNamespace(user=SimpleNamespace(id=account['id'], email=account['email']), session=None)
+
+class EmbeddedClient:
+    """SQLite and local filesystem backend exposing the subset of the Supabase client used by the app."""
+
+    def __init__(self, path: str, storage_root: Optional[str] = None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("pragma journal_mode = wal")
+        self.connection.execute("pragma synchronous = normal")
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.tables = set()
+        self.storage = EmbeddedStorage(storage_root or os.path.join(os.path.dirname(os.path.abspath(path)), 'storage'))
+        self.auth = EmbeddedAuth(self)
+        self.create_views()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        with self.lock:
+            if self.depth == 0:
+                self.connection.execute("begin")
+            self.depth += 1
+            try:
+                yield
+            except BaseException:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.connection.execute("rollback")
+                raise
+            self.depth -= 1
+            if self.depth == 0:
+                self.connection.execute("commit")
+
+    def ensure_table(self, table: str) -> None:
+        if table in self.tables:
+            return
+        self.connection.execute(f'create table if not exists "{table}" (id integer primary key, data text not null)')
+        for name in INDEXED_COLUMNS.get(table, []):
+            self.connection.execute(f'create index if not exists "{table}_{name}_idx" on "{table}" ({column(name)})')
+        self.tables.add(table)
+
+    def create_views(self) -> None:
+        self.ensure_table('document_repositories')
+        self.ensure_table('repository_counters')
+        counters = ", ".join(f"'{name}', coalesce(json_extract(c.data, '$.{name}'), 0)" for name in COUNTER_FIELDS)
+        self.connection.execute(f"""create view if not exists repository_summaries as
+            select r.id, json_patch(r.data, json_object(
+                'document_count', coalesce(json_array_length(r.data, '$.documents'), 0), {counters}
+            )) as data
+            from document_repositories r
+            left join repository_counters c on json_extract(c.data, '$.repo_id') = json_extract(r.data, '$.repo_id')""")
+        self.tables.add('repository_summaries')
+
+    def relation(self, table: str) -> str:
+        self.ensure_table(table)
+        return table
+
+    def insert_rows(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        self.ensure_table(table)
+        self.connection.executemany(f'insert into "{table}" (data) values (?)', [(json.dumps(row, default=str),) for row in rows])
+        return rows
+
+    def upsert_rows(self, table: str, rows: List[Dict[str, Any]], conflict_columns: List[str], ignore_duplicates: bool) -> List[Dict[str, Any]]:
+        written = []
+        for row in rows:
+            query = self.table(table).select('*')
+            for name in conflict_columns:
+                query = query.eq(name, row.get(name))
+            existing = query.limit(1).execute().data if conflict_columns else []
+            if not existing:
+                written.extend(self.insert_rows(table, [row]))
+            elif not ignore_duplicates:
+                written.extend(query.update(row).execute().data)
+        return written
+
+    def table(self, name: str) -> EmbeddedQuery:
+        return EmbeddedQuery(self, name)
+
+    def rpc(self, name: str, params: Dict[str, Any]) -> EmbeddedFunction:
+        return EmbeddedFunction(self, name, params)
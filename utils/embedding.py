@@ -1,12 +1,13 @@
-from typing import List
+from typing import List, Optional
 from model import Chunk
+from utils.chunks import EMBEDDING_DTYPE, EMBEDDING_VERSION, ChunkSet
 import numpy as np
 import streamlit as st
 from sentence_transformers import SentenceTransformer
 
 @st.cache_resource
 def load_model():
-    return SentenceTransformer('all-MiniLM-L6-v2')
+    return SentenceTransformer(EMBEDDING_VERSION)
 
 def generate_embedding(text: str) -> List[float]:
     model = load_model()
@@ -32,9 +33,10 @@ def generate_embeddings(blocks: List[str], page_num: int) -> List[Chunk]:
         position += 1
     return chunks
 
-def best_matchs(request: str, chunks: List[Chunk]) -> List[Chunk]:
-    query_embedding = generate_embedding(request)
-    similarities = [np.dot(chunk.embedding, query_embedding) for chunk in chunks]
-    best_indices = np.argsort(similarities)[-20:][::-1]
-    best_chunks = [chunks[i] for i in best_indices]
-    return best_chunks
\ No newline at end of file
+def embed_query(request: str) -> np.ndarray:
+    return np.asarray(generate_embedding(request), dtype=EMBEDDING_DTYPE)
+
+def best_matchs(request: str, chunks: ChunkSet, count: int = 20, query_embedding: Optional[np.ndarray] = None) -> ChunkSet:
+    if len(chunks) == 0:
+        return chunks
+    return chunks.search(embed_query(request) if query_embedding is None else query_embedding, count)
\ No newline at end of file
@@ -0,0 +1,261 @@
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import numpy as np
+import streamlit as st
+from utils.chunks import ChunkSet, ChunkView, assemble_chunks, forget_document_chunks, live_document_ids
+from utils.data import call_function
+from utils.monitor import register_stats
+
+SWEEP_SECONDS = 60
+DEFAULT_INDEX_SETTINGS = {'memory_budget_mb': 512, 'idle_seconds': 900, 'retrieval': 'local', 'server_retry_seconds': 300}
+
+@dataclass(frozen=True)
+class RepositoryIndex:
+    document_ids: Tuple[str, ...]
+    chunks: ChunkSet
+
+    @property
+    def nbytes(self) -> int:
+        return self.chunks.nbytes
+
+def build_repository_index(document_ids: Tuple[str, ...]) -> RepositoryIndex:
+    return RepositoryIndex(document_ids=document_ids, chunks=assemble_chunks(list(document_ids)))
+
+@dataclass(eq=False)
+class IndexEntry:
+    index: RepositoryIndex
+    refs: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+    stale: bool = False
+
+class IndexHandle(Sequence):
+    """Session-side reference to a shared repository index; released when dropped or on release().
+
+    Behaves as the index's ChunkSet, so it can be passed wherever chunks are expected.
+    """
+
+    def __init__(self, registry: "IndexRegistry", entry: IndexEntry):
+        self.index = entry.index
+        self.finalizer = weakref.finalize(self, registry.release, entry)
+
+    def release(self) -> None:
+        self.finalizer()
+
+    def __len__(self) -> int:
+        return len(self.index.chunks)
+
+    def __getitem__(self, item):
+        return self.index.chunks[item]
+
+    def __iter__(self) -> Iterator[ChunkView]:
+        return iter(self.index.chunks)
+
+    def __getattr__(self, name: str):
+        if name == 'index':
+            raise AttributeError(name)
+        return getattr(self.index.chunks, name)
+
+class RemoteIndex:
+    """Repository searched by the match_chunks database function, so its chunks are never loaded into the app.
+
+    Falls back to the shared in-process index while the function is unavailable. len() counts documents.
+    """
+
+    def __init__(self, registry: "IndexRegistry", document_ids: Tuple[str, ...], page: Optional[int] = None):
+        self.registry = registry
+        self.document_ids = document_ids
+        self.page = page
+
+    def __len__(self) -> int:
+        return len(self.document_ids)
+
+    def where_page(self, page: int) -> "RemoteIndex":
+        return RemoteIndex(self.registry, self.document_ids, page)
+
+    def page_range(self, first: int, last: int) -> ChunkSet:
+        return self.registry.acquire(list(self.document_ids)).page_range(first, last)
+
+    def search(self, query_embedding: np.ndarray, count: int) -> ChunkSet:
+        if self.registry.server_available():
+            try:
+                rows = call_function('match_chunks', {
+                    'p_document_ids': list(self.document_ids),
+                    'p_query_embedding': query_embedding.tolist(),
+                    'p_match_count': count,
+                    'p_page': self.page
+                })
+                self.registry.count('remote_searches')
+                return ChunkSet.from_matches(rows)
+            except Exception as e:
+                print(f"Vector search error : {e}")
+                self.registry.server_failed()
+        self.registry.count('fallback_searches')
+        chunks = self.registry.acquire(list(self.document_ids))
+        if self.page is not None:
+            chunks = chunks.where_page(self.page)
+        return chunks.search(query_embedding, count)
+
+class IndexRegistry:
+    def __init__(self, memory_budget: int, idle_seconds: float, server_retry_seconds: float = 300):
+        self.memory_budget = memory_budget
+        self.idle_seconds = idle_seconds
+        self.server_retry_seconds = server_retry_seconds
+        self.server_retry_at = 0.0
+        self.entries: "OrderedDict[Tuple[str, ...], IndexEntry]" = OrderedDict()
+        self.retired: List[IndexEntry] = []
+        self.building: Dict[Tuple[str, ...], threading.Event] = {}
+        self.lock = threading.RLock()
+        self.builds = 0
+        self.hits = 0
+        self.evictions = 0
+        self.remote_searches = 0
+        self.fallback_searches = 0
+
+    def acquire(self, document_ids: List[str]) -> IndexHandle:
+        key = tuple(document_ids)
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    entry.refs += 1
+                    entry.last_used = time.monotonic()
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return IndexHandle(self, entry)
+                event = self.building.get(key)
+                builder = event is None
+                if builder:
+                    event = self.building[key] = threading.Event()
+            if not builder:
+                event.wait()
+                continue
+            try:
+                entry = IndexEntry(index=build_repository_index(key), refs=1)
+                with self.lock:
+                    self.entries[key] = entry
+                    self.builds += 1
+                    self.evict()
+                return IndexHandle(self, entry)
+            finally:
+                with self.lock:
+                    self.building.pop(key).set()
+
+    def release(self, entry: IndexEntry) -> None:
+        with self.lock:
+            entry.refs = max(entry.refs - 1, 0)
+            entry.last_used = time.monotonic()
+            if entry.stale and entry.refs == 0 and entry in self.retired:
+                self.retired.remove(entry)
+                self.evictions += 1
+            self.evict()
+
+    def server_available(self) -> bool:
+        return time.monotonic() >= self.server_retry_at
+
+    def server_failed(self) -> None:
+        self.server_retry_at = time.monotonic() + self.server_retry_seconds
+
+    def count(self, counter: str) -> None:
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def discard(self, keys: List[Tuple[str, ...]]) -> None:
+        """Drops entries so the next acquire rebuilds them; entries still held by handles are retired until released."""
+        with self.lock:
+            for key in keys:
+                entry = self.entries.pop(key, None)
+                if entry is None:
+                    continue
+                if entry.refs:
+                    entry.stale = True
+                    self.retired.append(entry)
+                else:
+                    self.evictions += 1
+
+    def discard_document(self, document_id: str) -> None:
+        with self.lock:
+            self.discard([key for key in self.entries if document_id in key])
+
+    def sweep_forever(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            with self.lock:
+                self.evict()
+
+    def used_bytes(self) -> int:
+        return sum(entry.index.nbytes for entry in list(self.entries.values()) + self.retired)
+
+    def evict(self) -> None:
+        now = time.monotonic()
+        for key, entry in list(self.entries.items()):
+            if entry.refs == 0 and now - entry.last_used > self.idle_seconds:
+                del self.entries[key]
+                self.evictions += 1
+        used = self.used_bytes()
+        for key, entry in list(self.entries.items()):
+            if used <= self.memory_budget:
+                return
+            if entry.refs == 0:
+                used -= entry.index.nbytes
+                del self.entries[key]
+                self.evictions += 1
+        if used > self.memory_budget:
+            print(f"Index registry over memory budget : {used} bytes in use, budget {self.memory_budget}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'indexes': len(self.entries),
+                'handles': sum(entry.refs for entry in list(self.entries.values()) + self.retired),
+                'retired': len(self.retired),
+                'used_bytes': self.used_bytes(),
+                'memory_budget': self.memory_budget,
+                'builds': self.builds,
+                'hits': self.hits,
+                'evictions': self.evictions,
+                'remote_searches': self.remote_searches,
+                'fallback_searches': self.fallback_searches
+            }
+
+def index_settings() -> Dict[str, Any]:
+    settings = dict(DEFAULT_INDEX_SETTINGS)
+    try:
+        settings.update({key: value for key, value in st.secrets.get("index", {}).items() if key in DEFAULT_INDEX_SETTINGS})
+    except FileNotFoundError:
+        pass
+    settings['retrieval'] = os.environ.get("NDOLE_RETRIEVAL") or settings['retrieval']
+    return settings
+
+@st.cache_resource
+def get_index_registry() -> IndexRegistry:
+    settings = index_settings()
+    registry = IndexRegistry(
+        memory_budget=int(settings['memory_budget_mb'] * 1024 * 1024),
+        idle_seconds=settings['idle_seconds'],
+        server_retry_seconds=settings['server_retry_seconds']
+    )
+    threading.Thread(target=registry.sweep_forever, args=(min(settings['idle_seconds'], SWEEP_SECONDS),), daemon=True, name="index-sweeper").start()
+    return registry
+
+def open_repository_index(document_ids: List[str]) -> Union[IndexHandle, RemoteIndex]:
+    registry = get_index_registry()
+    if index_settings()['retrieval'] == 'server':
+        return RemoteIndex(registry, tuple(live_document_ids(document_ids)))
+    return registry.acquire(document_ids)
+
+def index_stats() -> Dict[str, Any]:
+    return get_index_registry().stats()
+
+register_stats("indexes", index_stats)
+
+def invalidate_document(document_id: str) -> None:
+    forget_document_chunks(document_id)
+    get_index_registry().discard_document(document_id)
+
+def invalidate_repository_index(document_ids: List[str]) -> None:
+    get_index_registry().discard([tuple(document_ids)])
@@ -1,14 +1,33 @@
+import hashlib
+import math
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import streamlit as st
 import google.generativeai as genai
-from typing import Any, Dict, List, Optional, Tuple
-from model import Chunk, ChatHistory, Message
-from utils.embedding import best_matchs
-from utils.chat import create_message
+import numpy as np
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from model import ChatHistory, Message
+from utils.cache import MISSING, get_cache
+from utils.chunks import ChunkSet
+from utils.embedding import best_matchs, embed_query
+from utils.chat import create_message, update_chat_summary
+from utils.monitor import record_generation
+from utils.responses import lookup_response, response_key, store_response
+from utils.sessions import remember_conversation
 
 genai.configure(api_key=st.secrets["gemini"]["api_key"])
 MODEL_NAME = "gemini-2.5-flash-preview-05-20"
 DEFAULT_CHUNK_COUNT = 5
+DEFAULT_HISTORY = {'token_budget': 6000, 'summary_words': 300}
+CHARS_PER_TOKEN = 4
+SECTION_CHARS = 12000
+MAX_SECTIONS = 24
+GENERATION_WORKERS = 4
+SECTION_SUMMARY_TTL = 24 * 3600
+EXERCISE_SHARD_SIZE = 5
+EXERCISE_SHARD_ATTEMPTS = 3
 INSTRUCTIONS = """
 LLM Math Instruction Prompt
 When you need to answer questions involving mathematical expressions, equations, or symbolic computations, please follow these instructions:
@@ -128,9 +147,30 @@ PROMPTS = {
     Exercise request: {exercise_request}
     
     Respond in the language of the exercise request.
-    """  
+    """,
+    "section": """You are preparing material for a course. Write a structured outline of the section below.
+    
+    List its key concepts, definitions, formulas, worked examples and their page numbers, in the order they appear. Be faithful to the text, be concise, and write in the language of the section.
+    
+    Section:
+    {section}
+    """,
+    "summary": """Update the running summary of a tutoring conversation with the new exchanges below.
+    
+    Keep the topics covered, questions asked, key answers, formulas and any preferences the learner stated. Stay under {max_words} words and write in the language of the conversation. Return only the updated summary.
+    
+    Current summary: {summary}
+    
+    New exchanges:
+    {exchanges}
+    """
     }
 
+generation_executor = ThreadPoolExecutor(max_workers=GENERATION_WORKERS, thread_name_prefix="generation")
+summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+summary_lock = threading.Lock()
+pending_summaries = set()
+
 def initialize_gemini_model():
     try:
         model = genai.GenerativeModel(
@@ -142,11 +182,88 @@ def initialize_gemini_model():
         print(f"Error during model initialization: {e}")
         return None
 
-def create_chat_session(messages: List[Message] = None) -> genai.ChatSession:
+def history_settings() -> Dict[str, Any]:
+    settings = dict(DEFAULT_HISTORY)
+    try:
+        settings.update({key: value for key, value in st.secrets.get("history", {}).items() if key in DEFAULT_HISTORY})
+    except FileNotFoundError:
+        pass
+    return settings
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1 if text else 0
+
+def session_tokens(chat_session: genai.ChatSession) -> int:
+    return sum(estimate_tokens(getattr(part, 'text', '')) for content in chat_session.history for part in content.parts)
+
+def summarize_messages(summary: str, messages: List[Message], max_words: int) -> str:
+    model = initialize_gemini_model()
+    if not model:
+        raise Exception("Failed to initialize the model")
+    exchanges = "\n".join(f"{'Assistant' if msg.is_assistant else 'Learner'}: {msg.content}" for msg in messages)
+    prompt = PROMPTS["summary"].format(summary=summary or "(none)", exchanges=exchanges, max_words=max_words)
+    return model.generate_content(prompt).text.strip()
+
+def fold_summary(chat: ChatHistory, summary: str, overflow: List[Message], max_words: int) -> None:
+    try:
+        folded = summarize_messages(summary, overflow, max_words)
+        if update_chat_summary(chat.chat_id, folded, overflow[-1].message_id):
+            with summary_lock:
+                chat.summary, chat.summary_until = folded, overflow[-1].message_id
+    except Exception as e:
+        print(f"History summary error : {e}")
+    finally:
+        with summary_lock:
+            pending_summaries.discard(chat.chat_id)
+
+def summarized_count(chat: ChatHistory, messages: List[Message], summary_until: Optional[str]) -> int:
+    """Number of leading messages already folded into the summary, even if the summary_until message was since removed."""
+    position = {msg.message_id: i for i, msg in enumerate(messages)}
+    if summary_until in position:
+        return position[summary_until] + 1
+    ids = chat.messages or []
+    if summary_until in ids:
+        for message_id in reversed(ids[:ids.index(summary_until)]):
+            if message_id in position:
+                return position[message_id] + 1
+    return 0
+
+def recent_messages(chat: ChatHistory, messages: List[Message]) -> Tuple[str, List[Message]]:
+    """The chat's summary and the messages replayed verbatim after it: the newest turns within the token budget.
+
+    Older turns not yet in the chat's rolling summary are folded into it in the background, so the reply is
+    not held up by a summarization call; the session meanwhile starts from the summary saved so far.
+    """
+    with summary_lock:
+        summary, summary_until = chat.summary, chat.summary_until
+    unsummarized = [msg for msg in messages[summarized_count(chat, messages, summary_until):] if not msg.is_deleted]
+    settings = history_settings()
+    used = estimate_tokens(summary)
+    start = len(unsummarized)
+    while start > 0 and (used + estimate_tokens(unsummarized[start - 1].content) <= settings['token_budget'] or start == len(unsummarized)):
+        start -= 1
+        used += estimate_tokens(unsummarized[start].content)
+    while start < len(unsummarized) and unsummarized[start].is_assistant:
+        start += 1
+    overflow = unsummarized[:start]
+    if overflow:
+        with summary_lock:
+            scheduled = chat.chat_id not in pending_summaries
+            pending_summaries.add(chat.chat_id)
+        if scheduled:
+            summary_executor.submit(fold_summary, chat, summary, overflow, settings['summary_words'])
+    return summary, unsummarized[start:]
+
+def create_chat_session(messages: List[Message] = None, chat_history: ChatHistory = None) -> genai.ChatSession:
     model = initialize_gemini_model()
     if not model:
         raise Exception("Failed to initialize the model")
     history=[]
+    if messages and chat_history:
+        summary, messages = recent_messages(chat_history, messages)
+        if summary:
+            history.append({"role": "user", "parts": [f"Summary of our earlier conversation: {summary}"]})
+            history.append({"role": "model", "parts": ["Understood, I will keep this in mind."]})
     if messages:
         for msg in messages:
             if not msg.is_deleted:
@@ -157,12 +274,98 @@ def create_chat_session(messages: List[Message] = None) -> genai.ChatSession:
     chat = model.start_chat(history=history)
     return chat
 
-def get_context_from_chunks(chunks: List[Chunk], max_chunks: int = DEFAULT_CHUNK_COUNT) -> str:
+def resume_chat_session(history: Optional[List[Dict[str, Any]]]) -> Optional[genai.ChatSession]:
+    if history is None:
+        return None
+    model = initialize_gemini_model()
+    return model.start_chat(history=history) if model else None
+
+def stream_response(chat_session: genai.ChatSession, prompt: str, kind: str, on_text: Optional[Callable[[str], None]] = None) -> str:
+    started = time.perf_counter()
+    first_token_ms = None
+    text = ""
+    for chunk in chat_session.send_message(prompt, stream=True):
+        if not chunk.candidates or not chunk.parts:
+            continue
+        if first_token_ms is None:
+            first_token_ms = (time.perf_counter() - started) * 1000
+        text += chunk.text
+        if on_text:
+            on_text(text)
+    record_generation(kind, first_token_ms, (time.perf_counter() - started) * 1000, len(text))
+    return text
+
+def generate_response(kind: str, history: ChatHistory, context: str, query_embedding, prompt: str, messages: List[Message], chat_session: genai.ChatSession = None, on_text: Optional[Callable[[str], None]] = None, options: Any = None) -> Tuple[genai.ChatSession, str]:
+    first_turn = chat_session is None and all(message.is_deleted for message in messages)
+    key = response_key(kind, history.repo_source, context, options)
+    if first_turn:
+        cached_response = lookup_response(key, query_embedding)
+        if cached_response is not None:
+            if on_text:
+                on_text(cached_response)
+            return None, cached_response
+    if not chat_session or session_tokens(chat_session) > history_settings()['token_budget']:
+        chat_session = create_chat_session(messages, history)
+    response = stream_response(chat_session, prompt, kind, on_text)
+    if first_turn:
+        store_response(key, query_embedding, response)
+    return chat_session, response
+
+def split_sections(chunks: ChunkSet) -> List[str]:
+    lines = [f"Page {c.page}: {c.text}" for c in chunks]
+    max_chars = SECTION_CHARS
+    sections = pack_lines(lines, max_chars)
+    while len(sections) > MAX_SECTIONS:
+        max_chars *= 2
+        sections = pack_lines(lines, max_chars)
+    return sections
+
+def pack_lines(lines: List[str], max_chars: int) -> List[str]:
+    sections = []
+    current = []
+    size = 0
+    for line in lines:
+        if current and size + len(line) > max_chars:
+            sections.append("\n".join(current))
+            current = []
+            size = 0
+        current.append(line)
+        size += len(line)
+    if current:
+        sections.append("\n".join(current))
+    return sections
+
+def summarize_section(section: str) -> str:
+    cache = get_cache("course_sections", ttl=SECTION_SUMMARY_TTL, maxsize=2048)
+    key = hashlib.sha1(f"{MODEL_NAME}\n{section}".encode('utf-8')).hexdigest()
+    outline = cache.get(key)
+    if outline is MISSING:
+        model = initialize_gemini_model()
+        if not model:
+            raise Exception("Failed to initialize the model")
+        started = time.perf_counter()
+        outline = model.generate_content(PROMPTS["section"].format(section=section)).text.strip()
+        record_generation("section", None, (time.perf_counter() - started) * 1000, len(outline))
+        cache.set(key, outline)
+    return outline
+
+def outline_sections(chunks: ChunkSet, on_text: Optional[Callable[[str], None]] = None) -> str:
+    """Map step of course generation: outlines every section of the chunks with bounded parallel calls."""
+    sections = split_sections(chunks)
+    futures = {generation_executor.submit(summarize_section, section): i for i, section in enumerate(sections)}
+    outlines = [""] * len(sections)
+    for done, future in enumerate(as_completed(futures), start=1):
+        outlines[futures[future]] = future.result()
+        if on_text:
+            on_text(f"⏳ Outlined section {done}/{len(sections)}...")
+    return "\n\n---\n\n".join(f"Section {i + 1}:\n{outline}" for i, outline in enumerate(outlines))
+
+def get_context_from_chunks(chunks: ChunkSet, max_chunks: int = DEFAULT_CHUNK_COUNT) -> str:
     context_chunks = chunks[:max_chunks]
     context_text = "\n\n---\n\n".join([f"Page {c.page}, Position {c.position}: {c.text}" for c in context_chunks])
     return context_text
 
-def qa_chat(history: ChatHistory, user_message: str, chunks: List[Chunk], messages: List[Message], chat_session: genai.ChatSession = None) -> Tuple[genai.ChatSession, str, bool, List[Message]]:
+def qa_chat(history: ChatHistory, user_message: str, chunks: ChunkSet, messages: List[Message], chat_session: genai.ChatSession = None, on_text: Optional[Callable[[str], None]] = None) -> Tuple[genai.ChatSession, str, bool, List[Message]]:
     try:
         if not history:
             return None, "Chat history not found", False, []
@@ -175,13 +378,11 @@ def qa_chat(history: ChatHistory, user_message: str, chunks: List[Chunk], messag
                 content=user_message,
                 is_assistant=False
             ))
-        relevant_chunks = best_matchs(user_message, chunks)
+        query_embedding = embed_query(user_message)
+        relevant_chunks = best_matchs(user_message, chunks, query_embedding=query_embedding)
         context = get_context_from_chunks(relevant_chunks)
         prompt = PROMPTS["qa"].format(context=context, user_question=user_message)
-        if not chat_session:
-            chat_session = create_chat_session(messages)
-        response = chat_session.send_message(prompt)
-        model_response = response.text
+        chat_session, model_response = generate_response("qa", history, context, query_embedding, prompt, messages, chat_session, on_text)
         assistant_msg_id = create_message(history.chat_id, model_response, is_assistant=True)
         msgs.append(
             Message(
@@ -190,12 +391,13 @@ def qa_chat(history: ChatHistory, user_message: str, chunks: List[Chunk], messag
                 content=model_response,
                 is_assistant=True
             ))
+        remember_conversation(history.chat_id, chat_session, history.messages + [msg.message_id for msg in msgs], messages + msgs)
         return chat_session, model_response, True, msgs
     except Exception as e:
         print(f"QA chat error : {e}")
         return None ,f"An error occurred : {str(e)}", False, []
 
-def course_chat(history: ChatHistory, topic: str, chunks: List[Chunk], messages: List[Message], page_number: Optional[int] = None, chat_session: genai.ChatSession = None) -> Tuple[genai.ChatSession, str, bool, List[Message]]:
+def course_chat(history: ChatHistory, topic: str, chunks: ChunkSet, messages: List[Message], page_number: Optional[int] = None, chat_session: genai.ChatSession = None, on_text: Optional[Callable[[str], None]] = None, page_range: Optional[Tuple[int, int]] = None) -> Tuple[genai.ChatSession, str, bool, List[Message]]:
     try:
         if not history:
             return None, "Chat history not found", False, []
@@ -208,15 +410,16 @@ def course_chat(history: ChatHistory, topic: str, chunks: List[Chunk], messages:
                 content=f"Generate a course on: {topic}",
                 is_assistant=False
             ))
-        if page_number is not None:
-            chunks = [chunk for chunk in chunks if chunk.page == page_number]
-        relevant_chunks = best_matchs(topic, chunks)
-        context = get_context_from_chunks(relevant_chunks, max_chunks=10)
+        query_embedding = embed_query(topic)
+        if page_range is not None:
+            context = outline_sections(chunks.page_range(*page_range), on_text)
+        else:
+            if page_number is not None:
+                chunks = chunks.where_page(page_number)
+            relevant_chunks = best_matchs(topic, chunks, query_embedding=query_embedding)
+            context = get_context_from_chunks(relevant_chunks, max_chunks=10)
         prompt = PROMPTS["course"].format(context=context, topic=topic)
-        if not chat_session:
-            chat_session = create_chat_session(messages)
-        response = chat_session.send_message(prompt)
-        course_content = response.text
+        chat_session, course_content = generate_response("course", history, context, query_embedding, prompt, messages, chat_session, on_text)
         assistant_msg_id = create_message(history.chat_id, course_content, is_assistant=True)
         msgs.append(
             Message(
@@ -225,12 +428,53 @@ def course_chat(history: ChatHistory, topic: str, chunks: List[Chunk], messages:
                 content=course_content,
                 is_assistant=True
             ))
+        remember_conversation(history.chat_id, chat_session, history.messages + [msg.message_id for msg in msgs], messages + msgs)
         return chat_session, course_content, True, msgs
     except Exception as e:
         print(f"Course generation error : {e}")
         return None, f"An error occurred : {str(e)}", False, []
 
-def exercise_chat(history: ChatHistory, exercise_request: str, chunks: List[Chunk], messages: List[Message], count: int = 3, chat_session: genai.ChatSession = None) -> Tuple[genai.ChatSession, str, bool, List[Message]]:
+def generate_exercise_shard(context: str, exercise_request: str, count: int) -> List[Dict[str, Any]]:
+    model = initialize_gemini_model()
+    if not model:
+        raise Exception("Failed to initialize the model")
+    started = time.perf_counter()
+    text = model.generate_content(PROMPTS["exercise"].format(context=context, exercise_request=exercise_request, number_of_questions=count)).text
+    record_generation("exercise_shard", None, (time.perf_counter() - started) * 1000, len(text))
+    return [question for question in extract_qcm_data(text) if is_valid_question(question)]
+
+def generate_exercise_shards(exercise_request: str, chunks: ChunkSet, count: int, on_text: Optional[Callable[[str], None]] = None) -> List[Dict[str, Any]]:
+    """Large quizzes as concurrent shards of at most EXERCISE_SHARD_SIZE questions, each over its own share of the chunks.
+
+    Questions are deduplicated across shards, and only shards still short of their quota are retried.
+    """
+    shard_count = math.ceil(count / EXERCISE_SHARD_SIZE)
+    wanted = [min(EXERCISE_SHARD_SIZE, count - i * EXERCISE_SHARD_SIZE) for i in range(shard_count)]
+    contexts = [get_context_from_chunks(chunks.take(np.arange(i, len(chunks), shard_count)), max_chunks=wanted[i] * 2) for i in range(shard_count)]
+    results: List[List[Dict[str, Any]]] = [[] for _ in range(shard_count)]
+    fingerprints = set()
+    for _ in range(EXERCISE_SHARD_ATTEMPTS):
+        pending = [i for i in range(shard_count) if len(results[i]) < wanted[i]]
+        if not pending:
+            break
+        futures = {generation_executor.submit(generate_exercise_shard, contexts[i], exercise_request, wanted[i] - len(results[i])): i for i in pending}
+        for future in as_completed(futures):
+            shard = futures[future]
+            try:
+                questions = future.result()
+            except Exception as e:
+                print(f"Exercise shard error : {e}")
+                continue
+            for question in questions:
+                fingerprint = question_fingerprint(question)
+                if fingerprint not in fingerprints and len(results[shard]) < wanted[shard]:
+                    fingerprints.add(fingerprint)
+                    results[shard].append(question)
+            if on_text:
+                on_text(f"⏳ Generated {sum(len(result) for result in results)}/{count} exercises...")
+    return [question for result in results for question in result]
+
+def exercise_chat(history: ChatHistory, exercise_request: str, chunks: ChunkSet, messages: List[Message], count: int = 3, chat_session: genai.ChatSession = None, on_text: Optional[Callable[[str], None]] = None) -> Tuple[genai.ChatSession, str, bool, List[Message]]:
     try:
         if not history:
             return None, "Chat history not found", False, []
@@ -243,17 +487,22 @@ def exercise_chat(history: ChatHistory, exercise_request: str, chunks: List[Chun
                 content=f"Generate {count} exercises on: {exercise_request}",
                 is_assistant=False
             ))
-        relevant_chunks = best_matchs(exercise_request, chunks)
-        context = get_context_from_chunks(relevant_chunks, max_chunks=count*2)
-        prompt = PROMPTS["exercise"].format(
-            context=context, 
-            exercise_request=exercise_request,
-            number_of_questions=count
-        )
-        if not chat_session:
-            chat_session = create_chat_session(messages)
-        response = chat_session.send_message(prompt)
-        exercises_content = response.text
+        query_embedding = embed_query(exercise_request)
+        if count > EXERCISE_SHARD_SIZE:
+            relevant_chunks = best_matchs(exercise_request, chunks, count=count*2, query_embedding=query_embedding)
+            questions = generate_exercise_shards(exercise_request, relevant_chunks, count, on_text)
+            if not questions:
+                raise Exception("No valid exercises were generated")
+            chat_session, exercises_content = None, format_questions(questions)
+        else:
+            relevant_chunks = best_matchs(exercise_request, chunks, query_embedding=query_embedding)
+            context = get_context_from_chunks(relevant_chunks, max_chunks=count*2)
+            prompt = PROMPTS["exercise"].format(
+                context=context, 
+                exercise_request=exercise_request,
+                number_of_questions=count
+            )
+            chat_session, exercises_content = generate_response("exercise", history, context, query_embedding, prompt, messages, chat_session, on_text, count)
         assistant_msg_id = create_message(history.chat_id, exercises_content, is_assistant=True)
         msgs.append(
             Message(
@@ -262,6 +511,7 @@ def exercise_chat(history: ChatHistory, exercise_request: str, chunks: List[Chun
                 content=exercises_content,
                 is_assistant=True
             ))
+        remember_conversation(history.chat_id, chat_session, history.messages + [msg.message_id for msg in msgs], messages + msgs)
         return chat_session, exercises_content, True, msgs
     except Exception as e:
         print(f"Exercise generation error: {e}")
@@ -300,6 +550,28 @@ def extract_qcm_data(text: str) -> List[Dict[str, Any]]:
             questions.append(question)
     return questions
 
+def question_fingerprint(question: Dict[str, Any]) -> str:
+    stem = re.sub(r"\W+", " ", question['stem'].lower()).strip()
+    return hashlib.sha1(stem.encode('utf-8')).hexdigest()
+
+def is_valid_question(question: Dict[str, Any]) -> bool:
+    options = question['options']
+    return (
+        bool(question['stem'])
+        and sorted(options) == ['A', 'B', 'C', 'D']
+        and all(options.values())
+        and len({text.lower() for text in options.values()}) == len(options)
+        and question['correct_answer'] in options
+        and bool(question['explanation'])
+    )
+
+def format_questions(questions: List[Dict[str, Any]]) -> str:
+    blocks = []
+    for question in questions:
+        options = "\n".join(f"{letter}. {text}" for letter, text in sorted(question['options'].items()))
+        blocks.append(f"<question>\n<stem>{question['stem']}</stem>\n<options>\n{options}\n</options>\n<answer>{question['correct_answer']}</answer>\n<explanation>\n{question['explanation']}\n</explanation>\n</question>")
+    return "\n\n".join(blocks)
+
 def extract_context_from_qa(generated_text):
     pattern = r"User question:\s*(.*?)(?=\s*$)"
     match = re.search(pattern, generated_text, re.DOTALL)
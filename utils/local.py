@@ -0,0 +1,156 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+_lock = threading.RLock()
+
+LOCAL_SEARCH_TTL = 30
+SEARCH_WEIGHTS = (0.0, 10.0, 4.0, 2.0)
+_search_index: Dict[str, Any] = {'connection': None, 'built_at': 0.0}
+ENGAGEMENT_COUNTERS = {
+    'accesses': 'access_count',
+    'likes': 'like_count',
+    'dislikes': 'dislike_count',
+    'bookmarks': 'bookmark_count',
+    'shares': 'share_count'
+}
+TOGGLED_ENGAGEMENTS = {'likes': 'dislikes', 'dislikes': 'likes', 'bookmarks': None}
+
+def array_append_item(client, params: Dict[str, Any]) -> bool:
+    with _lock:
+        response = client.table(params['p_table']).select(params['p_column']).eq(params['p_key_column'], params['p_key']).limit(1).execute()
+        if not response.data:
+            return False
+        items = response.data[0][params['p_column']] or []
+        if not (params.get('p_unique', True) and params['p_item'] in items):
+            items = items + [params['p_item']]
+        update_data = dict(params.get('p_set') or {})
+        update_data[params['p_column']] = items
+        update_response = client.table(params['p_table']).update(update_data).eq(params['p_key_column'], params['p_key']).execute()
+        return len(update_response.data) > 0
+
+def array_remove_item(client, params: Dict[str, Any]) -> bool:
+    with _lock:
+        response = client.table(params['p_table']).select(params['p_column']).eq(params['p_key_column'], params['p_key']).limit(1).execute()
+        if not response.data:
+            return False
+        items = [item for item in response.data[0][params['p_column']] or [] if item != params['p_item']]
+        update_data = dict(params.get('p_set') or {})
+        update_data[params['p_column']] = items
+        update_response = client.table(params['p_table']).update(update_data).eq(params['p_key_column'], params['p_key']).execute()
+        return len(update_response.data) > 0
+
+def bump_engagement_counters(client, repo_id: str, user_id: str, access_type: str, delta: int) -> None:
+    field = ENGAGEMENT_COUNTERS[access_type]
+    for table, key_column, key in (('repository_counters', 'repo_id', repo_id), ('user_counters', 'user_id', user_id)):
+        response = client.table(table).select(field).eq(key_column, key).limit(1).execute()
+        if response.data:
+            client.table(table).update({field: (response.data[0][field] or 0) + delta}).eq(key_column, key).execute()
+        else:
+            counters = {name: 0 for name in ENGAGEMENT_COUNTERS.values()}
+            counters[field] = delta
+            client.table(table).insert({key_column: key, **counters}).execute()
+
+def set_engagement_state(client, repo_id: str, user_id: str, access_type: str, now: str) -> bool:
+    response = client.table('engagement_state').select('active, event_count').eq('repo_id', repo_id).eq('user_id', user_id).eq('access_type', access_type).limit(1).execute()
+    if not response.data:
+        client.table('engagement_state').insert({'repo_id': repo_id, 'user_id': user_id, 'access_type': access_type, 'active': True, 'event_count': 1, 'last_at': now}).execute()
+        return True
+    state = response.data[0]
+    active = not state['active'] if access_type in TOGGLED_ENGAGEMENTS else True
+    client.table('engagement_state').update({'active': active, 'event_count': state['event_count'] + 1, 'last_at': now}).eq('repo_id', repo_id).eq('user_id', user_id).eq('access_type', access_type).execute()
+    return active
+
+def record_engagement(client, params: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    repo_id, user_id, access_type = params['p_repo_id'], params['p_user_id'], params['p_access_type']
+    if access_type not in ENGAGEMENT_COUNTERS:
+        return None
+    with _lock:
+        response = client.table('document_repositories').select('owner_id').eq('repo_id', repo_id).limit(1).execute()
+        if not response.data or response.data[0]['owner_id'] in (None, user_id):
+            return None
+        now = datetime.now().isoformat()
+        client.table('engagement_events').insert({'repo_id': repo_id, 'user_id': user_id, 'access_type': access_type, 'created_at': now}).execute()
+        active = set_engagement_state(client, repo_id, user_id, access_type, now)
+        bump_engagement_counters(client, repo_id, user_id, access_type, 1 if active else -1)
+        opposite = TOGGLED_ENGAGEMENTS.get(access_type)
+        if active and opposite:
+            response = client.table('engagement_state').update({'active': False}).eq('repo_id', repo_id).eq('user_id', user_id).eq('access_type', opposite).eq('active', True).execute()
+            if response.data:
+                bump_engagement_counters(client, repo_id, user_id, opposite, -1)
+        response = client.table('engagement_state').select('access_type, last_at').eq('repo_id', repo_id).eq('user_id', user_id).eq('active', True).execute()
+        return {row['access_type']: row['last_at'] for row in response.data}
+
+def build_search_index(client) -> sqlite3.Connection:
+    response = client.table('repository_summaries').select('*').eq('is_public', True).eq('is_deleted', False).execute()
+    connection = sqlite3.connect(':memory:', check_same_thread=False)
+    connection.execute("create table repositories (repo_id text primary key, owner_id text, created_at text, data text)")
+    connection.execute("create virtual table repository_search using fts5(repo_id unindexed, name, description, categories, tokenize='unicode61 remove_diacritics 2')")
+    for row in response.data:
+        data = {key: value for key, value in row.items() if key not in ('documents', 'related_repositories')}
+        connection.execute("insert into repositories values (?, ?, ?, ?)", (row['repo_id'], row['owner_id'], row['created_at'], json.dumps(data)))
+        connection.execute("insert into repository_search values (?, ?, ?, ?)", (row['repo_id'], row['name'] or '', row['description'] or '', ' '.join(row['categories'] or [])))
+    return connection
+
+def get_search_index(client) -> sqlite3.Connection:
+    with _lock:
+        if _search_index['connection'] is None or time.monotonic() - _search_index['built_at'] > LOCAL_SEARCH_TTL:
+            _search_index['connection'] = build_search_index(client)
+            _search_index['built_at'] = time.monotonic()
+        return _search_index['connection']
+
+def fts_query(query: Optional[str]) -> Optional[str]:
+    words = re.findall(r"\w+", query or '')
+    return ' '.join(f'"{word}"*' for word in words) if words else None
+
+def search_public_repositories(client, params: Dict[str, Any]) -> Dict[str, Any]:
+    connection = get_search_index(client)
+    match = fts_query(params.get('p_query'))
+    cursor = params.get('p_cursor')
+    limit = params.get('p_limit', 20)
+    count_cap = params.get('p_count_cap', 1000)
+    if match:
+        weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+        matches = f"""select r.repo_id, r.data, -bm25(repository_search, {weights}) as sort_key
+            from repository_search join repositories r on r.repo_id = repository_search.repo_id
+            where repository_search match ? and r.owner_id != ?"""
+        args: List[Any] = [match, params['p_user_id']]
+    else:
+        matches = "select repo_id, data, created_at as sort_key from repositories where owner_id != ?"
+        args = [params['p_user_id']]
+    page_sql = f"select data, sort_key from ({matches})"
+    page_args = list(args)
+    if cursor:
+        page_sql += " where sort_key < ? or (sort_key = ? and repo_id < ?)"
+        page_args += [cursor['key'], cursor['key'], cursor['repo_id']]
+    page_sql += " order by sort_key desc, repo_id desc limit ?"
+    with _lock:
+        rows = connection.execute(page_sql, page_args + [limit]).fetchall()
+        total = connection.execute(f"select count(*) from ({matches} limit ?)", args + [count_cap]).fetchone()[0]
+    items = []
+    for data, sort_key in rows:
+        item = json.loads(data)
+        if match:
+            item['rank'] = sort_key
+        items.append(item)
+    return {'items': items, 'total_estimate': total}
+
+LOCAL_FUNCTIONS: Dict[str, Callable[[Any, Dict[str, Any]], Any]] = {
+    'array_append_item': array_append_item,
+    'array_remove_item': array_remove_item,
+    'record_engagement': record_engagement,
+    'search_public_repositories': search_public_repositories,
+}
+
+def register_local_function(name: str, function: Callable[[Any, Dict[str, Any]], Any]) -> None:
+    LOCAL_FUNCTIONS[name] = function
+
+def has_local_function(name: str) -> bool:
+    return name in LOCAL_FUNCTIONS
+
+def call_local_function(client, name: str, params: Dict[str, Any]) -> Any:
+    return LOCAL_FUNCTIONS[name](client, params)
@@ -0,0 +1,284 @@
+import json
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+DEFAULT_BUDGET = {'calls': 40, 'latency_ms': 2000.0, 'bytes': 5_000_000, 'n_plus_one': 3}
+RECENT_RERUNS = 50
+STATS_LOG_INTERVAL = 300
+SIZE_SAMPLE_ROWS = 8
+
+@dataclass
+class CallRecord:
+    kind: str
+    name: str
+    shape: str
+    latency_ms: float
+    size: int
+    rows: int
+    error: Optional[str] = None
+
+@dataclass
+class RerunRecorder:
+    page: str
+    started_at: float = field(default_factory=time.time)
+    calls: List[CallRecord] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add(self, record: CallRecord) -> None:
+        with self.lock:
+            self.calls.append(record)
+
+    def report(self) -> Dict[str, Any]:
+        with self.lock:
+            calls = list(self.calls)
+        shapes = Counter(call.shape for call in calls)
+        return {
+            'page': self.page,
+            'started_at': self.started_at,
+            'calls': len(calls),
+            'errors': sum(1 for call in calls if call.error),
+            'latency_ms': round(sum(call.latency_ms for call in calls), 1),
+            'bytes': sum(call.size for call in calls),
+            'rows': sum(call.rows for call in calls),
+            'by_kind': dict(Counter(call.kind for call in calls)),
+            'shapes': dict(shapes.most_common())
+        }
+
+_local = threading.local()
+_sessions: Dict[str, RerunRecorder] = {}
+_sessions_lock = threading.Lock()
+_recent: Deque[Dict[str, Any]] = deque(maxlen=RECENT_RERUNS)
+_page_stats: Dict[str, Dict[str, float]] = defaultdict(lambda: {'reruns': 0, 'calls': 0, 'latency_ms': 0.0, 'bytes': 0, 'max_calls': 0, 'n_plus_one': 0, 'over_budget': 0})
+_page_lock = threading.Lock()
+_generation_stats: Dict[str, Dict[str, float]] = defaultdict(lambda: {'responses': 0, 'ttft_ms': 0.0, 'max_ttft_ms': 0.0, 'total_ms': 0.0, 'max_total_ms': 0.0, 'chars': 0})
+_generation_lock = threading.Lock()
+_stat_sources: Dict[str, Callable[[], Any]] = {}
+_stats_lock = threading.Lock()
+_stats_logged_at = time.monotonic()
+
+def session_key() -> str:
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else f"thread-{threading.get_ident()}"
+
+def current_recorder() -> Optional[RerunRecorder]:
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is not None:
+        return recorder
+    with _sessions_lock:
+        return _sessions.get(session_key())
+
+def monitor_settings() -> Dict[str, Any]:
+    try:
+        return st.secrets.get("monitor", {})
+    except FileNotFoundError:
+        return {}
+
+def get_budget(page: str) -> Dict[str, float]:
+    settings = monitor_settings()
+    budget = dict(DEFAULT_BUDGET)
+    budget.update({key: value for key, value in settings.items() if key in DEFAULT_BUDGET})
+    budget.update(settings.get("pages", {}).get(page, {}))
+    return budget
+
+def begin_rerun(page: str) -> None:
+    end_rerun()
+    with _sessions_lock:
+        _sessions[session_key()] = RerunRecorder(page=page)
+
+def end_rerun() -> Optional[Dict[str, Any]]:
+    with _sessions_lock:
+        recorder = _sessions.pop(session_key(), None)
+    if recorder is None:
+        return None
+    report = recorder.report()
+    budget = get_budget(recorder.page)
+    report['n_plus_one'] = {shape: count for shape, count in report['shapes'].items() if count >= budget['n_plus_one']}
+    report['over_budget'] = [key for key in ('calls', 'latency_ms', 'bytes') if report[key] > budget[key]]
+    for shape, count in report['n_plus_one'].items():
+        print(f"Possible N+1 on page '{recorder.page}' : {count} x {shape}")
+    for key in report['over_budget']:
+        print(f"Database budget exceeded on page '{recorder.page}' : {key} = {report[key]} (budget {budget[key]})")
+    with _page_lock:
+        stats = _page_stats[recorder.page]
+        stats['reruns'] += 1
+        stats['calls'] += report['calls']
+        stats['latency_ms'] += report['latency_ms']
+        stats['bytes'] += report['bytes']
+        stats['max_calls'] = max(stats['max_calls'], report['calls'])
+        stats['n_plus_one'] += len(report['n_plus_one'])
+        stats['over_budget'] += bool(report['over_budget'])
+        _recent.append(report)
+    log_runtime_stats()
+    return report
+
+def bind(function: Callable) -> Callable:
+    recorder = current_recorder()
+    def bound(*args, **kwargs):
+        previous = getattr(_local, 'recorder', None)
+        _local.recorder = recorder
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.recorder = previous
+    return bound
+
+def page_stats() -> Dict[str, Dict[str, float]]:
+    with _page_lock:
+        return {page: dict(stats) for page, stats in _page_stats.items()}
+
+def recent_reruns() -> List[Dict[str, Any]]:
+    with _page_lock:
+        return list(_recent)
+
+def record_generation(kind: str, ttft_ms: Optional[float], total_ms: float, chars: int) -> None:
+    ttft_ms = total_ms if ttft_ms is None else ttft_ms
+    with _generation_lock:
+        stats = _generation_stats[kind]
+        stats['responses'] += 1
+        stats['ttft_ms'] += ttft_ms
+        stats['max_ttft_ms'] = max(stats['max_ttft_ms'], ttft_ms)
+        stats['total_ms'] += total_ms
+        stats['max_total_ms'] = max(stats['max_total_ms'], total_ms)
+        stats['chars'] += chars
+
+def generation_stats() -> Dict[str, Dict[str, float]]:
+    with _generation_lock:
+        return {kind: dict(stats) for kind, stats in _generation_stats.items()}
+
+def register_stats(name: str, source: Callable[[], Any]) -> None:
+    with _stats_lock:
+        _stat_sources[name] = source
+
+def runtime_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        sources = dict(_stat_sources)
+    stats = {}
+    for name, source in sources.items():
+        try:
+            stats[name] = source()
+        except Exception as e:
+            stats[name] = {'error': str(e)}
+    return stats
+
+def log_runtime_stats(force: bool = False) -> None:
+    """Prints every registered stats source, at most once per [monitor] stats_interval seconds (0 disables)."""
+    global _stats_logged_at
+    interval = monitor_settings().get("stats_interval", STATS_LOG_INTERVAL)
+    now = time.monotonic()
+    with _stats_lock:
+        if not force and (not interval or now - _stats_logged_at < interval):
+            return
+        _stats_logged_at = now
+    print(f"Runtime stats : {json.dumps(runtime_stats(), default=str)}")
+
+def payload_size(value: Any) -> int:
+    """Approximate JSON size of a payload, without serializing it: long lists are measured on a sample of rows."""
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(key) + payload_size(item) + 4 for key, item in value.items()) + 2
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return 2
+        sample = value[:SIZE_SAMPLE_ROWS]
+        return sum(payload_size(item) + 1 for item in sample) * len(value) // len(sample) + 1
+    if hasattr(value, 'data'):
+        return payload_size(value.data)
+    return len(str(value))
+
+def record(kind: str, name: str, shape: str, started: float, size: int, rows: int, error: Optional[Exception] = None) -> None:
+    recorder = current_recorder()
+    if recorder is not None:
+        recorder.add(CallRecord(kind=kind, name=name, shape=shape, latency_ms=(time.perf_counter() - started) * 1000, size=size, rows=rows, error=type(error).__name__ if error else None))
+
+class MonitoredQuery:
+    def __init__(self, target: Any, kind: str, name: str, steps: List[str]):
+        self.target = target
+        self.kind = kind
+        self.name = name
+        self.steps = steps
+
+    def __getattr__(self, attribute: str) -> Any:
+        value = getattr(self.target, attribute)
+        if not callable(value):
+            return value
+        def step(*args, **kwargs):
+            result = value(*args, **kwargs)
+            label = f"{attribute}({args[0]})" if args and isinstance(args[0], str) else attribute
+            return MonitoredQuery(result, self.kind, self.name, self.steps + [label]) if hasattr(result, 'execute') else result
+        return step
+
+    def execute(self) -> Any:
+        shape = f"{self.kind}:{self.name} {' '.join(self.steps)}"
+        started = time.perf_counter()
+        try:
+            response = self.target.execute()
+        except Exception as e:
+            record(self.kind, self.name, shape, started, 0, 0, e)
+            raise
+        data = getattr(response, 'data', None)
+        record(self.kind, self.name, shape, started, payload_size(data), len(data) if isinstance(data, list) else 1)
+        return response
+
+class MonitoredService:
+    def __init__(self, target: Any, kind: str, name: str):
+        self.target = target
+        self.kind = kind
+        self.name = name
+
+    def __getattr__(self, attribute: str) -> Any:
+        value = getattr(self.target, attribute)
+        if not callable(value):
+            return value
+        def call(*args, **kwargs):
+            shape = f"{self.kind}:{self.name} {attribute}"
+            started = time.perf_counter()
+            try:
+                result = value(*args, **kwargs)
+            except Exception as e:
+                record(self.kind, self.name, shape, started, 0, 0, e)
+                raise
+            sent = sum(payload_size(arg) for arg in list(args) + list(kwargs.values()) if isinstance(arg, (bytes, bytearray)))
+            record(self.kind, self.name, shape, started, sent + payload_size(result), len(result) if isinstance(result, list) else 1)
+            return result
+        return call
+
+class MonitoredStorage:
+    def __init__(self, target: Any):
+        self.target = target
+
+    def from_(self, bucket: str) -> MonitoredService:
+        return MonitoredService(self.target.from_(bucket), 'storage', bucket)
+
+    def __getattr__(self, attribute: str) -> Any:
+        return getattr(self.target, attribute)
+
+class MonitoredClient:
+    """Wraps a backend client and records every table, rpc, storage and auth call against the current rerun."""
+
+    def __init__(self, client: Any):
+        self.client = client
+        self.storage = MonitoredStorage(client.storage)
+        self.auth = MonitoredService(client.auth, 'auth', 'auth')
+
+    def table(self, name: str) -> MonitoredQuery:
+        return MonitoredQuery(self.client.table(name), 'table', name, [])
+
+    def rpc(self, name: str, params: Dict[str, Any]) -> MonitoredQuery:
+        return MonitoredQuery(self.client.rpc(name, params), 'rpc', name, [])
+
+    def __getattr__(self, attribute: str) -> Any:
+        return getattr(self.client, attribute)
+
+register_stats("pages", page_stats)
+register_stats("generation", generation_stats)
+
+def monitor_client(client: Any) -> Any:
+    return MonitoredClient(client) if monitor_settings().get("enabled", True) else client
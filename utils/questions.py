@@ -0,0 +1,162 @@
+import argparse
+import random
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from model import ChatHistory, Message
+from utils.chat import create_message
+from utils.chunks import ChunkSet, assemble_chunks
+from utils.data import initialize_supabase
+from utils.embedding import embed_query, generate_embedding
+from utils.llm import PROMPTS, extract_qcm_data, format_questions, get_context_from_chunks, initialize_gemini_model, is_valid_question, question_fingerprint
+from utils.sessions import remember_conversation
+
+db = initialize_supabase()
+
+BANK_TARGET = 40
+BANK_MAX = 400
+BANK_LOW_WATER = 10
+BANK_BATCH = 10
+BANK_ATTEMPTS = 3
+BANK_CONTEXT_CHUNKS = 12
+BANK_WORKERS = 2
+BANK_TOPIC_SIMILARITY = 0.35
+
+bank_executor = ThreadPoolExecutor(max_workers=BANK_WORKERS, thread_name_prefix="question-bank")
+_pending = set()
+_pending_lock = threading.Lock()
+
+def bank_scope(page_range: Optional[Tuple[int, int]] = None) -> str:
+    return f"pages:{page_range[0]}-{page_range[1]}" if page_range else "all"
+
+def generate_questions(chunks: ChunkSet, count: int) -> List[Dict[str, Any]]:
+    model = initialize_gemini_model()
+    if not model:
+        raise Exception("Failed to initialize the model")
+    sample = chunks.take(np.sort(np.random.choice(len(chunks), min(BANK_CONTEXT_CHUNKS, len(chunks)), replace=False)))
+    prompt = PROMPTS["exercise"].format(
+        context=get_context_from_chunks(sample, max_chunks=BANK_CONTEXT_CHUNKS),
+        exercise_request="the key concepts of this material",
+        number_of_questions=count
+    )
+    return [question for question in extract_qcm_data(model.generate_content(prompt).text) if is_valid_question(question)]
+
+def get_bank(repo_id: str, scope: str) -> List[Dict]:
+    response = db.table('question_bank').select('question_id, fingerprint, question, embedding').eq('repo_id', repo_id).eq('scope', scope).order('created_at').execute()
+    return response.data
+
+def get_seen_question_ids(user_id: str, repo_id: str) -> set:
+    response = db.table('seen_questions').select('question_id').eq('user_id', user_id).eq('repo_id', repo_id).execute()
+    return {row['question_id'] for row in response.data}
+
+def top_up_bank(repo_id: str, document_ids: List[str], page_range: Optional[Tuple[int, int]] = None, target: int = BANK_TARGET) -> int:
+    scope = bank_scope(page_range)
+    bank = get_bank(repo_id, scope)
+    fingerprints = {row['fingerprint'] for row in bank}
+    chunks = assemble_chunks(document_ids)
+    if page_range:
+        chunks = chunks.page_range(*page_range)
+    added = 0
+    for _ in range(BANK_ATTEMPTS):
+        missing = min(target, BANK_MAX) - len(bank) - added
+        if missing <= 0 or len(chunks) == 0:
+            break
+        try:
+            questions = generate_questions(chunks, min(BANK_BATCH, missing))
+            rows = []
+            for question in questions:
+                fingerprint = question_fingerprint(question)
+                if fingerprint not in fingerprints:
+                    fingerprints.add(fingerprint)
+                    rows.append({
+                        'question_id': str(uuid.uuid4()),
+                        'repo_id': repo_id,
+                        'scope': scope,
+                        'fingerprint': fingerprint,
+                        'question': question,
+                        'embedding': generate_embedding(question['stem']),
+                        'created_at': datetime.now().isoformat()
+                    })
+            if rows:
+                response = db.table('question_bank').upsert(rows, on_conflict='repo_id,scope,fingerprint', ignore_duplicates=True).execute()
+                added += len(response.data)
+        except Exception as e:
+            print(f"Question bank error : {e}")
+            break
+    return added
+
+def schedule_top_up(repo_id: str, document_ids: List[str], page_range: Optional[Tuple[int, int]] = None, target: int = BANK_TARGET) -> bool:
+    key = (repo_id, bank_scope(page_range))
+    with _pending_lock:
+        if key in _pending:
+            return False
+        _pending.add(key)
+    def run():
+        try:
+            top_up_bank(repo_id, document_ids, page_range, target)
+        finally:
+            with _pending_lock:
+                _pending.discard(key)
+    bank_executor.submit(run)
+    return True
+
+def match_topic(rows: List[Dict], topic: str) -> List[Dict]:
+    rows = [row for row in rows if row.get('embedding')]
+    if not rows:
+        return []
+    embeddings = np.asarray([row['embedding'] for row in rows], dtype=np.float32)
+    query = embed_query(topic)
+    similarities = embeddings @ query / np.maximum(np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query), 1e-12)
+    return [row for row, similarity in zip(rows, similarities) if similarity >= BANK_TOPIC_SIMILARITY]
+
+def serve_questions(user_id: str, repo_id: str, document_ids: List[str], count: int, page_range: Optional[Tuple[int, int]] = None, topic: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Questions from the bank this user has not been served yet, close to the topic when one is given.
+
+    Schedules a background top-up when few unseen questions remain.
+    """
+    bank = get_bank(repo_id, bank_scope(page_range))
+    seen = get_seen_question_ids(user_id, repo_id)
+    unseen = [row for row in bank if row['question_id'] not in seen]
+    candidates = match_topic(unseen, topic) if topic else unseen
+    served = random.sample(candidates, count) if len(candidates) >= count else []
+    if served:
+        try:
+            db.table('seen_questions').upsert([{
+                'user_id': user_id,
+                'question_id': row['question_id'],
+                'repo_id': repo_id,
+                'seen_at': datetime.now().isoformat()
+            } for row in served], on_conflict='user_id,question_id', ignore_duplicates=True).execute()
+        except Exception as e:
+            print(f"Seen questions error : {e}")
+    if len(unseen) - len(served) < BANK_LOW_WATER and len(bank) < BANK_MAX:
+        schedule_top_up(repo_id, document_ids, page_range, max(BANK_TARGET, len(bank) + BANK_BATCH + count))
+    return [row['question'] for row in served]
+
+def bank_exercise_chat(history: ChatHistory, user_id: str, document_ids: List[str], messages: List[Message], count: int = 3, topic: Optional[str] = None, page_range: Optional[Tuple[int, int]] = None) -> Optional[Tuple[None, str, bool, List[Message]]]:
+    questions = serve_questions(user_id, history.repo_source, document_ids, count, page_range, topic)
+    if not questions:
+        return None
+    request = f"Generate {count} exercises on: {topic}" if topic else f"Generate {count} exercises"
+    msgs = []
+    for content, is_assistant in ((f"{request} from the question bank", False), (format_questions(questions), True)):
+        message_id = create_message(history.chat_id, content, is_assistant=is_assistant)
+        msgs.append(Message(message_id=message_id, chat_id=history.chat_id, content=content, is_assistant=is_assistant))
+    remember_conversation(history.chat_id, None, history.messages + [msg.message_id for msg in msgs], messages + msgs)
+    return None, msgs[-1].content, True, msgs
+
+def fill_banks(repo_ids: Optional[List[str]] = None, target: int = BANK_TARGET) -> Dict[str, int]:
+    query = db.table('document_repositories').select('repo_id, documents').eq('is_deleted', False)
+    if repo_ids:
+        query = query.in_('repo_id', repo_ids)
+    return {row['repo_id']: top_up_bank(row['repo_id'], row['documents'] or [], None, target) for row in query.execute().data}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate question banks for repositories.")
+    parser.add_argument("--repo", action="append", help="repository id, repeatable; defaults to every repository")
+    parser.add_argument("--target", type=int, default=BANK_TARGET)
+    args = parser.parse_args()
+    print(f"Questions added : {fill_banks(args.repo, args.target)}")
@@ -0,0 +1,69 @@
+import hashlib
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+import numpy as np
+import streamlit as st
+from utils.cache import get_cache
+from utils.monitor import register_stats
+
+DEFAULT_RESPONSE_CACHE = {'enabled': False, 'ttl': 3600, 'maxsize': 512, 'similarity': 0.95, 'variants': 8}
+
+_lock = threading.Lock()
+_stats = {'lookups': 0, 'hits': 0, 'stores': 0}
+
+def response_cache_settings() -> Dict[str, Any]:
+    settings = dict(DEFAULT_RESPONSE_CACHE)
+    try:
+        settings.update({key: value for key, value in st.secrets.get("response_cache", {}).items() if key in DEFAULT_RESPONSE_CACHE})
+    except FileNotFoundError:
+        pass
+    return settings
+
+def response_cache():
+    settings = response_cache_settings()
+    return get_cache("llm_responses", ttl=settings['ttl'], maxsize=settings['maxsize'])
+
+def response_key(kind: str, repo_id: str, context: str, options: Hashable = None) -> Tuple:
+    return (kind, repo_id, options, hashlib.sha1(context.encode('utf-8')).hexdigest())
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    norms = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(a @ b) / norms if norms else 0.0
+
+def live_variants(key: Tuple, ttl: float) -> list:
+    now = time.monotonic()
+    return [variant for variant in response_cache().get(key, []) if now - variant[2] < ttl]
+
+def lookup_response(key: Tuple, query_embedding: np.ndarray) -> Optional[str]:
+    """Cached response for the same prompt type, repository and retrieved context, if an earlier query was similar enough."""
+    settings = response_cache_settings()
+    if not settings['enabled']:
+        return None
+    scored = [(similarity(embedding, query_embedding), response) for embedding, response, _ in live_variants(key, settings['ttl'])]
+    score, response = max(scored, key=lambda item: item[0], default=(0.0, None))
+    hit = response is not None and score >= settings['similarity']
+    with _lock:
+        _stats['lookups'] += 1
+        _stats['hits'] += hit
+    return response if hit else None
+
+def store_response(key: Tuple, query_embedding: np.ndarray, response: str) -> None:
+    settings = response_cache_settings()
+    if not settings['enabled'] or not response:
+        return
+    with _lock:
+        variants = live_variants(key, settings['ttl']) + [(query_embedding, response, time.monotonic())]
+        response_cache().set(key, variants[-settings['variants']:])
+        _stats['stores'] += 1
+
+def response_cache_stats() -> Dict[str, Any]:
+    cache_stats = response_cache().stats()
+    with _lock:
+        stats = dict(_stats)
+    stats['hit_rate'] = stats['hits'] / stats['lookups'] if stats['lookups'] else 0.0
+    stats['size'] = cache_stats['size']
+    stats['evictions'] = cache_stats['evictions']
+    return stats
+
+register_stats("response_cache", response_cache_stats)
@@ -0,0 +1,68 @@
+import copy
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
+import streamlit as st
+from model import Message
+from utils.cache import MISSING, get_cache
+
+DEFAULT_SESSION_CACHE = {'idle_seconds': 1800, 'maxsize': 256}
+
+@dataclass(frozen=True)
+class CachedConversation:
+    """Snapshot of one conversation shared by every Streamlit session of the process: Gemini history and message dicts.
+
+    Each session restores its own copies, so concurrent turns never share a chat session or message objects.
+    """
+    message_ids: Tuple[str, ...]
+    messages: Tuple[Dict[str, Any], ...]
+    history: Optional[Tuple[Dict[str, Any], ...]]
+
+    def restore_messages(self) -> List[Message]:
+        return [Message(**copy.deepcopy(message)) for message in self.messages]
+
+    def restore_history(self) -> Optional[List[Dict[str, Any]]]:
+        return copy.deepcopy(list(self.history)) if self.history is not None else None
+
+def session_cache_settings() -> Dict[str, Any]:
+    settings = dict(DEFAULT_SESSION_CACHE)
+    try:
+        settings.update({key: value for key, value in st.secrets.get("chat_sessions", {}).items() if key in DEFAULT_SESSION_CACHE})
+    except FileNotFoundError:
+        pass
+    return settings
+
+def conversation_cache():
+    settings = session_cache_settings()
+    return get_cache("chat_sessions", ttl=settings['idle_seconds'], maxsize=settings['maxsize'])
+
+def snapshot_history(chat_session: Any) -> Optional[Tuple[Dict[str, Any], ...]]:
+    if chat_session is None:
+        return None
+    return tuple({'role': content.role, 'parts': [part.text for part in content.parts]} for content in chat_session.history)
+
+def remember_conversation(chat_id: str, chat_session: Any, message_ids: List[str], messages: List[Message]) -> None:
+    conversation_cache().set(chat_id, CachedConversation(
+        message_ids=tuple(message_ids),
+        messages=tuple(message.dict() for message in messages),
+        history=snapshot_history(chat_session)
+    ))
+
+def recall_conversation(chat_id: str, message_ids: List[str]) -> Optional[CachedConversation]:
+    cache = conversation_cache()
+    conversation = cache.get(chat_id)
+    if conversation is MISSING or conversation.message_ids != tuple(message_ids):
+        return None
+    cache.set(chat_id, conversation)
+    return conversation
+
+def refresh_conversation_message(chat_id: str, message: Message) -> None:
+    """Replaces one message in the snapshot after it was updated in place, e.g. when a quiz score is saved."""
+    cache = conversation_cache()
+    conversation = cache.get(chat_id)
+    if conversation is MISSING:
+        return
+    messages = tuple(message.dict() if cached['message_id'] == message.message_id else cached for cached in conversation.messages)
+    cache.set(chat_id, replace(conversation, messages=messages))
+
+def forget_conversation(chat_id: str) -> None:
+    conversation_cache().invalidate(chat_id)
@@ -0,0 +1,199 @@
+import random
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+import httpx
+import streamlit as st
+from utils.monitor import register_stats
+
+DEFAULT_TRANSPORT = {
+    'max_connections': 20,
+    'max_keepalive_connections': 10,
+    'keepalive_expiry': 30.0,
+    'connect_timeout': 5.0,
+    'read_timeout': 20.0,
+    'write_timeout': 60.0,
+    'pool_timeout': 5.0,
+    'retries': 3,
+    'deadline': 30.0,
+    'backoff_base': 0.2,
+    'backoff_max': 3.0,
+    'breaker_threshold': 5,
+    'breaker_cooldown': 30.0
+}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+RETRY_STATUSES = {429, 502, 503, 504}
+
+class CircuitOpenError(httpx.TransportError):
+    pass
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def allow(self) -> bool:
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+class ResilientTransport(httpx.BaseTransport):
+    """Pooled HTTP transport with jittered retries for idempotent requests and a per-host circuit breaker.
+
+    All attempts of one request, backoff included, share the `deadline` budget: each attempt's timeouts are
+    capped to what is left of it and no retry is started that could not finish in time.
+    """
+
+    def __init__(self, settings: Dict[str, Any], transport: Optional[httpx.BaseTransport] = None):
+        self.settings = settings
+        self.transport = transport or httpx.HTTPTransport(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=settings['max_connections'],
+                max_keepalive_connections=settings['max_keepalive_connections'],
+                keepalive_expiry=settings['keepalive_expiry']
+            )
+        )
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.metrics: Counter = Counter()
+        self.latency_ms = 0.0
+        self.lock = threading.Lock()
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(self.settings['breaker_threshold'], self.settings['breaker_cooldown'])
+            return self.breakers[host]
+
+    def count(self, *keys: str, latency_ms: float = 0.0) -> None:
+        with self.lock:
+            self.metrics.update(keys)
+            self.latency_ms += latency_ms
+
+    def backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.settings['backoff_max'])
+        return random.uniform(0, min(self.settings['backoff_max'], self.settings['backoff_base'] * 2 ** attempt))
+
+    def retry_delay(self, attempt: int, attempts: int, deadline: float, response: Optional[httpx.Response] = None) -> Optional[float]:
+        """Backoff before the next attempt, or None when no attempt is left or it would start past the deadline."""
+        if attempt >= attempts - 1:
+            return None
+        delay = self.backoff(attempt, response)
+        if time.monotonic() + delay >= deadline:
+            self.count('deadline_exceeded')
+            return None
+        return delay
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        breaker = self.breaker(request.url.host)
+        if not breaker.allow():
+            self.count('rejected')
+            raise CircuitOpenError(f"Circuit open for {request.url.host}", request=request)
+        attempts = self.settings['retries'] + 1 if request.method in IDEMPOTENT_METHODS else 1
+        deadline = time.monotonic() + self.settings['deadline']
+        timeouts = dict(request.extensions.get('timeout') or {})
+        for attempt in range(attempts):
+            remaining = max(deadline - time.monotonic(), 0.001)
+            request.extensions['timeout'] = {key: min(value, remaining) if value is not None else remaining for key, value in timeouts.items()} or {'connect': remaining, 'read': remaining, 'write': remaining, 'pool': remaining}
+            started = time.perf_counter()
+            try:
+                response = self.transport.handle_request(request)
+            except (httpx.TimeoutException, httpx.NetworkError) as e:
+                self.count('requests', 'timeouts' if isinstance(e, httpx.TimeoutException) else 'network_errors', latency_ms=(time.perf_counter() - started) * 1000)
+                delay = self.retry_delay(attempt, attempts, deadline)
+                if delay is None:
+                    breaker.record_failure()
+                    raise
+                self.count('retries')
+                time.sleep(delay)
+                continue
+            except Exception:
+                breaker.record_failure()
+                raise
+            self.count('requests', f"status_{response.status_code}", latency_ms=(time.perf_counter() - started) * 1000)
+            delay = self.retry_delay(attempt, attempts, deadline, response) if response.status_code in RETRY_STATUSES else None
+            if delay is not None:
+                response.close()
+                self.count('retries')
+                time.sleep(delay)
+                continue
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            return response
+
+    def stats(self) -> Dict[str, Any]:
+        pool = getattr(self.transport, '_pool', None)
+        connections = list(getattr(pool, 'connections', []))
+        with self.lock:
+            stats = dict(self.metrics)
+            stats['latency_ms'] = round(self.latency_ms, 1)
+        stats['pool_connections'] = len(connections)
+        stats['pool_idle'] = sum(1 for connection in connections if connection.is_idle())
+        stats['breakers'] = {host: breaker.state for host, breaker in self.breakers.items()}
+        return stats
+
+    def close(self) -> None:
+        self.transport.close()
+
+def transport_settings() -> Dict[str, Any]:
+    settings = dict(DEFAULT_TRANSPORT)
+    try:
+        settings.update({key: value for key, value in st.secrets.get("transport", {}).items() if key in DEFAULT_TRANSPORT})
+    except FileNotFoundError:
+        pass
+    return settings
+
+@st.cache_resource
+def get_transport() -> ResilientTransport:
+    return ResilientTransport(transport_settings())
+
+def create_http_client() -> httpx.Client:
+    settings = transport_settings()
+    return httpx.Client(
+        transport=get_transport(),
+        follow_redirects=True,
+        timeout=httpx.Timeout(
+            connect=settings['connect_timeout'],
+            read=settings['read_timeout'],
+            write=settings['write_timeout'],
+            pool=settings['pool_timeout']
+        )
+    )
+
+def transport_stats() -> Dict[str, Any]:
+    return get_transport().stats()
+
+register_stats("transport", transport_stats)
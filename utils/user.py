@@ -1,14 +1,28 @@
+import os
 import random
-from datetime import datetime
+import streamlit as st
 from typing import List, Optional
-from model import Access, LearningPreference, StudyStats, User
+from model import LearningPreference, StudyStats, User, UserProfileLite
 from utils.badge import DAILY_CHALLENGES_POOL
-from utils.data import initialize_supabase
+from utils.buffer import StudyStatsBuffer
+from utils.cache import cached
+from utils.data import CACHE_DIR, initialize_supabase
 
 db = initialize_supabase()
 
+USER_COLUMNS = 'user_id, username, profile_picture, created_at, last_login, learning_preferences, repositories, chat_histories, experience_points, badges, daily_challenges, study_stats, followers, following, is_deleted, telegram_id, notification_preferences'
+USER_PROFILE_COLUMNS = 'user_id, username, profile_picture, experience_points, is_deleted'
+
+@cached("user_profile", ttl=300, maxsize=4096)
+def get_user_profile(user_id: str) -> Optional[UserProfileLite]:
+    response = db.table("users").select(USER_PROFILE_COLUMNS).eq("user_id", user_id).limit(1).execute()
+    if not response.data or len(response.data) == 0:
+        return None
+    return UserProfileLite(**response.data[0])
+
+@cached("user", ttl=60, maxsize=512, copy=True)
 def get_user(user_id: str) -> Optional[User]:
-    response = db.table("users").select("*").eq("user_id", user_id).execute()
+    response = db.table("users").select(USER_COLUMNS).eq("user_id", user_id).execute()
     if not response.data or len(response.data) == 0:
         return None
     user_data = response.data[0]
@@ -18,11 +32,6 @@ def get_user(user_id: str) -> Optional[User]:
         created_at=user_data['created_at'],
         last_login=user_data['last_login'],
         learning_preferences=LearningPreference(**user_data['learning_preferences']) if user_data['learning_preferences'] else LearningPreference(),
-        document_accessed=user_data['document_accessed'],
-        liked_documents=user_data['liked_documents'],
-        disliked_documents=user_data['disliked_documents'],
-        bookmarked_documents=user_data['bookmarked_documents'],
-        shared_documents=user_data['shared_documents'],
         experience_points=user_data['experience_points'],
         profile_picture=user_data['profile_picture'],
         telegram_id=user_data['telegram_id'],
@@ -37,10 +46,14 @@ def get_user(user_id: str) -> Optional[User]:
         notification_preferences=user_data['notification_preferences']
     )
     
+def invalidate_user(user_id: str) -> None:
+    get_user.invalidate(user_id)
+    get_user_profile.invalidate(user_id)
+    
 def list_repositories(repo_ids: List[str]) -> List[dict]:
     repositories = []
     for repo_id in repo_ids:
-        response = db.table('document_repositories').select('name, documents').eq('repo_id', repo_id).eq('is_deleted', False).limit(1).execute()
+        response = db.table('repository_summaries').select('name, document_count').eq('repo_id', repo_id).eq('is_deleted', False).limit(1).execute()
         if response.data:
             repositories.append(response.data[0])
     return repositories
@@ -55,63 +68,27 @@ def list_histories(chat_ids: List[str]) -> List[dict]:
 
 def update_user_badges(user_id: str, earned_badges: List[str]) -> bool:
     update_response = db.table('users').update({"badges": earned_badges}).eq('user_id', user_id).execute()
+    invalidate_user(user_id)
     return len(update_response.data) > 0
 
-def update_user_access(user_id: str, access: Access, access_type: str) -> bool:
-    response = db.table('users').select('*').eq('user_id', user_id).limit(1).execute()
-    if not response.data or len(response.data) == 0 or access_type not in ['accesses', 'likes', 'dislikes', 'bookmarks', 'shares']:
-        return False
-    if access.access_id in response.data[0]['repositories']:
-        return False
-    user_data = response.data[0]
-    update_data = {
-        'document_accessed': user_data['document_accessed'], 
-        'liked_documents': user_data['liked_documents'], 
-        'disliked_documents': user_data['disliked_documents'], 
-        'bookmarked_documents': user_data['bookmarked_documents'], 
-        'shared_documents': user_data['shared_documents']
-    }
-    if access_type == 'accesses':
-        update_data['document_accessed'].append(access.dict())
-    elif access_type == 'likes':
-        is_like = False
-        for dislike in update_data['disliked_documents']:
-            if dislike["access_id"] == access.access_id:
-                update_data['disliked_documents'].remove(dislike)
-        for like in update_data['liked_documents']:
-            if like["access_id"] == access.access_id:
-                is_like = True
-                update_data['liked_documents'].remove(like)
-        if not is_like:
-            update_data['liked_documents'].append(access.dict())
-    elif access_type == 'dislikes':
-        is_dislike = False
-        for like in update_data['liked_documents']:
-            if like["access_id"] == access.access_id:
-                update_data['liked_documents'].remove(like)
-        for dislike in update_data['disliked_documents']:
-            if dislike["access_id"] == access.access_id:
-                is_dislike = True
-                update_data['disliked_documents'].remove(dislike)
-        if not is_dislike:
-            update_data['disliked_documents'].append(access.dict())
-    elif access_type == 'bookmarks':
-        is_bookmark = False
-        for bookmark in update_data['bookmarked_documents']:
-            if bookmark["access_id"] == access.access_id:
-                is_bookmark = True
-                update_data['bookmarked_documents'].remove(bookmark)
-        if not is_bookmark:
-            update_data['bookmarked_documents'].append(access.dict())
-    elif access_type == 'shares':
-        update_data['shared_documents'].append(access.dict())
-    update_response = db.table('users').update(update_data).eq('user_id', user_id).execute()
-    return len(update_response.data) > 0
+@st.cache_resource
+def get_study_stats_buffer() -> StudyStatsBuffer:
+    return StudyStatsBuffer(write_study_stats, os.path.join(CACHE_DIR, "study_stats"))
 
 def update_study_stats(user_id: str, study_stat: StudyStats, is_login: bool = False) -> bool:
+    stats_buffer = get_study_stats_buffer()
+    if not is_login:
+        return stats_buffer.add(user_id, study_stat)
+    stats_buffer.flush(user_id)
+    return write_study_stats(user_id, study_stat, is_login)
+
+def flush_study_stats(user_id: str) -> bool:
+    return get_study_stats_buffer().flush(user_id)
+
+def write_study_stats(user_id: str, study_stat: StudyStats, is_login: bool = False) -> bool:
     response = db.table('users').select('study_stats, experience_points, daily_challenges').eq('user_id', user_id).limit(1).execute()
-    if response.data and len(response.data) == 0:
-        return None
+    if not response.data:
+        return False
     new_stat = study_stat
     stats = response.data[0]['study_stats']
     xp = response.data[0]['experience_points']
@@ -141,12 +118,14 @@ def update_study_stats(user_id: str, study_stat: StudyStats, is_login: bool = Fa
             chat_created=stat_data["chat_created"]
         )
         last_activity = old_stat.get_last_activity()
-        last_activity_tz = last_activity.tzinfo
-        now = datetime.now(last_activity_tz)
+        now = study_stat.get_last_activity()
+        if now.tzinfo is None and last_activity.tzinfo is not None:
+            now = now.replace(tzinfo=last_activity.tzinfo)
         if now.date() == last_activity.date():
             is_new = False
             if not is_login:
-                new_stat.total_study_time = (now - last_activity).seconds + old_stat.total_study_time
+                new_stat.total_study_time = max(int((now - last_activity).total_seconds()), 0) + old_stat.total_study_time
+            new_stat.last_activity = max(study_stat.last_activity, old_stat.last_activity)
             new_stat.challenges_completed = study_stat.challenges_completed + old_stat.challenges_completed
             new_stat.correct_answers = study_stat.correct_answers + old_stat.correct_answers
             new_stat.repositories_created = study_stat.repositories_created + old_stat.repositories_created
@@ -188,4 +167,5 @@ def update_study_stats(user_id: str, study_stat: StudyStats, is_login: bool = Fa
     else:
         stats[-1] = new_stat_data
     update_response = db.table('users').update({"study_stats": stats, "experience_points": xp, "daily_challenges": challenges}).eq('user_id', user_id).execute()
+    invalidate_user(user_id)
     return len(update_response.data) > 0
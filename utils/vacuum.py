@@ -0,0 +1,179 @@
+import argparse
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from utils.chunks import forget_document_chunks
+from utils.data import initialize_supabase, remove_from_array
+
+db = initialize_supabase()
+
+VACUUM_BATCH_SIZE = 500
+DELETE_BATCH = 50
+STORAGE_LIST_LIMIT = 100
+STORAGE_REMOVE_BATCH = 100
+ORPHAN_GRACE_HOURS = 24
+STORAGE_OWNERS = {
+    'documents': ('documents', 'doc_id', 'file_path'),
+    'covers': ('documents', 'doc_id', 'cover'),
+    'banners': ('document_repositories', 'repo_id', 'banner'),
+}
+
+def scan_table(table: str, key_column: str, columns: str, batch_size: int) -> Iterator[List[Dict]]:
+    last_key = ''
+    while True:
+        response = db.table(table).select(columns).gt(key_column, last_key).order(key_column).limit(batch_size).execute()
+        if response.data:
+            yield response.data
+        if len(response.data) < batch_size:
+            return
+        last_key = response.data[-1][key_column]
+
+def fetch_rows(table: str, key_column: str, keys: Iterable[str], columns: str) -> Dict[str, Dict]:
+    keys = sorted(set(keys))
+    rows = {}
+    for start in range(0, len(keys), DELETE_BATCH):
+        response = db.table(table).select(columns).in_(key_column, keys[start:start + DELETE_BATCH]).execute()
+        rows.update((row[key_column], row) for row in response.data)
+    return rows
+
+def is_referenced(doc_id: str) -> bool:
+    response = db.table('document_repositories').select('repo_id').contains('documents', [doc_id]).eq('is_deleted', False).limit(1).execute()
+    return bool(response.data)
+
+def dead_documents(rows: Iterable[Dict]) -> Set[str]:
+    """Documents that are deleted, or whose original repository is deleted and no live repository still lists them."""
+    rows = list(rows)
+    origins = fetch_rows('document_repositories', 'repo_id', [row['original_repo'] for row in rows if not row['is_deleted'] and row['original_repo']], 'repo_id, is_deleted')
+    return {
+        row['doc_id'] for row in rows
+        if row['is_deleted'] or (origins.get(row['original_repo'], {}).get('is_deleted') and not is_referenced(row['doc_id']))
+    }
+
+def storage_object(bucket: str, path: str) -> str:
+    return path[len(bucket) + 1:] if path.startswith(f"{bucket}/") else path
+
+def list_folder(bucket: str, folder: Optional[str]) -> List[Dict]:
+    entries = []
+    offset = 0
+    while True:
+        page = db.storage.from_(bucket).list(folder, {'limit': STORAGE_LIST_LIMIT, 'offset': offset})
+        entries.extend(page)
+        if len(page) < STORAGE_LIST_LIMIT:
+            return entries
+        offset += STORAGE_LIST_LIMIT
+
+def walk_bucket(bucket: str, folder: Optional[str] = None) -> Iterator[Tuple[str, List[Dict]]]:
+    """Yields each folder with its files; a folder is listed completely before anything in it is removed."""
+    entries = list_folder(bucket, folder)
+    files = [dict(entry, path=f"{folder}/{entry['name']}" if folder else entry['name']) for entry in entries if entry.get('id')]
+    if files:
+        yield folder, files
+    for entry in entries:
+        if not entry.get('id'):
+            yield from walk_bucket(bucket, f"{folder}/{entry['name']}" if folder else entry['name'])
+
+def object_age(entry: Dict) -> Optional[float]:
+    stamp = entry.get('updated_at') or entry.get('created_at')
+    if not stamp:
+        return None
+    created = datetime.fromisoformat(stamp.replace('Z', '+00:00'))
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - created).total_seconds()
+
+def object_owner(bucket: str, path: str) -> Optional[str]:
+    parts = path.split('/')
+    if len(parts) < 2:
+        return None
+    return parts[1].removesuffix('.pdf') if bucket == 'documents' else parts[1]
+
+def remove_objects(bucket: str, paths: List[str]) -> None:
+    for start in range(0, len(paths), STORAGE_REMOVE_BATCH):
+        db.storage.from_(bucket).remove(paths[start:start + STORAGE_REMOVE_BATCH])
+
+def orphaned_objects(bucket: str, files: List[Dict], grace_seconds: float) -> List[str]:
+    """Objects owned by a dead row, or not referenced by their row and older than the grace period (uploads in flight are kept)."""
+    table, key_column, path_column = STORAGE_OWNERS[bucket]
+    owners = {file['path']: object_owner(bucket, file['path']) for file in files}
+    columns = f"{key_column}, is_deleted, {path_column}" + (", original_repo" if table == 'documents' else '')
+    rows = fetch_rows(table, key_column, [owner for owner in owners.values() if owner], columns)
+    dead = dead_documents(rows.values()) if table == 'documents' else {key for key, row in rows.items() if row['is_deleted']}
+    orphans = []
+    for file in files:
+        owner = owners[file['path']]
+        if owner in dead:
+            orphans.append(file['path'])
+        elif owner not in rows or rows[owner][path_column] != f"{bucket}/{file['path']}":
+            age = object_age(file)
+            if age is not None and age > grace_seconds:
+                orphans.append(file['path'])
+    return orphans
+
+def vacuum(batch_size: int = VACUUM_BATCH_SIZE, dry_run: bool = False, grace_hours: float = ORPHAN_GRACE_HOURS) -> Dict[str, int]:
+    """Purge tombstoned documents and repositories: id arrays, chunk rows and storage objects.
+
+    Every table is scanned in keyset batches and each batch is checked against the rows it references,
+    so memory stays bounded by the batch size. Storage is then walked folder by folder and objects no
+    live row points to are removed, including replaced covers and banners and abandoned uploads.
+    """
+    report = Counter()
+    for users in scan_table('users', 'user_id', 'user_id, repositories', batch_size):
+        repositories = fetch_rows('document_repositories', 'repo_id', [repo_id for user in users for repo_id in user['repositories'] or []], 'repo_id, is_deleted')
+        for user in users:
+            for repo_id in user['repositories'] or []:
+                if repositories.get(repo_id, {'is_deleted': True})['is_deleted']:
+                    report['user_repositories'] += 1
+                    if not dry_run:
+                        remove_from_array('users', 'user_id', user['user_id'], 'repositories', repo_id)
+    for repositories in scan_table('document_repositories', 'repo_id', 'repo_id, is_deleted, documents, banner', batch_size):
+        live = [row for row in repositories if not row['is_deleted']]
+        documents = fetch_rows('documents', 'doc_id', [doc_id for row in live for doc_id in row['documents'] or []], 'doc_id, is_deleted')
+        for row in live:
+            for doc_id in row['documents'] or []:
+                if documents.get(doc_id, {'is_deleted': True})['is_deleted']:
+                    report['repository_documents'] += 1
+                    if not dry_run:
+                        remove_from_array('document_repositories', 'repo_id', row['repo_id'], 'documents', doc_id)
+        purged = [row['repo_id'] for row in repositories if row['is_deleted'] and row['banner']]
+        report['repositories'] += len(purged)
+        if not dry_run:
+            for start in range(0, len(purged), DELETE_BATCH):
+                db.table('document_repositories').update({'banner': None}).in_('repo_id', purged[start:start + DELETE_BATCH]).execute()
+    orphaned = set()
+    for chunks in scan_table('chunks', 'chunk_id', 'chunk_id, document_id', batch_size):
+        document_ids = {row['document_id'] for row in chunks} - orphaned
+        documents = fetch_rows('documents', 'doc_id', document_ids, 'doc_id, is_deleted, original_repo')
+        dead = sorted(dead_documents(documents.values()) | (document_ids - set(documents)))
+        orphaned.update(dead)
+        if dry_run:
+            report['chunks'] += sum(row['document_id'] in orphaned for row in chunks)
+            continue
+        for start in range(0, len(dead), DELETE_BATCH):
+            response = db.table('chunks').delete().in_('document_id', dead[start:start + DELETE_BATCH]).execute()
+            report['chunks'] += len(response.data)
+        for doc_id in dead:
+            forget_document_chunks(doc_id)
+    for documents in scan_table('documents', 'doc_id', 'doc_id, is_deleted, original_repo, file_path, cover', batch_size):
+        dead = dead_documents(documents)
+        purged = [row['doc_id'] for row in documents if row['doc_id'] in dead and (row['file_path'] or row['cover'] or not row['is_deleted'])]
+        report['documents'] += len(purged)
+        if not dry_run:
+            for start in range(0, len(purged), DELETE_BATCH):
+                db.table('documents').update({'is_deleted': True, 'file_path': '', 'cover': None}).in_('doc_id', purged[start:start + DELETE_BATCH]).execute()
+    for bucket in STORAGE_OWNERS:
+        for _, files in walk_bucket(bucket):
+            for start in range(0, len(files), DELETE_BATCH):
+                orphans = orphaned_objects(bucket, files[start:start + DELETE_BATCH], grace_hours * 3600)
+                report[f"storage_{bucket}"] += len(orphans)
+                if not dry_run:
+                    remove_objects(bucket, orphans)
+    return dict(report)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Purge deleted documents and repositories from id arrays, chunks and storage.")
+    parser.add_argument("--batch-size", type=int, default=VACUUM_BATCH_SIZE)
+    parser.add_argument("--grace-hours", type=float, default=ORPHAN_GRACE_HOURS, help="Keep unreferenced storage objects younger than this")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    report = vacuum(args.batch_size, args.dry_run, args.grace_hours)
+    print(f"Vacuum {'dry run' if args.dry_run else 'done'} : {report}")